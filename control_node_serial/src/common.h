@@ -54,7 +54,10 @@
 #endif
 
 
-#define PRINT_MEASURE(fmt, ...) PRINT_MSG("measures_debug: " fmt, __VA_ARGS__)
+/* Measures have their own output so they don't delay commands messages */
+#define MEASURES_OUT   (stdout)
+#define PRINT_MEASURE(fmt, ...) fprintf(MEASURES_OUT, "measures_debug: " fmt, \
+        __VA_ARGS__)
 
 
 #endif // COMMON_H
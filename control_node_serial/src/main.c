@@ -31,17 +31,22 @@
 #include "decode.h"
 #include "measures_handler.h"
 #include "sniffer_server.h"
+#include "measures_stream.h"
 
 #define TTY_PATH "/dev/ttyCN"
 
 
 static void usage(char *program_name)
 {
-    PRINT_ERROR("Usage: %s [-d] [-t tty_path] [-c oml_config_file]\n",
-            program_name);
-    PRINT_ERROR("  %c: debug mode, print measures\n", 'd');
+    PRINT_ERROR("Usage: %s [-d] [-t tty_path] [-c oml_config_file]"
+            " [-m measures_socket] [-s sniffer_port]\n", program_name);
+    PRINT_ERROR("  %c: debug mode, print measures on stdout\n", 'd');
     PRINT_ERROR("  %c: Set tty path. Default %s\n", 't', TTY_PATH);
     PRINT_ERROR("  %c: OML config file path.\n", 'c');
+    PRINT_ERROR("  %c: Unix datagram socket path for binary measures.\n",
+            'm');
+    PRINT_ERROR("  %c: Sniffer server port on localhost. Default %d on any "
+            "address\n", 's', SNIFFER_PORT);
 }
 
 int main(int argc, char *argv[])
@@ -54,10 +59,13 @@ int main(int argc, char *argv[])
     int print_measures = 0;
     char *tty_path = TTY_PATH;
     char *oml_config_file_path = NULL;
+    char *measures_socket_path = NULL;
+    uint16_t sniffer_port = SNIFFER_PORT;
+    int sniffer_local_only = 0;
     char c;
     opterr = 0;
 
-    while ((c = getopt(argc, argv, "dt:c:")) != (char)-1) {
+    while ((c = getopt(argc, argv, "dt:c:m:s:")) != (char)-1) {
         switch (c) {
             case 'd':
                 print_measures = 1;
@@ -68,8 +76,16 @@ int main(int argc, char *argv[])
             case 'c':
                 oml_config_file_path = optarg;
                 break;
+            case 'm':
+                measures_socket_path = optarg;
+                break;
+            case 's':
+                sniffer_port = atoi(optarg);
+                sniffer_local_only = 1;
+                break;
             case '?':
-                if (optopt == 't' || optopt == 'c')
+                if (optopt == 't' || optopt == 'c' ||
+                        optopt == 'm' || optopt == 's')
                     PRINT_ERROR("Option -%c requires an " \
                             "argument.\n", optopt);
                 else if (isprint(optopt))
@@ -92,14 +108,23 @@ int main(int argc, char *argv[])
         return -1;
     }
 
-    // measures and OML
+    // measures and OML, debug measures are line buffered
+    setvbuf(MEASURES_OUT, NULL, _IOLBF, 0);
     measures_handler_start(print_measures, oml_config_file_path);
     atexit(measures_handler_stop);
+    if (NULL != measures_socket_path) {
+        if (measures_stream_start(measures_socket_path)) {
+            PRINT_ERROR("Could not start measures stream %s\n",
+                    measures_socket_path);
+            return -1;
+        }
+        atexit(measures_stream_stop);
+    }
 
     // stdin parsing
     command_reader_start(serial_fd);
     // stdin parsing
-    sniffer_server_start();
+    sniffer_server_start(sniffer_port, sniffer_local_only);
 
     // serial reader
     do {
@@ -34,6 +34,7 @@
 #include "oml_measures.h"
 #include "measures_handler.h"
 #include "sniffer_server.h"
+#include "measures_stream.h"
 
 
 struct consumption_measure {
@@ -118,6 +119,8 @@ static void handle_oml_measure(uint8_t *data, size_t len, uint8_t *meas_buf,
         extract_data(meas_buf, &data_ptr, meas_size);
         handler(meas_buf, &timestamp);
     }
+    // One stream datagram per measures packet
+    measures_stream_flush();
 }
 
 static void radio_handler(uint8_t *buf, struct timeval *time)
@@ -126,6 +129,8 @@ static void radio_handler(uint8_t *buf, struct timeval *time)
     memcpy(&radio, buf, sizeof(radio));
     oml_measures_radio(time->tv_sec, time->tv_usec,
             radio.channel, radio.rssi);
+    measures_stream_radio(time->tv_sec, time->tv_usec,
+            radio.channel, radio.rssi);
 }
 
 
@@ -214,6 +219,7 @@ static void consumption_handler(uint8_t *buf, struct timeval *time)
     float c = (mh_state.consumption.c ? cons.val[i++] : NAN);
 
     oml_measures_consumption(time->tv_sec, time->tv_usec, p, v, c);
+    measures_stream_consumption(time->tv_sec, time->tv_usec, p, v, c);
 }
 
 static void config_consumption(int power_source, int p, int v, int c)
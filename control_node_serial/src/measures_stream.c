@@ -0,0 +1,160 @@
+/*******************************************************************************
+# This file is a part of IoT-LAB gateway_code
+# Copyright (C) 2015 INRIA (Contact: admin@iot-lab.info)
+# Contributor(s) : see AUTHORS file
+#
+# This software is governed by the CeCILL license under French law
+# and abiding by the rules of distribution of free software.  You can  use,
+# modify and/ or redistribute the software under the terms of the CeCILL
+# license as circulated by CEA, CNRS and INRIA at the following URL
+# http://www.cecill.info.
+#
+# As a counterpart to the access to the source code and  rights to copy,
+# modify and redistribute granted by the license, users are provided only
+# with a limited warranty  and the software's author,  the holder of the
+# economic rights,  and the successive licensors  have only  limited
+# liability.
+#
+# The fact that you are presently reading this means that you have had
+# knowledge of the CeCILL license and that you accept its terms.
+*******************************************************************************/
+
+#include <unistd.h>
+#include <string.h>
+#include <sys/socket.h>
+#include <sys/un.h>
+
+#include "measures_stream.h"
+#include "common.h"
+
+
+static struct {
+    int running;
+    int socket_fd;
+    uint32_t seq;
+    struct {
+        struct measures_stream_header header;
+        struct measures_stream_consumption records[
+            MEASURES_STREAM_MAX_RECORDS];
+    } consumption;
+    struct {
+        struct measures_stream_header header;
+        struct measures_stream_radio records[MEASURES_STREAM_MAX_RECORDS];
+    } radio;
+} stream_state;
+
+static void send_records(struct measures_stream_header *header,
+        size_t record_size);
+
+
+int measures_stream_start(const char *socket_path)
+{
+    struct sockaddr_un s_addr;
+    memset(&s_addr, 0, sizeof(s_addr));
+    memset(&stream_state, 0, sizeof(stream_state));
+    stream_state.socket_fd = -1;
+
+    if (strlen(socket_path) >= sizeof(s_addr.sun_path)) {
+        PRINT_ERROR("measures stream socket path too long\n");
+        return 1;
+    }
+    s_addr.sun_family = AF_UNIX;
+    strcpy(s_addr.sun_path, socket_path);
+
+    int s_fd = socket(AF_UNIX, SOCK_DGRAM, 0);
+    if (-1 == s_fd) {
+        PRINT_ERROR("cannot create measures stream socket\n");
+        return 1;
+    }
+    if (-1 == connect(s_fd, (struct sockaddr *)&s_addr, sizeof(s_addr))) {
+        PRINT_ERROR("measures stream connect failed: %s\n", socket_path);
+        close(s_fd);
+        return 1;
+    }
+
+    stream_state.consumption.header.type = MEASURES_STREAM_CONSUMPTION;
+    stream_state.radio.header.type = MEASURES_STREAM_RADIO;
+    stream_state.socket_fd = s_fd;
+    stream_state.running = 1;
+    return 0;
+}
+
+
+void measures_stream_stop()
+{
+    if (!stream_state.running)
+        return;
+    measures_stream_flush();
+    stream_state.running = 0;
+    close(stream_state.socket_fd);
+    stream_state.socket_fd = -1;
+}
+
+
+void measures_stream_consumption(uint32_t timestamp_s, uint32_t timestamp_us,
+        float power, float voltage, float current)
+{
+    if (!stream_state.running)
+        return;
+
+    struct measures_stream_header *header = &stream_state.consumption.header;
+    struct measures_stream_consumption *record =
+        &stream_state.consumption.records[header->count++];
+
+    record->timestamp_s  = timestamp_s;
+    record->timestamp_us = timestamp_us;
+    record->power        = power;
+    record->voltage      = voltage;
+    record->current      = current;
+
+    if (header->count == MEASURES_STREAM_MAX_RECORDS)
+        send_records(header, sizeof(*record));
+}
+
+
+void measures_stream_radio(uint32_t timestamp_s, uint32_t timestamp_us,
+        uint32_t channel, int32_t rssi)
+{
+    if (!stream_state.running)
+        return;
+
+    struct measures_stream_header *header = &stream_state.radio.header;
+    struct measures_stream_radio *record =
+        &stream_state.radio.records[header->count++];
+
+    record->timestamp_s  = timestamp_s;
+    record->timestamp_us = timestamp_us;
+    record->channel      = channel;
+    record->rssi         = rssi;
+
+    if (header->count == MEASURES_STREAM_MAX_RECORDS)
+        send_records(header, sizeof(*record));
+}
+
+
+void measures_stream_flush()
+{
+    if (!stream_state.running)
+        return;
+    send_records(&stream_state.consumption.header,
+            sizeof(struct measures_stream_consumption));
+    send_records(&stream_state.radio.header,
+            sizeof(struct measures_stream_radio));
+}
+
+
+/*
+ * Send header and its following records, never block the serial reader.
+ * If the receiver is too slow or not there, records are dropped.
+ */
+static void send_records(struct measures_stream_header *header,
+        size_t record_size)
+{
+    if (0 == header->count)
+        return;
+
+    size_t len = sizeof(*header) + header->count * record_size;
+    header->seq = stream_state.seq++;
+    send(stream_state.socket_fd, header, len, MSG_DONTWAIT | MSG_NOSIGNAL);
+    header->count = 0;
+}
@@ -0,0 +1,78 @@
+/*******************************************************************************
+# This file is a part of IoT-LAB gateway_code
+# Copyright (C) 2015 INRIA (Contact: admin@iot-lab.info)
+# Contributor(s) : see AUTHORS file
+#
+# This software is governed by the CeCILL license under French law
+# and abiding by the rules of distribution of free software.  You can  use,
+# modify and/ or redistribute the software under the terms of the CeCILL
+# license as circulated by CEA, CNRS and INRIA at the following URL
+# http://www.cecill.info.
+#
+# As a counterpart to the access to the source code and  rights to copy,
+# modify and redistribute granted by the license, users are provided only
+# with a limited warranty  and the software's author,  the holder of the
+# economic rights,  and the successive licensors  have only  limited
+# liability.
+#
+# The fact that you are presently reading this means that you have had
+# knowledge of the CeCILL license and that you accept its terms.
+*******************************************************************************/
+
+#ifndef MEASURES_STREAM_H
+#define MEASURES_STREAM_H
+
+#include <stdint.h>
+#include <stddef.h>
+
+/*
+ * Binary measures stream
+ *
+ * Measures are sent as datagrams on a unix socket, one datagram for each
+ * measures packet received from the control node.
+ * Datagrams are a header followed by 'count' fixed size records of 'type'.
+ * Values are in host byte order.
+ *
+ * A datagram is dropped if the receiver does not read them fast enough,
+ * 'seq' is incremented for each datagram to detect it.
+ */
+
+enum measures_stream_type {
+    MEASURES_STREAM_CONSUMPTION = 1,
+    MEASURES_STREAM_RADIO       = 2,
+};
+
+struct measures_stream_header {
+    uint16_t type;
+    uint16_t count;
+    uint32_t seq;
+};
+
+struct measures_stream_consumption {
+    uint32_t timestamp_s;
+    uint32_t timestamp_us;
+    float power;
+    float voltage;
+    float current;
+};
+
+struct measures_stream_radio {
+    uint32_t timestamp_s;
+    uint32_t timestamp_us;
+    uint32_t channel;
+    int32_t rssi;
+};
+
+/* One measures packet has at most 255 measures */
+#define MEASURES_STREAM_MAX_RECORDS 255
+
+int measures_stream_start(const char *socket_path);
+void measures_stream_stop(void);
+
+void measures_stream_consumption(uint32_t timestamp_s, uint32_t timestamp_us,
+                                 float power, float voltage, float current);
+void measures_stream_radio(uint32_t timestamp_s, uint32_t timestamp_us,
+                           uint32_t channel, int32_t rssi);
+void measures_stream_flush(void);
+
+#endif // MEASURES_STREAM_H
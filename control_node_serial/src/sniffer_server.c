@@ -30,9 +30,6 @@
 #include "common.h"
 
 
-#define SNIFFER_PORT 30000
-
-
 static struct {
     pthread_t thread;
     volatile int running;
@@ -42,12 +39,12 @@ static struct {
 } sniffer_state = {0, 0, -1, 0, -1};
 
 static void *sniffer_thread(void *attr);
-static int create_server_socket(void);
+static int create_server_socket(uint16_t port, int local_only);
 
 
-int sniffer_server_start()
+int sniffer_server_start(uint16_t port, int local_only)
 {
-    int socket_fd = create_server_socket();
+    int socket_fd = create_server_socket(port, local_only);
     if (-1 == socket_fd)
         return 1;
     sniffer_state.socket_fd = socket_fd;
@@ -68,7 +65,7 @@ void sniffer_server_stop()
 }
 
 
-static int create_server_socket()
+static int create_server_socket(uint16_t port, int local_only)
 {
     struct sockaddr_in s_addr;
     memset(&s_addr, 0, sizeof(s_addr));
@@ -88,8 +85,8 @@ static int create_server_socket()
     }
 
     s_addr.sin_family      = AF_INET;
-    s_addr.sin_port        = htons(SNIFFER_PORT);
-    s_addr.sin_addr.s_addr = htonl(INADDR_ANY);
+    s_addr.sin_port        = htons(port);
+    s_addr.sin_addr.s_addr = htonl(local_only ? INADDR_LOOPBACK : INADDR_ANY);
 
     if (-1 == bind(s_fd, (struct sockaddr *)&s_addr, sizeof(s_addr))) {
         PRINT_ERROR("error bind failed\n");
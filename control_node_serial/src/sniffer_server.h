@@ -25,7 +25,13 @@
 #include <stdint.h>
 #include <stddef.h>
 
-int sniffer_server_start(void);
+#define SNIFFER_PORT 30000
+
+/*
+ * Start the sniffer TCP server on `port`
+ * If `local_only`, listen on the loopback address only, for a local relay
+ */
+int sniffer_server_start(uint16_t port, int local_only);
 void sniffer_server_stop(void);
 size_t sniffer_server_send_packet(const uint8_t *data, size_t len);
 
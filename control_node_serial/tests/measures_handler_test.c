@@ -96,6 +96,27 @@ size_t sniffer_server_send_packet(const uint8_t *data, size_t len)
         return len;
 }
 
+void measures_stream_consumption(uint32_t timestamp_s, uint32_t timestamp_us,
+                float power, float voltage, float current)
+{
+        (void)timestamp_s;
+        (void)timestamp_us;
+        (void)power;
+        (void)voltage;
+        (void)current;
+}
+void measures_stream_radio(uint32_t timestamp_s, uint32_t timestamp_us,
+                uint32_t channel, int32_t rssi)
+{
+        (void)timestamp_s;
+        (void)timestamp_us;
+        (void)channel;
+        (void)rssi;
+}
+void measures_stream_flush()
+{
+}
+
 TEST(handle_measure_pkt, test_different_packets)
 {
         unsigned char data[64] = {0};
@@ -0,0 +1,140 @@
+/*******************************************************************************
+# This file is a part of IoT-LAB gateway_code
+# Copyright (C) 2015 INRIA (Contact: admin@iot-lab.info)
+# Contributor(s) : see AUTHORS file
+#
+# This software is governed by the CeCILL license under French law
+# and abiding by the rules of distribution of free software.  You can  use,
+# modify and/ or redistribute the software under the terms of the CeCILL
+# license as circulated by CEA, CNRS and INRIA at the following URL
+# http://www.cecill.info.
+#
+# As a counterpart to the access to the source code and  rights to copy,
+# modify and redistribute granted by the license, users are provided only
+# with a limited warranty  and the software's author,  the holder of the
+# economic rights,  and the successive licensors  have only  limited
+# liability.
+#
+# The fact that you are presently reading this means that you have had
+# knowledge of the CeCILL license and that you accept its terms.
+*******************************************************************************/
+
+#include <gtest/gtest.h>
+
+#include "mock_fprintf.h"  // include before other includes
+
+#include <sys/socket.h>
+#include <sys/un.h>
+#include <math.h>
+
+#include "measures_stream.c"
+
+#define SOCKET_PATH "/tmp/measures_stream_test.sock"
+
+
+static int bind_socket(const char *path)
+{
+    struct sockaddr_un s_addr;
+    memset(&s_addr, 0, sizeof(s_addr));
+    s_addr.sun_family = AF_UNIX;
+    strcpy(s_addr.sun_path, path);
+
+    unlink(path);
+    int s_fd = socket(AF_UNIX, SOCK_DGRAM, 0);
+    bind(s_fd, (struct sockaddr *)&s_addr, sizeof(s_addr));
+    return s_fd;
+}
+
+
+TEST(measures_stream, not_started)
+{
+    measures_stream_consumption(1, 2, 1.0, 2.0, 3.0);
+    measures_stream_radio(1, 2, 11, -91);
+    measures_stream_flush();
+    measures_stream_stop();
+    ASSERT_EQ(0, stream_state.running);
+}
+
+
+TEST(measures_stream, start_errors)
+{
+    ASSERT_NE(0, measures_stream_start("/tmp/no_measures_stream.sock"));
+    ASSERT_EQ(0, stream_state.running);
+
+    char long_path[256];
+    memset(long_path, 'a', sizeof(long_path));
+    long_path[sizeof(long_path) - 1] = '\0';
+    ASSERT_NE(0, measures_stream_start(long_path));
+}
+
+
+TEST(measures_stream, send_measures)
+{
+    uint8_t buf[8192];
+    struct measures_stream_header header;
+    struct measures_stream_consumption cons[2];
+    struct measures_stream_radio radio;
+    ssize_t len;
+
+    int s_fd = bind_socket(SOCKET_PATH);
+    ASSERT_EQ(0, measures_stream_start(SOCKET_PATH));
+
+    measures_stream_consumption(10, 1, 1.0, 2.0, NAN);
+    measures_stream_consumption(10, 2, 4.0, 5.0, NAN);
+    measures_stream_radio(11, 3, 26, -91);
+    measures_stream_flush();
+
+    // consumption datagram
+    len = recv(s_fd, buf, sizeof(buf), MSG_DONTWAIT);
+    ASSERT_EQ((ssize_t)(sizeof(header) + sizeof(cons)), len);
+    memcpy(&header, buf, sizeof(header));
+    memcpy(cons, &buf[sizeof(header)], sizeof(cons));
+    ASSERT_EQ(MEASURES_STREAM_CONSUMPTION, header.type);
+    ASSERT_EQ(2, header.count);
+    ASSERT_EQ((uint32_t)0, header.seq);
+    ASSERT_EQ((uint32_t)10, cons[1].timestamp_s);
+    ASSERT_EQ((uint32_t)2, cons[1].timestamp_us);
+    ASSERT_EQ(4.0, cons[1].power);
+    ASSERT_EQ(5.0, cons[1].voltage);
+    ASSERT_TRUE(isnan(cons[1].current));
+
+    // radio datagram
+    len = recv(s_fd, buf, sizeof(buf), MSG_DONTWAIT);
+    ASSERT_EQ((ssize_t)(sizeof(header) + sizeof(radio)), len);
+    memcpy(&header, buf, sizeof(header));
+    memcpy(&radio, &buf[sizeof(header)], sizeof(radio));
+    ASSERT_EQ(MEASURES_STREAM_RADIO, header.type);
+    ASSERT_EQ(1, header.count);
+    ASSERT_EQ((uint32_t)1, header.seq);
+    ASSERT_EQ((uint32_t)26, radio.channel);
+    ASSERT_EQ(-91, radio.rssi);
+
+    // Nothing to send
+    measures_stream_flush();
+    ASSERT_EQ(-1, recv(s_fd, buf, sizeof(buf), MSG_DONTWAIT));
+
+    // Full buffer sent without flush
+    for (int i = 0; i < MEASURES_STREAM_MAX_RECORDS; i++)
+        measures_stream_radio(12, i, 11, -80);
+    len = recv(s_fd, buf, sizeof(buf), MSG_DONTWAIT);
+    ASSERT_EQ((ssize_t)(sizeof(header) +
+                MEASURES_STREAM_MAX_RECORDS * sizeof(radio)), len);
+
+    measures_stream_stop();
+    ASSERT_EQ(0, stream_state.running);
+    close(s_fd);
+    unlink(SOCKET_PATH);
+}
+
+
+TEST(measures_stream, receiver_gone)
+{
+    int s_fd = bind_socket(SOCKET_PATH);
+    ASSERT_EQ(0, measures_stream_start(SOCKET_PATH));
+    close(s_fd);
+    unlink(SOCKET_PATH);
+
+    // Does not fail
+    measures_stream_consumption(10, 1, 1.0, 2.0, 3.0);
+    measures_stream_stop();
+}
@@ -0,0 +1,150 @@
+# -*- coding: utf-8 -*-
+
+# This file is a part of IoT-LAB gateway_code
+# Copyright (C) 2015 INRIA (Contact: admin@iot-lab.info)
+# Contributor(s) : see AUTHORS file
+#
+# This software is governed by the CeCILL license under French law
+# and abiding by the rules of distribution of free software.  You can  use,
+# modify and/ or redistribute the software under the terms of the CeCILL
+# license as circulated by CEA, CNRS and INRIA at the following URL
+# http://www.cecill.info.
+#
+# As a counterpart to the access to the source code and  rights to copy,
+# modify and redistribute granted by the license, users are provided only
+# with a limited warranty  and the software's author,  the holder of the
+# economic rights,  and the successive licensors  have only  limited
+# liability.
+#
+# The fact that you are presently reading this means that you have had
+# knowledge of the CeCILL license and that you accept its terms.
+
+""" Fake hardware tools used by the lifecycle benchmark
+
+Run as ``fake_tool.py <tool> [args...]``. The simulation creates wrappers
+named after the real tools so they are found in PATH.
+
+* control_node_serial_interface: acknowledges every command, 'stop' and
+  'start' commands remove and re-create the open node tty like udev
+* socat: runs until terminated
+* other tools: exit successfully after their latency
+
+Latencies are read from the environment, as 'tool=seconds,...' in
+IOTLAB_BENCH_LATENCY, 'udev' is the delay to re-create the open node tty.
+The open node tty is given as 'link:target' in IOTLAB_BENCH_ON_TTY.
+"""
+
+from __future__ import print_function
+
+import os
+import sys
+import time
+import threading
+
+LATENCY_ENV = 'IOTLAB_BENCH_LATENCY'
+ON_TTY_ENV = 'IOTLAB_BENCH_ON_TTY'
+
+FTDI_DEVICES = 'ftdi-devices-list\n\nFound 1 device(s)\n'
+
+
+def latency(tool, environ=None):
+    """ Configured latency for `tool` in seconds
+
+    >>> env = {LATENCY_ENV: 'openocd=0.5,udev=1'}
+    >>> latency('openocd', env), latency('udev', env), latency('edbg', env)
+    (0.5, 1.0, 0.0)
+    """
+    environ = os.environ if environ is None else environ
+    for item in environ.get(LATENCY_ENV, '').split(','):
+        name, _, value = item.partition('=')
+        if name == tool:
+            return float(value)
+    return 0.0
+
+
+def format_latency(latencies):
+    """ Format `latencies` dict for LATENCY_ENV
+
+    >>> format_latency({'openocd': 0.5})
+    'openocd=0.5'
+    """
+    return ','.join('%s=%s' % item for item in sorted(latencies.items()))
+
+
+class OpenNodeTty(object):  # pylint:disable=too-few-public-methods
+    """ Open node tty symlink, removed when the node is powered off """
+
+    def __init__(self, value):
+        self.link, _, self.target = value.partition(':')
+
+    def power(self, command):
+        """ Update tty for 'start' or 'stop' power `command` """
+        if not self.link:
+            return
+        if command == 'stop':
+            self._remove()
+        elif not os.path.lexists(self.link):
+            timer = threading.Timer(latency('udev'), self._create)
+            timer.daemon = True
+            timer.start()
+
+    def _remove(self):
+        try:
+            os.unlink(self.link)
+        except OSError:
+            pass
+
+    def _create(self):
+        try:
+            os.symlink(self.target, self.link)
+        except OSError:
+            pass
+
+
+def control_node_serial_interface():
+    """ Answer 'ACK' to control node commands read on stdin """
+    on_tty = OpenNodeTty(os.environ.get(ON_TTY_ENV, ''))
+    print('cn_serial_ready', file=sys.stderr)
+    sys.stderr.flush()
+    for line in iter(sys.stdin.readline, ''):
+        args = line.split()
+        if not args:
+            continue
+        time.sleep(latency('control_node'))
+        if args[0] in ('start', 'stop'):
+            on_tty.power(args[0])
+        print('%s ACK' % args[0], file=sys.stderr)
+        sys.stderr.flush()
+    return 0
+
+
+def socat():
+    """ Serial redirection, runs until killed """
+    while True:
+        time.sleep(3600)
+
+
+def ftdi_devices_list():
+    """ Report one device """
+    sys.stdout.write(FTDI_DEVICES)
+    return 0
+
+
+TOOLS = {
+    'control_node_serial_interface': control_node_serial_interface,
+    'socat': socat,
+    'ftdi-devices-list': ftdi_devices_list,
+}
+
+
+def main(args):
+    """ Run fake tool args[1] """
+    tool = args[1]
+    time.sleep(latency(tool))
+    if tool in TOOLS:
+        return TOOLS[tool]()
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv))
@@ -0,0 +1,137 @@
+# -*- coding: utf-8 -*-
+
+# This file is a part of IoT-LAB gateway_code
+# Copyright (C) 2015 INRIA (Contact: admin@iot-lab.info)
+# Contributor(s) : see AUTHORS file
+#
+# This software is governed by the CeCILL license under French law
+# and abiding by the rules of distribution of free software.  You can  use,
+# modify and/ or redistribute the software under the terms of the CeCILL
+# license as circulated by CEA, CNRS and INRIA at the following URL
+# http://www.cecill.info.
+#
+# As a counterpart to the access to the source code and  rights to copy,
+# modify and redistribute granted by the license, users are provided only
+# with a limited warranty  and the software's author,  the holder of the
+# economic rights,  and the successive licensors  have only  limited
+# liability.
+#
+# The fact that you are presently reading this means that you have had
+# knowledge of the CeCILL license and that you accept its terms.
+
+
+""" Import time benchmark of gateway code modules and node classes lookup
+
+Each sample runs in a new python interpreter, like a CLI script call:
+modules import and `nodes.open_node_class` lookup durations percentiles
+are reported::
+
+    python -m gateway_code.benchmark.imports --iterations 10 \\
+        --budget 300 m3 samr21
+
+With a budget, in milliseconds, exits with an error when a median duration
+exceeds it.
+"""
+
+from __future__ import print_function
+
+import os
+import sys
+import argparse
+import subprocess
+import collections
+
+from gateway_code.benchmark.lifecycle import percentile, report
+
+# Modules imported by CLI scripts
+MODULES = ('gateway_code.nodes', 'gateway_code.utils.cli.programmer',
+           'gateway_code.utils.cli.serial_redirection')
+ITERATIONS = 5
+LOOKUP = 'open_node_class'
+
+SAMPLE_CODE = '''
+import sys, time, importlib
+t_0 = time.time()
+importlib.import_module(sys.argv[1])
+t_1 = time.time()
+if len(sys.argv) > 2:
+    import gateway_code.nodes
+    gateway_code.nodes.open_node_class(sys.argv[2])
+print('%f %f' % (t_1 - t_0, time.time() - t_1))
+'''
+PKG_ROOT = os.path.dirname(os.path.dirname(os.path.dirname(
+    os.path.abspath(__file__))))
+
+
+def sample(module, board_type=None):
+    """ Return (module import, board class lookup) durations in a new
+    interpreter """
+    args = [sys.executable, '-c', SAMPLE_CODE, module]
+    if board_type is not None:
+        args.append(board_type)
+    env = dict(os.environ, PYTHONPATH=os.pathsep.join(
+        [PKG_ROOT, os.environ.get('PYTHONPATH', '')]))
+    output = subprocess.check_output(args, env=env)
+    import_s, lookup_s = output.split()
+    return float(import_s), float(lookup_s)
+
+
+def run(boards, iterations=ITERATIONS, modules=MODULES):
+    """ Run benchmark on `boards`
+
+    :returns: {board: {name: durations}} for `lifecycle.report` """
+    results = collections.OrderedDict()
+    for board_type in boards:
+        samples = results[board_type] = collections.OrderedDict()
+        for _ in range(iterations):
+            for module in modules:
+                import_s, lookup_s = sample(module, board_type)
+                name = module.rpartition('.')[2]
+                samples.setdefault('import %s' % name, []).append(import_s)
+                samples.setdefault('%s: %s' % (name, LOOKUP),
+                                   []).append(lookup_s)
+    return results
+
+
+def over_budget(results, budget):
+    """ Return names of samples with a median over `budget` seconds
+
+    >>> over_budget({'m3': {'import a': [0.1, 0.3, 0.2]}}, 0.1)
+    ['m3: import a']
+    >>> over_budget({'m3': {'import a': [0.1, 0.3, 0.2]}}, 0.2)
+    []
+    """
+    return ['%s: %s' % (board_type, name)
+            for board_type, samples in sorted(results.items())
+            for name, values in sorted(samples.items())
+            if percentile(values, 50) > budget]
+
+
+PARSER = argparse.ArgumentParser(
+    description='Gateway code import time benchmark')
+PARSER.add_argument('boards', nargs='*', metavar='board', default=['m3'],
+                    help='Open nodes types to lookup, default %(default)s')
+PARSER.add_argument('-n', '--iterations', type=int, default=ITERATIONS,
+                    help='Samples per module, default %(default)s')
+PARSER.add_argument('-m', '--module', dest='modules', action='append',
+                    help='Module to import, default %s' % ', '.join(MODULES))
+PARSER.add_argument('-b', '--budget', type=float,
+                    help='Maximum median duration in milliseconds')
+
+
+def main(args=None):
+    """ Run import benchmark """
+    opts = PARSER.parse_args(args)
+    results = run(opts.boards, opts.iterations, opts.modules or MODULES)
+    report(results)
+    if opts.budget is None:
+        return 0
+    over = over_budget(results, opts.budget / 1000.0)
+    for name in over:
+        print('Over %.1fms budget: %s' % (opts.budget, name),
+              file=sys.stderr)
+    return 1 if over else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
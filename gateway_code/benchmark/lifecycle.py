@@ -0,0 +1,366 @@
+# -*- coding: utf-8 -*-
+
+# This file is a part of IoT-LAB gateway_code
+# Copyright (C) 2015 INRIA (Contact: admin@iot-lab.info)
+# Contributor(s) : see AUTHORS file
+#
+# This software is governed by the CeCILL license under French law
+# and abiding by the rules of distribution of free software.  You can  use,
+# modify and/ or redistribute the software under the terms of the CeCILL
+# license as circulated by CEA, CNRS and INRIA at the following URL
+# http://www.cecill.info.
+#
+# As a counterpart to the access to the source code and  rights to copy,
+# modify and redistribute granted by the license, users are provided only
+# with a limited warranty  and the software's author,  the holder of the
+# economic rights,  and the successive licensors  have only  limited
+# liability.
+#
+# The fact that you are presently reading this means that you have had
+# knowledge of the CeCILL license and that you accept its terms.
+
+
+""" Experiment lifecycle benchmark with simulated hardware
+
+Run the experiment operations of GatewayManager on open node classes of
+nodes.REGISTRY with the hardware tools replaced by `fake_tool`:
+
+* control_node_serial_interface acknowledges commands and removes the open
+  node tty when it is powered off
+* openocd, avrdude, edbg, cc2538-bsl.py return after their latency
+* ttys are pseudo terminals linked in a temporary directory
+
+Each operation and experiment phase duration percentiles are reported::
+
+    python -m gateway_code.benchmark.lifecycle --iterations 10 \\
+        --latency openocd=0.5 --latency udev=0.3 m3 samr21
+"""
+
+from __future__ import print_function
+
+import os
+import sys
+import time
+import shutil
+import argparse
+import tempfile
+import collections
+
+from gateway_code import config
+from gateway_code import nodes
+from gateway_code import gateway_logging
+from gateway_code.gateway_manager import GatewayManager
+from gateway_code.utils.cc2538 import CC2538
+from gateway_code.utils.edbg import Edbg
+from gateway_code.benchmark import fake_tool
+
+FAKE_TOOL = os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                         'fake_tool.py')
+TOOLS = ('control_node_serial_interface', 'openocd', 'avrdude', 'edbg',
+         'cc2538-bsl.py', 'socat', 'ftdi-devices-list')
+CONTROL_NODE_TYPE = 'iotlab'
+
+USER = 'benchmark'
+EXP_ID = 1
+ITERATIONS = 5
+PERCENTILES = (50, 90, 99)
+
+
+class BenchmarkError(Exception):
+    """ Operation failed on a simulated board """
+    pass
+
+
+def simulated(board_type):
+    """ Boards that can run with simulated tools
+
+    They are flashed with a firmware using an openocd, avrdude, edbg or
+    cc2538 programmer
+
+    >>> simulated('m3'), simulated('a8')
+    (True, False)
+    """
+    return getattr(nodes.REGISTRY[board_type], 'FW_IDLE', None) is not None
+
+
+class _Patcher(object):
+    """ Set attributes and restore them in reverse order """
+
+    def __init__(self):
+        self._saved = []
+
+    def set(self, obj, name, value):
+        """ Set `obj` attribute `name` to `value` """
+        saved = vars(obj).get(name, _Patcher)  # _Patcher marks a missing one
+        self._saved.append((obj, name, saved))
+        setattr(obj, name, value)
+
+    def restore(self):
+        """ Restore all attributes """
+        while self._saved:
+            obj, name, saved = self._saved.pop()
+            if saved is _Patcher:
+                delattr(obj, name)
+            else:
+                setattr(obj, name, saved)
+
+
+class Simulation(object):
+    """ Simulated gateway hardware for `board_type` open node
+
+    Used as a context manager, it patches the configuration, the nodes
+    classes and the environment to use the fake tools.
+
+    :param latency: dict of tools latencies in seconds
+    """
+
+    def __init__(self, board_type, latency=None):
+        self.board_class = nodes.REGISTRY[board_type]
+        self.cn_class = nodes.REGISTRY[CONTROL_NODE_TYPE]
+        self.latency = latency or {}
+        self.root = None
+        self._patcher = _Patcher()
+        self._environ = None
+        self._ptys = []
+
+    def path(self, *parts):
+        """ Path in simulation directory """
+        return os.path.join(self.root, *parts)
+
+    def __enter__(self):
+        self.root = tempfile.mkdtemp(prefix='iotlab_benchmark_')
+        try:
+            for directory in ('bin', 'dev', 'config', 'users', 'log'):
+                os.mkdir(self.path(directory))
+            self._tools()
+            self._config()
+            self._nodes()
+        except BaseException:
+            self.__exit__(*sys.exc_info())
+            raise
+        return self
+
+    def __exit__(self, *exc):
+        self._patcher.restore()
+        if self._environ is not None:
+            os.environ.clear()
+            os.environ.update(self._environ)
+            self._environ = None
+        for master in self._ptys:
+            os.close(master)
+        self._ptys = []
+        shutil.rmtree(self.root, ignore_errors=True)
+
+    def _tools(self):
+        """ Create tools wrappers first in PATH """
+        for tool in TOOLS:
+            wrapper = self.path('bin', tool)
+            with open(wrapper, 'w') as script:
+                script.write('#!/bin/sh\nexec "%s" "%s" %s "$@"\n' % (
+                    sys.executable, FAKE_TOOL, tool))
+            os.chmod(wrapper, 0o755)
+
+        self._environ = dict(os.environ)
+        os.environ['PATH'] = os.pathsep.join(
+            [self.path('bin'), os.environ.get('PATH', os.defpath)])
+        os.environ[fake_tool.LATENCY_ENV] = fake_tool.format_latency(
+            self.latency)
+
+        self._patcher.set(Edbg, 'EDBG', 'edbg {cmd}')
+        self._patcher.set(CC2538, 'CC2538BSL', 'cc2538-bsl.py -p {port} {cmd}')
+
+    def _config(self):
+        """ Gateway configuration files and user experiment directory """
+        board_cfg = {
+            'board_type': self.board_class.TYPE,
+            'control_node_type': self.cn_class.TYPE,
+            'hostname': '%s-1' % self.board_class.TYPE,
+        }
+        for key, value in board_cfg.items():
+            with open(self.path('config', key), 'w') as cfg:
+                cfg.write(value + '\n')
+        self._patcher.set(config, 'GATEWAY_CONFIG_PATH', self.path('config'))
+        self._patcher.set(config, 'EXP_FILES_DIR', os.path.join(
+            self.path('users'), '{user}/.iot-lab/{exp_id}/'))
+
+    def _nodes(self):
+        """ Nodes ttys and programmers paths """
+        for node_class in (self.board_class, self.cn_class):
+            for attr in ('TTY', 'TTY_PROG'):
+                if getattr(node_class, attr, None) is not None:
+                    tty = self._tty(getattr(node_class, attr))
+                    self._patcher.set(node_class, attr, tty)
+            if hasattr(node_class, 'OPENOCD_PATH'):
+                self._patcher.set(node_class, 'OPENOCD_PATH', 'openocd')
+
+        # Control node removes the open node tty when powering it off
+        on_tty = self.board_class.TTY
+        os.environ[fake_tool.ON_TTY_ENV] = '%s:%s' % (on_tty,
+                                                      os.readlink(on_tty))
+
+    def _tty(self, device):
+        """ Create a pseudo terminal linked as `device` in simulation """
+        master, slave = os.openpty()
+        self._ptys.append(master)
+        target = os.ttyname(slave)
+        os.close(slave)
+        link = self.path('dev', os.path.basename(device))
+        os.symlink(target, link)
+        return link
+
+
+class _PhaseTimer(object):  # pylint:disable=too-few-public-methods
+    """ Record sequential phases durations from GatewayManager phases """
+
+    def __init__(self):
+        self.timings = collections.OrderedDict()
+        self._current = None
+        self._start = None
+
+    def __call__(self, phase):
+        now = time.time()
+        if self._current is not None:
+            self.timings[self._current] = now - self._start
+        self._current, self._start = phase, now
+
+
+def _measure(samples, name, func, *args):
+    """ Run func(*args), save its duration in samples[name] """
+    start = time.time()
+    ret = func(*args)
+    samples[name].append(time.time() - start)
+    if ret != 0:
+        raise BenchmarkError('%s failed: %r' % (name, ret))
+
+
+def run_board(board_type, iterations=ITERATIONS, latency=None):
+    """ Run experiments lifecycle `iterations` times on `board_type`
+
+    :returns: dict of durations lists for operations and their phases as
+        'operation/phase' """
+    samples = collections.OrderedDict()
+    with Simulation(board_type, latency) as sim:
+        g_m = GatewayManager(sim.path('log'))
+        g_m._create_user_exp_folders(USER, EXP_ID)  # pylint:disable=W0212
+        firmware = g_m.open_node.FW_IDLE
+        for name in ('exp_start', 'exp_update_profile', 'node_flash',
+                     'exp_stop'):
+            samples[name] = []
+
+        samples = collections.defaultdict(list, samples)
+        for _ in range(iterations):
+            try:
+                _measure(samples, 'exp_start', g_m.exp_start, USER, EXP_ID,
+                         firmware)
+            finally:
+                _add_phases(samples, 'exp_start', g_m.phase_timings)
+            _measure(samples, 'exp_update_profile', g_m.exp_update_profile,
+                     None)
+            _measure(samples, 'node_flash', g_m.node_flash, 'open', firmware)
+
+            timer = _PhaseTimer()
+            g_m.phase_listeners.append(timer)
+            try:
+                _measure(samples, 'exp_stop', g_m.exp_stop)
+            finally:
+                g_m.phase_listeners.remove(timer)
+                _add_phases(samples, 'exp_stop', timer.timings)
+    return samples
+
+
+def _add_phases(samples, operation, timings):
+    """ Add operation phases `timings` to samples """
+    for phase, duration in timings.items():
+        samples['%s/%s' % (operation, phase)].append(duration)
+
+
+def percentile(values, pct):
+    """ Nearest-rank percentile
+
+    >>> percentile([3, 1, 2, 4], 50), percentile([3, 1, 2, 4], 99)
+    (2, 4)
+    >>> percentile([], 50)
+    """
+    if not values:
+        return None
+    values = sorted(values)
+    rank = int(-(-len(values) * pct // 100))  # ceil
+    return values[max(rank, 1) - 1]
+
+
+def run(boards, iterations=ITERATIONS, latency=None):
+    """ Run benchmark on `boards`
+
+    :returns: dict of `run_board` result or error message for each board """
+    results = collections.OrderedDict()
+    for board_type in boards:
+        if not simulated(board_type):
+            results[board_type] = 'not simulated: no firmware to flash'
+            continue
+        try:
+            results[board_type] = run_board(board_type, iterations, latency)
+        except Exception as err:  # pylint:disable=broad-except
+            results[board_type] = 'error: %s' % err
+    return results
+
+
+def report(results, out=sys.stdout):
+    """ Write results percentiles in milliseconds """
+    header = ['board', 'operation'] + ['p%d' % pct for pct in PERCENTILES]
+    out.write('%-14s %-48s' % tuple(header[:2]))
+    out.write(''.join('%10s' % col for col in header[2:]) + '\n')
+    for board_type, samples in results.items():
+        if not isinstance(samples, dict):
+            out.write('%-14s %s\n' % (board_type, samples))
+            continue
+        for name, values in samples.items():
+            out.write('%-14s %-48s' % (board_type, name))
+            for pct in PERCENTILES:
+                value = percentile(values, pct)
+                out.write('%10s' % ('-' if value is None else
+                                    '%.1f' % (1000 * value)))
+            out.write('\n')
+
+
+def _latency(value):
+    """ Parse 'tool=seconds'
+
+    >>> _latency('openocd=0.5')
+    ('openocd', 0.5)
+    """
+    tool, _, seconds = value.partition('=')
+    try:
+        return tool, float(seconds)
+    except ValueError:
+        raise argparse.ArgumentTypeError('Invalid latency %r' % value)
+
+
+PARSER = argparse.ArgumentParser(
+    description='Experiment lifecycle benchmark with simulated hardware')
+PARSER.add_argument('boards', nargs='*', metavar='board',
+                    help='Open nodes types, all by default')
+PARSER.add_argument('-n', '--iterations', type=int, default=ITERATIONS,
+                    help='Experiments per board, default %(default)s')
+PARSER.add_argument('-l', '--latency', type=_latency, action='append',
+                    default=[],
+                    help="Tool latency as 'tool=seconds', tools: %s, "
+                         "'control_node' for each command, 'udev' for the "
+                         "open node tty" % ', '.join(TOOLS))
+
+
+def main(args=None):
+    """ Run lifecycle benchmark """
+    opts = PARSER.parse_args(args)
+    boards = opts.boards or sorted(nodes.all_open_nodes_types())
+    log_folder = tempfile.mkdtemp(prefix='iotlab_benchmark_log_')
+    try:
+        gateway_logging.init_logger(log_folder)
+        results = run(boards, opts.iterations, dict(opts.latency))
+        report(results)
+    finally:
+        shutil.rmtree(log_folder, ignore_errors=True)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
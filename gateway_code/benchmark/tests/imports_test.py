@@ -0,0 +1,56 @@
+# -*- coding: utf-8 -*-
+
+# This file is a part of IoT-LAB gateway_code
+# Copyright (C) 2015 INRIA (Contact: admin@iot-lab.info)
+# Contributor(s) : see AUTHORS file
+#
+# This software is governed by the CeCILL license under French law
+# and abiding by the rules of distribution of free software.  You can  use,
+# modify and/ or redistribute the software under the terms of the CeCILL
+# license as circulated by CEA, CNRS and INRIA at the following URL
+# http://www.cecill.info.
+#
+# As a counterpart to the access to the source code and  rights to copy,
+# modify and redistribute granted by the license, users are provided only
+# with a limited warranty  and the software's author,  the holder of the
+# economic rights,  and the successive licensors  have only  limited
+# liability.
+#
+# The fact that you are presently reading this means that you have had
+# knowledge of the CeCILL license and that you accept its terms.
+
+
+# pylint: disable=missing-docstring
+
+import unittest
+
+import mock
+
+from gateway_code.benchmark import imports
+
+
+class TestImports(unittest.TestCase):
+
+    def test_sample(self):
+        import_s, lookup_s = imports.sample('gateway_code.nodes', 'm3')
+        self.assertGreater(import_s, 0)
+        self.assertGreater(lookup_s, 0)
+
+    def test_main(self):
+        samples = [(0.05, 0.01), (0.2, 0.01)]
+        with mock.patch.object(imports, 'sample', side_effect=samples):
+            with mock.patch.object(imports, 'report') as report:
+                ret = imports.main(['-n', '1', '-m', 'gateway_code.nodes',
+                                    '-m', 'gateway_code.common',
+                                    '--budget', '100', 'm3'])
+        self.assertEqual(1, ret)
+        results = report.call_args[0][0]
+        self.assertEqual({'import nodes': [0.05],
+                          'nodes: open_node_class': [0.01],
+                          'import common': [0.2],
+                          'common: open_node_class': [0.01]},
+                         dict(results['m3']))
+
+        with mock.patch.object(imports, 'sample', return_value=(0.05, 0.01)):
+            with mock.patch.object(imports, 'report'):
+                self.assertEqual(0, imports.main(['-n', '1']))
@@ -0,0 +1,92 @@
+#! /usr/bin/env python
+
+# This file is a part of IoT-LAB gateway_code
+# Copyright (C) 2015 INRIA (Contact: admin@iot-lab.info)
+# Contributor(s) : see AUTHORS file
+#
+# This software is governed by the CeCILL license under French law
+# and abiding by the rules of distribution of free software.  You can  use,
+# modify and/ or redistribute the software under the terms of the CeCILL
+# license as circulated by CEA, CNRS and INRIA at the following URL
+# http://www.cecill.info.
+#
+# As a counterpart to the access to the source code and  rights to copy,
+# modify and redistribute granted by the license, users are provided only
+# with a limited warranty  and the software's author,  the holder of the
+# economic rights,  and the successive licensors  have only  limited
+# liability.
+#
+# The fact that you are presently reading this means that you have had
+# knowledge of the CeCILL license and that you accept its terms.
+
+
+# pylint: disable=missing-docstring
+# pylint: disable=invalid-name
+# pylint: disable=protected-access
+
+import os
+import unittest
+
+import mock
+
+from gateway_code import config
+from gateway_code import nodes
+from gateway_code.benchmark import lifecycle, fake_tool
+
+
+class TestSimulation(unittest.TestCase):
+
+    def test_simulation_restore(self):
+        m3_class = nodes.REGISTRY['m3']
+        cn_class = nodes.REGISTRY['iotlab']
+        tty, cfg_path = m3_class.TTY, config.GATEWAY_CONFIG_PATH
+        path = os.environ.get('PATH')
+
+        with lifecycle.Simulation('m3', {'openocd': 0.1}) as sim:
+            self.assertTrue(m3_class.TTY.startswith(sim.root))
+            self.assertTrue(os.path.exists(m3_class.TTY))
+            self.assertTrue(os.path.exists(cn_class.TTY))
+            self.assertEqual('openocd', m3_class.OPENOCD_PATH)
+            self.assertEqual('m3', config.read_config('board_type'))
+            self.assertEqual('openocd=0.1',
+                             os.environ[fake_tool.LATENCY_ENV])
+            self.assertTrue(os.path.exists(sim.path('bin', 'openocd')))
+
+        self.assertEqual(tty, m3_class.TTY)
+        self.assertNotIn('OPENOCD_PATH', vars(m3_class))
+        self.assertEqual(cfg_path, config.GATEWAY_CONFIG_PATH)
+        self.assertEqual(path, os.environ.get('PATH'))
+        self.assertNotIn(fake_tool.LATENCY_ENV, os.environ)
+        self.assertFalse(os.path.exists(sim.root))
+
+
+class TestLifecycle(unittest.TestCase):
+
+    def test_run_board(self):
+        # Skip waiting for the open node tty to disappear, 3 seconds each
+        with mock.patch('gateway_code.common.wait_no_tty') as wait_no_tty:
+            wait_no_tty.return_value = 0
+            samples = lifecycle.run_board('m3', iterations=1)
+
+        for name in ('exp_start', 'exp_update_profile', 'node_flash',
+                     'exp_stop', 'exp_start/control_node_start',
+                     'exp_stop/open_node_teardown'):
+            self.assertEqual(1, len(samples[name]), name)
+
+    def test_run_errors(self):
+        with mock.patch.object(lifecycle, 'run_board') as run_board:
+            run_board.side_effect = ValueError('Board failed')
+            results = lifecycle.run(['a8', 'm3'])
+        self.assertEqual('not simulated: no firmware to flash',
+                         results['a8'])
+        self.assertEqual('error: Board failed', results['m3'])
+
+    def test_report(self):
+        out = mock.Mock()
+        lifecycle.report({'m3': {'exp_start': [0.1, 0.2]},
+                          'a8': 'error: failed'}, out)
+        text = ''.join(call[0][0] for call in out.write.call_args_list)
+        self.assertIn('100.0', text)
+        self.assertIn('200.0', text)
+        self.assertIn('a8', text)
+        self.assertIn('error: failed', text)
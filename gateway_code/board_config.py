@@ -36,16 +36,22 @@ class BoardConfig(object):  # pylint:disable=too-few-public-methods
     """
 
     def __init__(self):
-        board_type = config.read_config('board_type')
+        # All values from the same configuration snapshot
+        snapshot = config.config_snapshot()
+
+        def _read(key, default=IOError):
+            return config.read_config(key, default, snapshot=snapshot)
+
+        board_type = _read('board_type')
         self.board_class = nodes.open_node_class(board_type)
-        cn_type = config.read_config('control_node_type', 'iotlab')
+        cn_type = _read('control_node_type', 'iotlab')
         self.cn_class = nodes.control_node_class(cn_type)
-        linux_on_type = config.read_config('linux_open_node_type', None)
+        linux_on_type = _read('linux_open_node_type', None)
         self.linux_on_class = (nodes.open_node_class(linux_on_type)
                                if linux_on_type else None)
 
-        self.robot_type = config.read_config('robot', None)
-        self.node_id = config.read_config('hostname')
+        self.robot_type = _read('robot', None)
+        self.node_id = _read('hostname')
 
         self.profile_from_dict = functools.partial(profile.Profile.from_dict,
                                                    self.board_class)
@@ -41,6 +41,9 @@ except ImportError:
 import functools
 
 import logging
+
+from gateway_code.utils import dev_watch
+
 LOGGER = logging.getLogger('gateway_code')
 
 
@@ -116,9 +119,23 @@ def wait_cond(timeout, value, fct, *args, **kwargs):
 TTY_DETECT_TIME = 3
 
 
+def wait_path(path, present, timeout):
+    """ Wait at max `timeout` for `path` existence to be `present`
+
+    Wakes up on device directory changes, polls when inotify is not
+    available.
+    :return: True if `path` was in requested state before timeout
+    """
+    try:
+        return dev_watch.wait_path(path, present, timeout)
+    except dev_watch.DevWatchError as err:
+        LOGGER.debug('Device watch unavailable, polling: %r', err)
+        return wait_cond(timeout, present, os.path.exists, path)
+
+
 def wait_tty(dev_tty, logger, timeout=TTY_DETECT_TIME):
     """ Wait that tty is present """
-    if wait_cond(timeout, True, os.path.exists, dev_tty):
+    if wait_path(dev_tty, True, timeout):
         return 0
     logger.error('Error Open Node tty not visible: %s', dev_tty)
     return 1
@@ -126,7 +143,7 @@ def wait_tty(dev_tty, logger, timeout=TTY_DETECT_TIME):
 
 def wait_no_tty(dev_tty, timeout=TTY_DETECT_TIME):
     """ Wait until `dev_tty` is not present """
-    ret = wait_cond(timeout, False, os.path.exists, dev_tty)
+    ret = wait_path(dev_tty, False, timeout)
     return 0 if ret else 1
 
 
@@ -25,6 +25,15 @@
 import stat
 import os
 import json
+import errno
+import threading
+
+try:
+    from collections.abc import Mapping
+except ImportError:  # pragma: no cover
+    from collections import Mapping
+
+from gateway_code.utils import dev_watch
 
 STAT_0666 = (stat.S_IRUSR | stat.S_IWUSR | stat.S_IRGRP |
              stat.S_IWGRP | stat.S_IROTH | stat.S_IWOTH)
@@ -46,12 +55,19 @@ IOTLAB_USERS = os.environ.get('IOTLAB_USERS_DIR', '/iotlab/users')
 EXP_FILES_DIR = os.path.join(IOTLAB_USERS, '{user}/.iot-lab/{exp_id}/')
 EXP_FILES = {
     'consumption': 'consumption/{node_id}.oml',
+    'consumption_aggregate': 'consumption/{node_id}_aggregate.oml',
     'radio': 'radio/{node_id}.oml',
     'event': 'event/{node_id}.oml',
     'sniffer': 'sniffer/{node_id}.oml',
+    'sniffer_pcap': 'sniffer/{node_id}.pcapng',
     'log': 'log/{node_id}.log',
 }
 
+# Gateway private directory, created 0700 by the firmware cache
+FIRMWARE_CACHE_DIR = os.environ.get('IOTLAB_FIRMWARE_CACHE_DIR',
+                                    '/var/local/firmwares/')
+FIRMWARE_CACHE_SIZE = 64 * 1024 * 1024
+
 
 def create_user_file(file_path, mode='w'):
     """ Creat a file that can be read and modified by user """
@@ -72,20 +88,136 @@ def clean_user_file(file_path):
 DEFAULT_PROFILE = json.load(open(static_path('default_profile.json')))
 
 
-def read_config(key, default=IOError):
+class ConfigSnapshot(Mapping):
+    """ Immutable configuration values by key
+
+    >>> snapshot = ConfigSnapshot({'board_type': 'm3'})
+    >>> snapshot['board_type'], snapshot.get('robot')
+    ('m3', None)
+    """
+
+    def __init__(self, values):
+        self._values = dict(values)
+
+    def __getitem__(self, key):
+        return self._values[key]
+
+    def __iter__(self):
+        return iter(self._values)
+
+    def __len__(self):
+        return len(self._values)
+
+
+class ConfigDir(object):  # pylint:disable=too-few-public-methods
+    """ Configuration directory files values, read again only on changes
+
+    Changes are detected with inotify, or by comparing the files status if
+    not available. A change loads a new snapshot, snapshots are never
+    modified. """
+
+    def __init__(self, path):
+        self.path = path
+        self._lock = threading.Lock()
+        self._snapshot = None
+        self._watcher = None
+        self._signature = None
+
+    def snapshot(self):
+        """ Return current `ConfigSnapshot` """
+        with self._lock:
+            if self._snapshot is None:
+                self._watch()
+                self._snapshot = self._load()
+            elif self._changed():
+                self._snapshot = self._load()
+            return self._snapshot
+
+    def _watch(self):
+        """ Start watching config files before their first load """
+        try:
+            # Watches the directory of the config files
+            self._watcher = dev_watch.DevWatcher(
+                os.path.join(self.path, 'board_type'),
+                dev_watch.FILES_WATCH_MASK)
+            self._watcher.changed()
+        except dev_watch.DevWatchError:
+            self._watcher = None
+            self._signature = self._files_signature()
+
+    def _changed(self):
+        """ Config files changed since last check """
+        if self._watcher is not None:
+            return self._watcher.changed()
+        signature = self._files_signature()
+        changed = signature != self._signature
+        self._signature = signature
+        return changed
+
+    def _names(self):
+        """ Config directory files names """
+        try:
+            return sorted(os.listdir(self.path))
+        except OSError:
+            return []
+
+    def _files_signature(self):
+        """ Config files names and status """
+        signature = []
+        for name in self._names():
+            try:
+                st_ = os.stat(os.path.join(self.path, name))
+            except OSError:
+                continue
+            signature.append((name, st_.st_mtime, st_.st_size, st_.st_ino))
+        return tuple(signature)
+
+    def _load(self):
+        """ Read config files values """
+        values = {}
+        for name in self._names():
+            try:
+                with open(os.path.join(self.path, name)) as _conf:
+                    value = _conf.read()
+            except (IOError, OSError, ValueError):
+                continue  # directories, unreadable files
+            values[name] = value.strip().lower().replace('-', '_')
+        return ConfigSnapshot(values)
+
+
+# Process wide ConfigDir by path
+CONFIG_DIRS = {}
+
+
+def config_snapshot():
+    """ Return `GATEWAY_CONFIG_PATH` current `ConfigSnapshot`
+
+    Values read together from a snapshot are consistent with each other """
+    path = GATEWAY_CONFIG_PATH
+    try:
+        config_dir = CONFIG_DIRS[path]
+    except KeyError:
+        config_dir = CONFIG_DIRS.setdefault(path, ConfigDir(path))
+    return config_dir.snapshot()
+
+
+def read_config(key, default=IOError, snapshot=None):
     """ Read 'key' from config. If 'key' is not present raise an IOError
     if 'default' is not provided.
 
+    Values are read from `snapshot`, or the current `config_snapshot`.
+
     :param key: Return configuration for 'key'
     :param default: return default if provided and 'key' absent
+    :param snapshot: `ConfigSnapshot` to read consistent values from
     :raises IOError: when 'key' can't be read and default not provided """
 
-    entry = os.path.join(GATEWAY_CONFIG_PATH, key)
-
+    if snapshot is None:
+        snapshot = config_snapshot()
     try:
-        with open(entry) as _conf:
-            return _conf.read().strip().lower().replace('-', '_')
-    except IOError:
+        return snapshot[key]
+    except KeyError:
         if default is IOError:  # not provided
-            raise
+            entry = os.path.join(GATEWAY_CONFIG_PATH, key)
+            raise IOError(errno.ENOENT, os.strerror(errno.ENOENT), entry)
         return default
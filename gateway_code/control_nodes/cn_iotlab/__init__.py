@@ -25,16 +25,22 @@ import time
 import logging
 
 import gateway_code.utils.ftdi_check
+from gateway_code import common
 from gateway_code.common import logger_call
 from gateway_code.nodes import ControlNodeBase
 from gateway_code.utils.openocd import OpenOCD
 from gateway_code.config import static_path
-from . import cn_interface, cn_protocol
+from gateway_code.measures_feed import MeasuresFeed
+from gateway_code.measures_aggregation import ConsumptionAggregation
+from gateway_code.measures_metrics import MeasuresMetrics
+from gateway_code.utils.sniffer_relay import SnifferRelay
+from . import cn_interface, cn_protocol, cn_measures
 
 
 LOGGER = logging.getLogger('gateway_code')
 
 
+# pylint:disable=too-many-instance-attributes
 class ControlNodeIotlab(ControlNodeBase):
     """ Control Node implemenation """
     TYPE = 'iotlab'
@@ -45,6 +51,8 @@ class ControlNodeIotlab(ControlNodeBase):
     OPENOCD_CFG_FILE = static_path('iot-lab.cfg')
     OPENOCD_OPTS = (static_path('iot-lab-cn.cfg'),)
     FW_CONTROL_NODE = static_path('control_node.elf')
+    READY_TIMEOUT = 2.0
+    READY_DELAY = 1.2
     FEATURES = ['leds',
                 'open_node_power',
                 'open_node_gpio', 'open_node_i2c',
@@ -56,9 +64,17 @@ class ControlNodeIotlab(ControlNodeBase):
 
         self.openocd = OpenOCD.from_node(self)
         self.cn_serial = cn_interface.ControlNodeSerial(self.TTY)
-        self.protocol = cn_protocol.Protocol(self.cn_serial.send_command)
+        self.protocol = cn_protocol.Protocol(self.cn_serial.send_command,
+                                             self.cn_serial.send_commands)
         self.open_node_state = 'stop'
         self.profile = self.default_profile
+        self.measures_feed = MeasuresFeed()
+        self.aggregation = None
+        self.sniffer_relay = None
+        self.measures_stream = None
+        self.metrics = None
+        # Last acknowledged profile command for each `PROFILE_PARTS`
+        self._profile_sent = {}
 
     @property
     def programmer(self):
@@ -73,10 +89,42 @@ class ControlNodeIotlab(ControlNodeBase):
 
         oml_cfg = self.cn_serial.oml_xml_config(self.node_id, exp_id,
                                                 exp_files)
+        if exp_files and exp_files.get('consumption_aggregate'):
+            self.aggregation = ConsumptionAggregation(
+                exp_files['consumption_aggregate'], self.node_id, exp_id)
+        if exp_files and exp_files.get('sniffer_pcap'):
+            self._setup_sniffer_relay(exp_files['sniffer_pcap'])
+        # Live measures, after reset as it stops the serial interface
+        self.metrics = MeasuresMetrics()
+        self.measures_stream = cn_measures.MeasuresStream(
+            self._measures_handler)
+        self.cn_serial.measures_stream = self.measures_stream
         ret_val += self.cn_serial.start(oml_cfg)
         ret_val += self.open_start('dc')
         return ret_val
 
+    def _setup_sniffer_relay(self, pcap):
+        """ Setup sniffer relay, the serial interface serves its upstream
+
+        Must be called after reset, as it restarts the serial interface on
+        the default port. The relay is only started for sniffer profiles,
+        see `_start_sniffer_relay`. """
+        self.sniffer_relay = SnifferRelay(pcap=pcap)
+        self.cn_serial.sniffer_port = self.sniffer_relay.upstream_port
+
+    def _start_sniffer_relay(self):
+        """ Start sniffer relay on the public sniffer port if the profile
+        radio is in sniffer mode
+
+        It then runs until `stop`, not to overwrite its capture files.
+        Relay failure is not an experiment error. """
+        radio = getattr(self.profile, 'radio', None)
+        if (self.sniffer_relay is None or radio is None or
+                radio.mode != 'sniffer'):
+            return
+        if self.sniffer_relay.start():
+            LOGGER.error('Sniffer relay not started, no sniffer capture')
+
     @logger_call("Control node: Setup")
     def setup(self):
         """Setup control node.
@@ -91,18 +139,35 @@ class ControlNodeIotlab(ControlNodeBase):
         ret_val = 0
         ret_val += self.open_stop('dc')
         ret_val += self.cn_serial.stop()
+        if self.sniffer_relay is not None:
+            ret_val += self.sniffer_relay.stop()
+        self._log_measures_metrics()
+        self.sniffer_relay = None
+        self.metrics = None
+        self.measures_stream = None
+        self.cn_serial.measures_stream = None
+        self.measures_feed.close()
+        if self.aggregation is not None:
+            self.aggregation.close()
+            self.aggregation = None
         ret_val += self.reset()
         return ret_val
 
     @logger_call("Control node : Start experiment")
     def start_experiment(self, profile):
-        """ Configure the experiment """
-        ret_val = 0
-        ret_val += self.protocol.green_led_blink()
-        ret_val += self.protocol.set_time()
-        ret_val += self.protocol.set_node_id(self.node_id)
-        ret_val += self.configure_profile(profile)
-        return ret_val
+        """ Configure the experiment
+
+        Leds, time, node id and profile commands are sent in one batch """
+        LOGGER.info('Configure profile on Control Node')
+        self.profile = profile or self.default_profile
+        self._configure_measures()
+        self._start_sniffer_relay()
+        profile_cmds = self._profile_cmds()
+        cmds = (self.protocol.experiment_cmds(self.node_id) +
+                list(profile_cmds.values()))
+        ret = self.protocol.send_cmds(cmds)
+        self._set_profile_sent(profile_cmds, ret)
+        return ret
 
     @logger_call("Control node : stop of the experiment")
     def stop_experiment(self):
@@ -137,23 +202,111 @@ class ControlNodeIotlab(ControlNodeBase):
 
     @logger_call("Control node : profile configuration")
     def configure_profile(self, profile=None):
-        """ Configure the given profile on the control node """
+        """ Configure the given profile on the control node
+
+        Only commands that changed since the last configuration are sent """
         LOGGER.info('Configure profile on Control Node')
         self.profile = profile or self.default_profile
-        ret_val = 0
-        # power_mode (start|stop dc|batt)
-        ret_val += self.protocol.start_stop(self.open_node_state,
-                                            self.profile.power)
-        # Monitoring
-        ret_val += self.protocol.config_consumption(self.profile.consumption)
-        ret_val += self.protocol.config_radio(self.profile.radio)
-        return ret_val
+        self._configure_measures()
+        self._start_sniffer_relay()
+        profile_cmds = self._profile_cmds()
+        cmds = [cmd for part, cmd in profile_cmds.items()
+                if self._profile_sent.get(part) != cmd]
+        if not cmds:
+            LOGGER.debug('Control node profile unchanged')
+            return 0
+        ret = self.protocol.send_cmds(cmds)
+        self._set_profile_sent(profile_cmds, ret)
+        return ret
+
+    def _set_profile_sent(self, profile_cmds, ret):
+        """ Save configured profile commands, forget them on error """
+        if ret == 0:
+            self._profile_sent = dict(profile_cmds)
+        else:
+            self._profile_sent = {}
+
+    def _configure_measures(self):
+        """ Configure measures metrics and aggregation from profile """
+        if self.metrics is not None:
+            self.metrics.configure(self.profile)
+        if self.aggregation is None:
+            return
+        consumption = self.profile.consumption
+        if consumption is None or consumption.aggregation is None:
+            self.aggregation.configure(None)
+        else:
+            self.aggregation.configure(consumption.aggregation / 1000.0)
+
+    def _measures_handler(self, name, columns):
+        """ Handle measures received from control node serial program """
+        self.metrics.add(name, columns)
+        if name == 'consumption' and self.aggregation is not None:
+            self.aggregation.add(columns)
+        self.measures_feed.publish(name, columns)
+
+    def measures_metrics(self):
+        """ Measures pipeline quality metrics of the current experiment
+
+        Per measures type metrics, see `measures_metrics.TypeMetrics`,
+        datagrams lost by the measures stream, live feed and sniffer relay
+        drops and queues usage. None if no experiment was started. """
+        if self.metrics is None:
+            return None
+        metrics = {'measures': self.metrics.summary(),
+                   'stream_lost': self.measures_stream.lost,
+                   'feed': self.measures_feed.stats()}
+        if self.sniffer_relay is not None:
+            metrics['sniffer'] = self.sniffer_relay.stats()
+        return metrics
+
+    def _log_measures_metrics(self):
+        """ Write measures metrics summary in the logs """
+        metrics = self.measures_metrics()
+        if metrics is None:
+            return
+        lost = metrics['stream_lost']
+        for name, values in sorted(metrics['measures'].items()):
+            LOGGER.info('Measures %s: %d samples in %d packets, %d gaps, '
+                        '%d missing samples, jitter %.0fus, '
+                        'max interval %dus', name, values['samples'],
+                        values['packets'], values['gaps'], values['missing'],
+                        values['jitter_us'], values['max_interval_us'])
+            lost += values['missing']
+        feed = metrics['feed']
+        LOGGER.info('Measures stream: %d lost datagrams, live measures '
+                    'dropped %d, queue high water %d/%d',
+                    metrics['stream_lost'], feed['dropped'],
+                    feed['queue_high_water'], feed['queue_size'])
+        sniffer = metrics.get('sniffer')
+        if sniffer is not None:
+            for channel, counters in sorted(sniffer['channels'].items()):
+                LOGGER.info('Sniffer channel %d: %d packets, %d CRC errors',
+                            channel, counters['packets'],
+                            counters['crc_errors'])
+            LOGGER.info('Sniffer relay: dropped %d, queue high water %d/%d',
+                        sniffer['dropped'], sniffer['queue_high_water'],
+                        sniffer['queue_size'])
+        if lost:
+            LOGGER.warning('Measures were lost, monitoring profile may be '
+                           'too demanding for the control node link')
+
+    def subscribe_measures(self, **filters):
+        """ Subscribe to live measures, see `measures_feed.Subscription` """
+        return self.measures_feed.subscribe(**filters)
+
+    def _profile_cmds(self):
+        """ Commands configuring current profile power_mode and monitoring
+
+        Ordered dict of commands keyed by `cn_protocol.PROFILE_PARTS` """
+        return self.protocol.profile_cmds(self.open_node_state, self.profile)
 
     @logger_call("Control node : start power of open node")
     def open_start(self, power=None):
         """ Start open node with 'power' source """
         power = power or self.profile.power
         ret = self.protocol.start_stop('start', power)
+        self._profile_sent.pop('power', None)
         if ret == 0:
             self.open_node_state = 'start'
         return ret
@@ -163,6 +316,7 @@ class ControlNodeIotlab(ControlNodeBase):
         """ Stop open node with 'power' source """
         power = power or self.profile.power
         ret = self.protocol.start_stop('stop', power)
+        self._profile_sent.pop('power', None)
         if ret == 0:
             self.open_node_state = 'stop'
         return ret
@@ -179,6 +333,7 @@ class ControlNodeIotlab(ControlNodeBase):
         firmware_path = firmware_path or self.FW_CONTROL_NODE
         LOGGER.info('Flash firmware on Control Node %s', firmware_path)
         ret = self.openocd.flash(firmware_path)
+        self._profile_sent = {}
         self._wait_control_node_ready()
         return ret
 
@@ -187,17 +342,21 @@ class ControlNodeIotlab(ControlNodeBase):
         """ Reset the Control Node using jtag """
         LOGGER.info('Reset Control Node')
         ret = self.openocd.reset()
+        self._profile_sent = {}
         self._wait_control_node_ready()
         return ret
 
-    @staticmethod
-    def _wait_control_node_ready():
+    def _wait_control_node_ready(self):
         """ Wait that the ControlNode firmware starts.
 
         It waits one second when starting, and may also trigger udev when
         restarting a node. This take a bit more than 1.1 second.
-        So wait 2 seconds to be safe.  """
-        time.sleep(2)
+        So wait for the tty, READY_TIMEOUT at max, and until READY_DELAY
+        after reset to let the firmware start. """
+        t_ready = time.time() + self.READY_DELAY
+        if not common.wait_path(self.TTY, True, self.READY_TIMEOUT):
+            LOGGER.warning('Control node tty not visible: %s', self.TTY)
+        time.sleep(max(0, t_ready - time.time()))
 
     def status(self):
         """ Check Control node status """
@@ -39,11 +39,16 @@ import atexit
 
 from gateway_code import common
 from gateway_code.utils import subprocess_timeout
+from . import cn_messages
 
 LOGGER = logging.getLogger('gateway_code')
 
 
 CONTROL_NODE_SERIAL_INTERFACE = 'control_node_serial_interface'
+ANSWER_TIMEOUT = 1.0
+MEASURES_QUEUE_SIZE = 4096
+# Commands sent at once, more than experiment and profile commands
+COMMANDS_BATCH_SIZE = 8
 
 
 OML_XML = '''
@@ -73,13 +78,25 @@ class ControlNodeSerial(object):  # pylint:disable=too-many-instance-attributes
         self.tty = tty
         self.process = None
         self.reader_thread = None
-        self.msgs = queue.Queue(1)
+        self.measures_reader_thread = None
+        self.msgs = queue.Queue(COMMANDS_BATCH_SIZE)
         self.measures_debug = None
+        self.measures_stream = None
+        self.sniffer_port = None
 
         self._send_mutex = threading.Semaphore(1)
         self._wait_ready = queue.Queue(1)
         self._oml_cfg_file = None
 
+        # Messages not registered are commands answers
+        self.dispatcher = cn_messages.Dispatcher(self._handle_cmd_answer)
+        self.dispatcher.register('config_ack', self._handle_config_ack)
+        self.dispatcher.register('error', self._handle_error)
+        self.dispatcher.register('cn_serial_error:', LOGGER.error)
+        self.dispatcher.register('cn_serial_ready', self._handle_ready)
+        self.dispatcher.register('measures_debug:', self.measures_handler,
+                                 MEASURES_QUEUE_SIZE)
+
         # cleanup in case of error
         atexit.register(self.stop)
 
@@ -90,11 +107,26 @@ class ControlNodeSerial(object):  # pylint:disable=too-many-instance-attributes
         """
         common.empty_queue(self._wait_ready)
 
+        if self.measures_stream is not None:
+            self.measures_stream.start()
+
+        self.dispatcher.start()
+
         args = self._cn_interface_args(oml_xml_config)
-        self.process = subprocess_timeout.Popen(args, stderr=PIPE, stdin=PIPE)
+        # Debug measures are printed on stdout
+        stdout = PIPE if self.measures_debug is not None else None
+        # line buffered text, commands are sent when written
+        self.process = subprocess_timeout.Popen(args, stderr=PIPE, stdin=PIPE,
+                                                stdout=stdout,
+                                                universal_newlines=True,
+                                                bufsize=1)
 
         self.reader_thread = threading.Thread(target=self._reader)
         self.reader_thread.start()
+        if stdout is not None:
+            self.measures_reader_thread = threading.Thread(
+                target=self._measures_reader)
+            self.measures_reader_thread.start()
 
         ret = self._wait_ready.get()
         return ret
@@ -112,6 +144,14 @@ class ControlNodeSerial(object):  # pylint:disable=too-many-instance-attributes
         if self.measures_debug is not None:
             args += ['-d']
 
+        # Binary measures
+        if self.measures_stream is not None:
+            args += ['-m', self.measures_stream.path]
+
+        # Sniffer server on localhost for the relay
+        if self.sniffer_port is not None:
+            args += ['-s', str(self.sniffer_port)]
+
         return args
 
     @staticmethod
@@ -122,8 +162,11 @@ class ControlNodeSerial(object):  # pylint:disable=too-many-instance-attributes
         if oml_xml_config is None:
             return None
 
+        if isinstance(oml_xml_config, bytes):
+            oml_xml_config = oml_xml_config.decode()
+
         # Save xml configuration in a temporary file
-        cfg_file = NamedTemporaryFile(suffix='--oml.config')
+        cfg_file = NamedTemporaryFile(mode='w', suffix='--oml.config')
         cfg_file.write(oml_xml_config)
         cfg_file.flush()
 
@@ -149,10 +192,21 @@ class ControlNodeSerial(object):  # pylint:disable=too-many-instance-attributes
 
         if self.reader_thread is not None:
             self.reader_thread.join()
+        if self.measures_reader_thread is not None:
+            self.measures_reader_thread.join()
+            self.measures_reader_thread = None
+        # handle queued messages
+        self.dispatcher.stop()
 
         # remove process after reader_thread is joined
         self.process = None
         self.measures_debug = None
+        self.sniffer_port = None
+
+        # stop binary measures after the process
+        if self.measures_stream is not None:
+            self.measures_stream.stop()
+            self.measures_stream = None
 
         # cleanup oml
         if self._oml_cfg_file is not None:
@@ -177,33 +231,35 @@ class ControlNodeSerial(object):  # pylint:disable=too-many-instance-attributes
             pass  # None
 
     def _handle_answer(self, line):
-        """Handle control node answers
+        """Handle control node messages with their type handler """
+        self.dispatcher.dispatch(line)
 
-          * For errors, print the message
-          * For command answers, send it to command sender
-        """
+    @staticmethod
+    def _handle_config_ack(line):
+        """ Ack of set_time/measures configuration """
         answer = line.split(' ')
-        if answer[0] == 'config_ack':  # ack set_time/measures
-            LOGGER.debug('config_ack %s', answer[1])
-            if answer[1] == 'set_time':
-                LOGGER.info('Control Node set time delay: %d us',
-                            int(1000000 * float(answer[2])))
-        elif answer[0] == 'error':  # control node error
-            LOGGER.error('Control node error: %r', answer[1])
-
-        # debug messages
-        elif answer[0] == 'cn_serial_error:':  # control node serial error
-            LOGGER.error(line)
-        elif answer[0] == 'measures_debug:':  # measures output
-            self.measures_handler(line)
-        elif answer[0] == 'cn_serial_ready':  # cn_serial interface ready
-            self._wait_ready.put(0)
-
-        else:  # control node answer to a command
-            try:
-                self.msgs.put_nowait(answer)
-            except queue.Full:
-                LOGGER.error('Control node answer queue full: %r', answer)
+        LOGGER.debug('config_ack %s', answer[1])
+        if answer[1] == 'set_time':
+            LOGGER.info('Control Node set time delay: %d us',
+                        int(1000000 * float(answer[2])))
+
+    @staticmethod
+    def _handle_error(line):
+        """ Control node error """
+        LOGGER.error('Control node error: %r', line.split(' ')[1])
+
+    def _handle_ready(self, _line):
+        """ cn_serial interface ready """
+        self._wait_ready.put(0)
+
+    def _handle_cmd_answer(self, line):
+        """ Control node answer to a command, sent to command sender """
+        answer = line.split(' ')
+        try:
+            self.msgs.put_nowait(answer)
+        except queue.Full:
+            self.dispatcher.overflow('answer')
+            LOGGER.error('Control node answer queue full: %r', answer)
 
     def measures_handler(self, line):
         """ Debug measures """
@@ -225,32 +281,84 @@ class ControlNodeSerial(object):  # pylint:disable=too-many-instance-attributes
             LOGGER.error('Control node serial reader thread ended prematurely')
             self._wait_ready.put(1)  # in case of failure at startup
 
-    def send_command(self, command_args):
+    def _measures_reader(self):
+        """ Debug measures reader thread worker """
+        for line in iter(self.process.stdout.readline, ''):
+            self.dispatcher.dispatch(line.strip(), default=LOGGER.debug)
+
+    def send_command(self, command_args, timeout=ANSWER_TIMEOUT):
         """ Send given command to control node and wait for an answer
 
         :param command_args: command arguments
         :type command_args: list of string
+        :param timeout: answer timeout in seconds
         :return: received answers or `None` if timeout caught
         """
-        command_str = ' '.join(command_args) + '\n'
+        return self.send_commands([command_args], timeout)[0]
+
+    def send_commands(self, commands, timeout=ANSWER_TIMEOUT):
+        """ Send given commands at once to control node and wait for answers
+
+        Commands are pipelined by batches of COMMANDS_BATCH_SIZE, answers
+        are matched in order with commands names.
+
+        :param commands: list of commands arguments
+        :param timeout: timeout in seconds for each answer
+        :return: list of received answers, `None` for unanswered commands
+        """
+        answers = []
+        for index in range(0, len(commands), COMMANDS_BATCH_SIZE):
+            batch = commands[index:index + COMMANDS_BATCH_SIZE]
+            batch_answers, answered = self._send_commands(batch, timeout)
+            if not answered:
+                LOGGER.error('control_node_serial answer timeout')
+            answers += batch_answers
+        return answers
+
+    def _send_commands(self, commands, timeout):
+        """ Send at most COMMANDS_BATCH_SIZE commands and wait for answers
+
+        :return: (answers, all commands answered) """
+        answers = [None] * len(commands)
+        answered = True
+        commands_str = ''.join(' '.join(args) + '\n' for args in commands)
         with self._send_mutex:
             # remove existing items (old not treated answers)
             common.empty_queue(self.msgs)
             try:
-                LOGGER.debug('control_node_cmd: %r', command_args)
-                self.process.stdin.write(command_str)
-                # wait for answer 1 second at max
-                answer_cn = self.msgs.get(block=True, timeout=1.0)
-            except queue.Empty:
-                LOGGER.error('control_node_serial answer timeout')
-                answer_cn = None
+                for command_args in commands:
+                    LOGGER.debug('control_node_cmd: %r', command_args)
+                self.process.stdin.write(commands_str)
+                answered = self._wait_answers(commands, answers, timeout)
             except AttributeError:
                 LOGGER.error('control_node_serial stdin is None')
-                answer_cn = None
             except IOError:
                 LOGGER.error('control_node_serial process is terminated')
-                answer_cn = None
             finally:
-                LOGGER.debug('control_node_answer: %r', answer_cn)
+                for answer_cn in answers:
+                    LOGGER.debug('control_node_answer: %r', answer_cn)
+
+        return answers, answered
+
+    def _wait_answers(self, commands, answers, timeout):
+        """ Store answers to `commands` in `answers` list
 
-        return answer_cn
+        Commands without answer are skipped when a later one is answered.
+        Wait for each answer `timeout` seconds at max.
+
+        :return: False on timeout """
+        names = [command_args[0] for command_args in commands]
+        index = 0
+        while index < len(names):
+            try:
+                answer_cn = self.msgs.get(block=True, timeout=timeout)
+            except queue.Empty:
+                return False
+            try:
+                index = names.index(answer_cn[0], index)
+            except ValueError:
+                LOGGER.error('Control node unexpected answer: %r', answer_cn)
+                continue
+            answers[index] = answer_cn
+            index += 1
+        return True
@@ -0,0 +1,167 @@
+# -*- coding: utf-8 -*-
+
+# This file is a part of IoT-LAB gateway_code
+# Copyright (C) 2015 INRIA (Contact: admin@iot-lab.info)
+# Contributor(s) : see AUTHORS file
+#
+# This software is governed by the CeCILL license under French law
+# and abiding by the rules of distribution of free software.  You can  use,
+# modify and/ or redistribute the software under the terms of the CeCILL
+# license as circulated by CEA, CNRS and INRIA at the following URL
+# http://www.cecill.info.
+#
+# As a counterpart to the access to the source code and  rights to copy,
+# modify and redistribute granted by the license, users are provided only
+# with a limited warranty  and the software's author,  the holder of the
+# economic rights,  and the successive licensors  have only  limited
+# liability.
+#
+# The fact that you are presently reading this means that you have had
+# knowledge of the CeCILL license and that you accept its terms.
+
+
+""" Binary measures stream from `control node serial program`
+
+Measures are received on a unix datagram socket given with '-m'.
+Each datagram is a header followed by fixed size records of one measure
+type, they are decoded in bulk into columns arrays.
+See 'control_node_serial/src/measures_stream.h' for the format.
+"""
+
+import os
+import struct
+import socket
+import logging
+import tempfile
+import threading
+from array import array
+from collections import OrderedDict
+
+LOGGER = logging.getLogger('gateway_code')
+
+HEADER = struct.Struct('=HHI')  # type, count, seq
+SEQ_MOD = 1 << 32
+
+# type: (name, ((field, array typecode), ...)), all fields are 4 bytes
+RECORDS = {
+    1: ('consumption', (('timestamp_s', 'I'), ('timestamp_us', 'I'),
+                        ('power', 'f'), ('voltage', 'f'), ('current', 'f'))),
+    2: ('radio', (('timestamp_s', 'I'), ('timestamp_us', 'I'),
+                  ('channel', 'I'), ('rssi', 'i'))),
+}
+FIELD_SIZE = 4
+MAX_DATAGRAM = HEADER.size + 255 * 5 * FIELD_SIZE
+
+
+def _typecode(code):
+    """ Array typecode with 4 bytes items, 'I' may be 8 bytes
+
+    >>> array(_typecode('I')).itemsize, array(_typecode('i')).itemsize
+    (4, 4)
+    """
+    if array(code).itemsize == FIELD_SIZE:
+        return code
+    return {'I': 'L', 'i': 'l'}[code]  # pragma: no cover
+
+
+def decode(datagram):
+    """ Decode a measures datagram into columns
+
+    >>> data = HEADER.pack(2, 2, 7) + struct.pack('=IIIiIIIi',
+    ...     10, 1, 11, -91, 10, 2, 26, -80)
+    >>> name, seq, columns = decode(data)
+    >>> name, seq, list(columns.keys())
+    ('radio', 7, ['timestamp_s', 'timestamp_us', 'channel', 'rssi'])
+    >>> columns['channel'].tolist(), columns['rssi'].tolist()
+    ([11, 26], [-91, -80])
+
+    :returns: (measure type name, datagram sequence number, columns dict)
+    :raises ValueError: on invalid datagram
+    """
+    try:
+        m_type, count, seq = HEADER.unpack_from(datagram)
+        name, fields = RECORDS[m_type]
+    except (struct.error, KeyError):
+        raise ValueError('Invalid measures datagram')
+
+    payload = datagram[HEADER.size:]
+    if len(payload) != count * len(fields) * FIELD_SIZE:
+        raise ValueError('Invalid %s measures datagram length' % name)
+
+    # One array per typecode on the whole payload, then one column per field
+    views = dict((code, array(_typecode(code), payload))
+                 for code in set(code for _, code in fields))
+    step = len(fields)
+    columns = OrderedDict((field, views[code][index::step])
+                          for index, (field, code) in enumerate(fields))
+    return name, seq, columns
+
+
+class MeasuresStream(object):
+    """ Receive binary measures from control node serial program
+
+    :param handler: called with (measure type name, columns dict) for each
+        received datagram, from the reader thread.
+    """
+    SOCKET_TIMEOUT = 0.5
+
+    def __init__(self, handler):
+        self.handler = handler
+        self.path = None
+        self.lost = 0
+        self._socket = None
+        self._thread = None
+        self._running = False
+        self._next_seq = None
+
+    def start(self):
+        """ Bind the socket and start the reader thread """
+        self.path = os.path.join(tempfile.mkdtemp(prefix='cn_measures_'),
+                                 'measures.sock')
+        self._socket = socket.socket(socket.AF_UNIX, socket.SOCK_DGRAM)
+        self._socket.bind(self.path)
+        self._socket.settimeout(self.SOCKET_TIMEOUT)
+        self.lost = 0
+        self._next_seq = None
+        self._running = True
+        self._thread = threading.Thread(target=self._reader)
+        self._thread.daemon = True
+        self._thread.start()
+
+    def stop(self):
+        """ Stop the reader thread and remove the socket """
+        if self._thread is None:
+            return
+        self._running = False
+        self._thread.join()
+        self._thread = None
+        self._socket.close()
+        self._socket = None
+        os.remove(self.path)
+        os.rmdir(os.path.dirname(self.path))
+        if self.lost:
+            LOGGER.warning('Control node measures stream lost %d datagrams',
+                           self.lost)
+
+    def _reader(self):
+        """ Reader thread worker """
+        buf = bytearray(MAX_DATAGRAM)
+        while self._running:
+            try:
+                size = self._socket.recv_into(buf)
+            except socket.timeout:
+                continue
+            self.handle_datagram(bytes(buf[:size]))
+
+    def handle_datagram(self, datagram):
+        """ Decode datagram and forward it to handler """
+        try:
+            name, seq, columns = decode(datagram)
+        except ValueError as err:
+            LOGGER.error('Control node measures stream: %s', err)
+            return
+
+        if self._next_seq is not None:
+            self.lost += (seq - self._next_seq) % SEQ_MOD
+        self._next_seq = (seq + 1) % SEQ_MOD
+        self.handler(name, columns)
@@ -0,0 +1,141 @@
+# -*- coding: utf-8 -*-
+
+# This file is a part of IoT-LAB gateway_code
+# Copyright (C) 2015 INRIA (Contact: admin@iot-lab.info)
+# Contributor(s) : see AUTHORS file
+#
+# This software is governed by the CeCILL license under French law
+# and abiding by the rules of distribution of free software.  You can  use,
+# modify and/ or redistribute the software under the terms of the CeCILL
+# license as circulated by CEA, CNRS and INRIA at the following URL
+# http://www.cecill.info.
+#
+# As a counterpart to the access to the source code and  rights to copy,
+# modify and redistribute granted by the license, users are provided only
+# with a limited warranty  and the software's author,  the holder of the
+# economic rights,  and the successive licensors  have only  limited
+# liability.
+#
+# The fact that you are presently reading this means that you have had
+# knowledge of the CeCILL license and that you accept its terms.
+
+
+""" Messages dispatch for `control node serial program` outputs
+
+Messages are text lines tagged with their type, their first word.
+Handlers are registered by message type. A handler registered with a
+queue size runs in its own thread, fed by a bounded queue, so a flood of
+messages or a slow handler never delays other messages types. Messages
+not fitting in the queue are dropped and counted in `overflows`.
+"""
+
+import logging
+import threading
+
+try:
+    import Queue as queue
+except ImportError:
+    import queue
+
+LOGGER = logging.getLogger('gateway_code')
+
+
+class Dispatcher(object):
+    """ Call registered handlers for each message type
+
+    >>> messages = []
+    >>> dispatcher = Dispatcher(default=messages.append)
+    >>> dispatcher.register('error', lambda msg: messages.append('E ' + msg))
+    >>> dispatcher.dispatch('error 42')
+    >>> dispatcher.dispatch('start ACK')
+    >>> messages
+    ['E error 42', 'start ACK']
+    """
+
+    def __init__(self, default):
+        self.default = default
+        self.handlers = {}
+        self.overflows = {}
+        self._workers = []
+
+    def register(self, msg_type, handler, queue_size=0):
+        """ Call `handler(message)` for `msg_type` messages
+
+        :param queue_size: if not 0, call handler from a worker thread with
+            at most `queue_size` waiting messages. """
+        if queue_size:
+            worker = _Worker(msg_type, handler, queue_size, self.overflow)
+            self._workers.append(worker)
+            handler = worker.put
+        self.handlers[msg_type] = handler
+
+    def dispatch(self, line, default=None):
+        """ Call `line` message type handler, or `default` handler """
+        msg_type = line.split(' ', 1)[0]
+        handler = self.handlers.get(msg_type, default or self.default)
+        handler(line)
+
+    def overflow(self, msg_type):
+        """ Count a dropped `msg_type` message
+
+        :returns: number of dropped messages of this type """
+        count = self.overflows.get(msg_type, 0) + 1
+        self.overflows[msg_type] = count
+        return count
+
+    def start(self):
+        """ Start workers threads """
+        self.overflows = {}
+        for worker in self._workers:
+            worker.start()
+
+    def stop(self):
+        """ Stop workers threads once queued messages are handled """
+        for worker in self._workers:
+            worker.stop()
+
+
+class _Worker(object):
+    """ Call `handler` from a thread for queued messages """
+
+    def __init__(self, msg_type, handler, queue_size, overflow):
+        self.msg_type = msg_type
+        self.handler = handler
+        self.overflow = overflow
+        self._queue = queue.Queue(queue_size)
+        self._thread = None
+
+    def put(self, message):
+        """ Queue message, drop it if queue is full """
+        try:
+            self._queue.put_nowait(message)
+        except queue.Full:
+            count = self.overflow(self.msg_type)
+            if count & (count - 1) == 0:  # log on powers of two
+                LOGGER.warning('Control node %s messages dropped: %d',
+                               self.msg_type, count)
+
+    def start(self):
+        """ Start handler thread """
+        if self._thread is not None:
+            return
+        self._thread = threading.Thread(target=self._run)
+        self._thread.daemon = True
+        self._thread.start()
+
+    def stop(self):
+        """ Stop handler thread after handling queued messages """
+        if self._thread is None:
+            return
+        self._queue.put(None)
+        self._thread.join()
+        self._thread = None
+
+    def _run(self):
+        """ Handle messages until None """
+        for message in iter(self._queue.get, None):
+            try:
+                self.handler(message)
+            except Exception:  # pylint:disable=broad-except
+                LOGGER.exception('Control node %s handler error',
+                                 self.msg_type)
@@ -22,12 +22,35 @@
 
 """ Protocol between python code and control_node_serial_interface C code """
 
+from collections import OrderedDict
+
+# Profile commands order, see `Protocol.profile_cmds`
+PROFILE_PARTS = ('power', 'consumption', 'radio')
+CMDS_CACHE_SIZE = 64
+
 
 class Protocol(object):
     """ Implements commands that can be sent to control node interface """
 
-    def __init__(self, sender):
+    def __init__(self, sender, batch_sender=None):
         self.sender = sender
+        self.batch_sender = batch_sender
+        self._cmds_cache = {}
+
+    def _cached_cmd(self, cmd_builder, config):
+        """ Return `cmd_builder(config)` command, cached by config value
+
+        Commands are shared, they must not be modified. """
+        key = (cmd_builder.__name__, None if config is None else config.key())
+        try:
+            return self._cmds_cache[key]
+        except KeyError:
+            pass
+        cmd = cmd_builder(config)
+        if len(self._cmds_cache) >= CMDS_CACHE_SIZE:
+            self._cmds_cache.clear()
+        self._cmds_cache[key] = cmd
+        return cmd
 
     def send_cmd(self, command_list):
         """ Send a command to the control node and wait for it's answer.  """
@@ -36,15 +59,30 @@ class Protocol(object):
         answer_valid = ([command, 'ACK'] == answer)
         return 0 if answer_valid else 1   # 0 on success
 
+    def send_cmds(self, commands):
+        """ Send commands to the control node in one batch
+
+        Commands are sent one by one if there is no `batch_sender`.
+        :returns: number of commands that failed, 0 on success """
+        if self.batch_sender is None or len(commands) <= 1:
+            return sum(self.send_cmd(cmd) for cmd in commands)
+        answers = self.batch_sender(commands)
+        return sum(0 if [cmd[0], 'ACK'] == answer else 1
+                   for cmd, answer in zip(commands, answers))
+
     def start_stop(self, command, alim):
         """ Start/stop open node
 
         :param command: 'start'|'stop'
         :param alim:    'dc'|'battery'
         """
+        return self.send_cmd(self.start_stop_cmd(command, alim))
+
+    @staticmethod
+    def start_stop_cmd(command, alim):
+        """ Start/stop open node command """
         # <start|stop> <dc|battery>
-        cmd = [command, alim]
-        return self.send_cmd(cmd)
+        return [command, alim]
 
     def set_time(self):
         """ Set unix time on control node """
@@ -77,15 +115,27 @@ class Protocol(object):
 
     def set_node_id(self, node_id):
         """ Set node id on control node"""
+        cmd = self.set_node_id_cmd(node_id)
+        if cmd is None:
+            return 0
+        return self.send_cmd(cmd)
+
+    @classmethod
+    def set_node_id_cmd(cls, node_id):
+        """ Set node id command, None if not handled for node archi
+
+        >>> Protocol.set_node_id_cmd('m3-1')
+        ['set_node_id', 'm3', '1']
+        >>> Protocol.set_node_id_cmd('leonardo-1')
+        """
         # set_node_id
-        archi, num = self._set_node_id_args(node_id)
+        archi, num = cls._set_node_id_args(node_id)
 
         # Other nodes types are not handled by the protocol (Leonardo, Fox)
         if archi not in ('m3', 'a8'):
-            return 0
+            return None
 
-        cmd = ['set_node_id', archi, num]
-        return self.send_cmd(cmd)
+        return ['set_node_id', archi, num]
 
     def green_led_blink(self):
         """ Set green led in blinking mode """
@@ -97,12 +147,47 @@ class Protocol(object):
         cmd = ['green_led_on']
         return self.send_cmd(cmd)
 
+    def experiment_cmds(self, node_id):
+        """ Commands starting an experiment: leds, time and node id """
+        cmds = [['green_led_blink'], ['set_time']]
+        node_id_cmd = self.set_node_id_cmd(node_id)
+        if node_id_cmd is not None:
+            cmds.append(node_id_cmd)
+        return cmds
+
+    def profile_cmds(self, state, profile):
+        """ Commands configuring power and monitoring for `profile`
+
+        One command for each of `PROFILE_PARTS`, keyed by part.
+        :param state: open node power state 'start'|'stop'
+        """
+        return OrderedDict((
+            ('power', self.start_stop_cmd(state, profile.power)),
+            ('consumption', self._cached_cmd(self.consumption_cmd,
+                                             profile.consumption)),
+            ('radio', self._cached_cmd(self.radio_cmd, profile.radio))))
+
+    def configure_profile(self, state, profile):
+        """ Configure power and monitoring for `profile` in one batch
+
+        :param state: open node power state 'start'|'stop'
+        """
+        cmds = self.profile_cmds(state, profile)
+        return self.send_cmds(list(cmds.values()))
+
     def config_consumption(self, consumption=None):
         """ Configure consumption measures on control node
 
         :param consumption: consumption measures configuration
         :type consumption:  class profile._Consumption
         """
+        ret = self.send_cmd(self._cached_cmd(self.consumption_cmd,
+                                             consumption))
+        return ret
+
+    @staticmethod
+    def consumption_cmd(consumption=None):
+        """ Consumption measures configuration command """
         # config_consumption_measure
         #     <stop>
         #     <start> <3.3V|5V|BATT> p <0|1> v <0|1> c <0|1>
@@ -121,8 +206,7 @@ class Protocol(object):
             cmd.extend(['c', str(int(consumption.current))])
             cmd.extend(['-p', str(consumption.period)])
             cmd.extend(['-a', str(int(consumption.average))])
-        ret = self.send_cmd(cmd)
-        return ret
+        return cmd
 
     def config_radio(self, radio):
         """ Configure radio measures on control node
@@ -143,6 +227,31 @@ class Protocol(object):
 
     def _config_radio_measure(self, radio):
         """ Configure radio measure """
+        return self.send_cmd(self._cached_cmd(self._radio_measure_cmd, radio))
+
+    def _config_radio_sniffer(self, radio):
+        """ Configure radio sniffer """
+        return self.send_cmd(self._cached_cmd(self._radio_sniffer_cmd, radio))
+
+    def _stop_radio(self):
+        """ Stop the radio """
+        return self.send_cmd(self._stop_radio_cmd())
+
+    @classmethod
+    def radio_cmd(cls, radio):
+        """ Radio configuration command """
+        if radio is None:
+            return cls._stop_radio_cmd()
+        if radio.mode == 'rssi':
+            return cls._radio_measure_cmd(radio)
+        if radio.mode == 'sniffer':
+            return cls._radio_sniffer_cmd(radio)
+
+        raise NotImplementedError("Uknown radio mode: {}".format(radio.mode))
+
+    @staticmethod
+    def _radio_measure_cmd(radio):
+        """ Radio measure command """
         # config_radio_measure
         #     <channel,list,comma,separated>
         #     <period>
@@ -153,12 +262,11 @@ class Protocol(object):
         cmd.append(','.join(str(x) for x in sorted_channels))
         cmd.append(str(radio.period))
         cmd.append(str(radio.num_per_channel))
+        return cmd
 
-        ret = self.send_cmd(cmd)
-        return ret
-
-    def _config_radio_sniffer(self, radio):
-        """ Configure radio sniffer """
+    @staticmethod
+    def _radio_sniffer_cmd(radio):
+        """ Radio sniffer command """
         # config_radio_sniffer
         #     <channel,list,comma,separated>
         #     <period>
@@ -167,10 +275,9 @@ class Protocol(object):
         cmd = ['config_radio_sniffer']
         cmd.append(','.join(str(x) for x in sorted_channels))
         cmd.append(str(radio.period))
+        return cmd
 
-        ret = self.send_cmd(cmd)
-        return ret
-
-    def _stop_radio(self):
-        """ Stop the radio """
-        return self.send_cmd(['config_radio_stop'])
+    @staticmethod
+    def _stop_radio_cmd():
+        """ Radio stop command """
+        return ['config_radio_stop']
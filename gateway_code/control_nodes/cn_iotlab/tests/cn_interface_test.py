@@ -46,8 +46,8 @@ class TestControlNodeSerial(unittest.TestCase):
     def setUp(self):
         self.popen_patcher = mock.patch(
             'gateway_code.utils.subprocess_timeout.Popen')
-        popen_class = self.popen_patcher.start()
-        self.popen = popen_class.return_value
+        self.popen_class = self.popen_patcher.start()
+        self.popen = self.popen_class.return_value
 
         self.popen.terminate.side_effect = self._terminate
         self.popen.poll.return_value = None
@@ -140,6 +140,60 @@ class TestControlNodeSerial(unittest.TestCase):
         self.assertEqual(['start', 'ACK'], ret)
         self.cn.stop()
 
+    def test_send_commands(self):
+        def _answer(*_args):
+            # 'set_time' not answered, old answer ignored
+            self.readline_ret_vals.put('green_led_on ACK\n')
+            self.readline_ret_vals.put('start ACK\n')
+            self.readline_ret_vals.put('set_node_id ACK\n')
+            self.readline_ret_vals.put('start NACK\n')
+
+        self.popen.stdin.write.side_effect = _answer
+
+        self.cn.start()
+        ret = self.cn.send_commands([['start', 'dc'], ['set_time'],
+                                     ['set_node_id', 'm3', '1'],
+                                     ['start', 'battery']])
+        self.assertEqual([['start', 'ACK'], None, ['set_node_id', 'ACK'],
+                          ['start', 'NACK']], ret)
+        # written at once
+        self.popen.stdin.write.assert_called_once_with(
+            'start dc\nset_time\nset_node_id m3 1\nstart battery\n')
+        self.log_error.check(
+            ('gateway_code', 'ERROR', 'Control node unexpected answer: %r' %
+             (['green_led_on', 'ACK'],)))
+        self.cn.stop()
+
+    def test_send_commands_batches(self):
+        def _answer(commands_str):
+            for line in commands_str.splitlines():
+                self.readline_ret_vals.put('%s ACK\n' % line)
+
+        self.popen.stdin.write.side_effect = _answer
+        msgs = self.cn.msgs
+
+        self.cn.start()
+        size = cn_interface.COMMANDS_BATCH_SIZE
+        commands = [['cmd%d' % num] for num in range(size + 2)]
+        ret = self.cn.send_commands(commands)
+        self.assertEqual([['cmd%d' % num, 'ACK'] for num in range(size + 2)],
+                         ret)
+        self.assertEqual(2, self.popen.stdin.write.call_count)
+        # answers always go to the same queue
+        self.assertIs(msgs, self.cn.msgs)
+        self.cn.stop()
+
+    def test_send_commands_timeout(self):
+        self.popen.stdin.write.side_effect = \
+            (lambda *x: self.readline_ret_vals.put('start ACK\n'))
+
+        self.cn.start()
+        ret = self.cn.send_commands([['start', 'dc'], ['set_time']])
+        self.assertEqual([['start', 'ACK'], None], ret)
+        self.log_error.check(
+            ('gateway_code', 'ERROR', 'control_node_serial answer timeout'))
+        self.cn.stop()
+
     def test_send_command_no_answer(self):
         self.cn.start()
         ret = self.cn.send_command(['start', 'DC'])
@@ -151,8 +205,9 @@ class TestControlNodeSerial(unittest.TestCase):
         self.assertIsNone(ret)
 
     def test_answer_and_answer_with_queue_full(self):
-        # get two answers without sending command
-        self.readline_ret_vals.put('set ACK\n')
+        # get more answers than batch size without sending command
+        for _ in range(cn_interface.COMMANDS_BATCH_SIZE):
+            self.readline_ret_vals.put('set ACK\n')
         self.readline_ret_vals.put('start ACK\n')
 
         self.cn.start()
@@ -161,6 +216,29 @@ class TestControlNodeSerial(unittest.TestCase):
         self.log_error.check(
             ('gateway_code', 'ERROR',
              'Control node answer queue full: {}'.format(['start', 'ACK'])))
+        self.assertEqual({'answer': 1}, self.cn.dispatcher.overflows)
+
+    def test_measures_debug_output(self):
+        """ Debug measures are read on stdout, not delaying answers """
+        measures = queue.Queue(0)
+        self.popen.stdout.readline.side_effect = measures.get
+        measures.put('measures_debug: radio_measure 1.0 11 -91\n')
+        measures.put('debug print\n')
+        m_debug = mock.Mock()
+        self.cn.measures_debug = m_debug
+
+        self.popen.stdin.write.side_effect = \
+            (lambda *x: self.readline_ret_vals.put('start ACK\n'))
+        self.cn.start()
+        self.assertEqual(cn_interface.PIPE,
+                         self.popen_class.call_args[1]['stdout'])
+        self.assertEqual(['start', 'ACK'], self.cn.send_command(['start']))
+
+        measures.put('')
+        self.cn.stop()
+        m_debug.assert_called_once_with(
+            'measures_debug: radio_measure 1.0 11 -91')
+        self.assertIsNone(self.cn.measures_reader_thread)
 
 # _cn_interface_args
 
@@ -182,6 +260,28 @@ class TestControlNodeSerial(unittest.TestCase):
         self.assertNotIn('-c', args)
         self.assertIn('-d', args)
 
+    def test_measures_stream(self):
+        stream = mock.Mock(path='/tmp/measures.sock')
+        self.cn.measures_stream = stream
+        self.assertEqual(0, self.cn.start())
+        stream.start.assert_called_with()
+        args = self.popen_class.call_args[0][0]
+        self.assertEqual('/tmp/measures.sock', args[args.index('-m') + 1])
+
+        self.cn.stop()
+        stream.stop.assert_called_with()
+        self.assertIsNone(self.cn.measures_stream)
+
+    def test_sniffer_port(self):
+        self.assertNotIn('-s', self.cn._cn_interface_args())
+        self.cn.sniffer_port = 30001
+        self.assertEqual(0, self.cn.start())
+        args = self.popen_class.call_args[0][0]
+        self.assertEqual('30001', args[args.index('-s') + 1])
+
+        self.cn.stop()
+        self.assertIsNone(self.cn.sniffer_port)
+
 # _config_oml coverage tests
 
     def test_empty_config_oml(self):
@@ -255,11 +355,16 @@ class TestHandleAnswer(unittest.TestCase):
 
         m_debug = mock.Mock()
 
+        # Handled from the dispatcher thread, stop waits for queued ones
+        self.cn.dispatcher.start()
         self.cn.measures_debug = m_debug
         self.cn._handle_answer(msg)
+        self.cn.dispatcher.stop()
         m_debug.assert_called_with(msg)
 
         m_debug.reset_mock()
+        self.cn.dispatcher.start()
         self.cn.measures_debug = None
         self.cn._handle_answer(msg)
+        self.cn.dispatcher.stop()
         self.assertFalse(m_debug.called)
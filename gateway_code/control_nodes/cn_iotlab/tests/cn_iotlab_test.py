@@ -21,10 +21,26 @@
 
 """ gateway_code.control_node (iotlab) unit tests files """
 
+import errno
+import socket
 import unittest
-from mock import Mock, patch, call
+from array import array
+from collections import OrderedDict
+from mock import Mock, patch
 
 from gateway_code.control_nodes.cn_iotlab import ControlNodeIotlab
+from gateway_code.control_nodes.cn_iotlab.cn_protocol import PROFILE_PARTS
+
+
+def _measures(**columns):
+    """ Measures columns with one sample timestamp """
+    return dict(columns, timestamp_s=array('I', [1]),
+                timestamp_us=array('I', [0]))
+
+
+def _profile_cmds(*cmds):
+    """ Profile commands keyed by part """
+    return OrderedDict(zip(PROFILE_PARTS, cmds))
 
 
 class TestCnIotlab(unittest.TestCase):
@@ -43,6 +59,8 @@ class TestCnIotlab(unittest.TestCase):
         self.cn_node.cn_serial.oml_xml_config.return_value = 'oml_cfg_test'
         self.cn_node.cn_serial.start.return_value = 0
         self.cn_node.cn_serial.stop.return_value = 0
+        self.wait_path = patch('gateway_code.common.wait_path').start()
+        self.wait_path.return_value = True
 
         cn_protocol_class = patch('gateway_code.control_nodes.cn_iotlab.'
                                   'cn_protocol.Protocol').start()
@@ -54,6 +72,11 @@ class TestCnIotlab(unittest.TestCase):
         self.cn_node.protocol.set_node_id.return_value = 0
         self.cn_node.protocol.config_consumption.return_value = 0
         self.cn_node.protocol.config_radio.return_value = 0
+        self.cn_node.protocol.send_cmds.return_value = 0
+        self.cn_node.protocol.experiment_cmds.return_value = [
+            ['green_led_blink'], ['set_time'], ['set_node_id', 'test']]
+        self.cn_node.protocol.profile_cmds.return_value = _profile_cmds(
+            ['stop', 'test_power'], ['test_consumption'], ['test_radio'])
 
         openocd_class = patch('gateway_code.utils.openocd.OpenOCD').start()
         self.cn_node.openocd = openocd_class.return_value
@@ -88,6 +111,50 @@ class TestCnIotlab(unittest.TestCase):
         self.cn_node.protocol.start_stop.assert_called_with('start', 'dc')
         assert self.cn_node.open_node_state == 'start'
 
+    def test_live_measures(self):
+        """Test live measures are published to subscribers."""
+        subscription = self.cn_node.subscribe_measures(types=['radio'])
+        assert self.cn_node.start('123') == 0
+        stream = self.cn_node.cn_serial.measures_stream
+        radio = _measures(rssi=array('i', [-91]))
+        stream.handler('radio', radio)
+        stream.handler('consumption', _measures(power=array('f', [0.5])))
+        assert subscription.frame(0) == {'radio': radio}
+
+        assert self.cn_node.stop() == 0
+        assert subscription.frame(0) is None
+
+    @patch('gateway_code.control_nodes.cn_iotlab.ConsumptionAggregation')
+    def test_consumption_aggregation(self, aggregation_class):
+        """Test consumption measures aggregation configuration."""
+        aggregation = aggregation_class.return_value
+        exp_files = {'consumption_aggregate': 'test_aggregate.oml'}
+        assert self.cn_node.start('123', exp_files) == 0
+        aggregation_class.assert_called_with('test_aggregate.oml', 'test',
+                                             '123')
+
+        profile = Mock(radio=None)
+        profile.consumption.aggregation = 500
+        profile.consumption.sample_period = 280
+        assert self.cn_node.start_experiment(profile) == 0
+        aggregation.configure.assert_called_with(0.5)
+
+        # Only consumption measures are aggregated
+        stream = self.cn_node.cn_serial.measures_stream
+        columns = _measures(power=array('f', [0.5]))
+        stream.handler('consumption', columns)
+        stream.handler('radio', _measures(rssi=array('i', [-91])))
+        aggregation.add.assert_called_once_with(columns)
+
+        self.cn_node.default_profile.configure_mock(consumption=None,
+                                                    radio=None)
+        assert self.cn_node.configure_profile(None) == 0
+        aggregation.configure.assert_called_with(None)
+
+        assert self.cn_node.stop() == 0
+        aggregation.close.assert_called_once()
+        assert self.cn_node.aggregation is None
+
     def test_setup(self):
         """Test setup of iotlab control node."""
         assert self.cn_node.setup() == 0
@@ -112,34 +179,69 @@ class TestCnIotlab(unittest.TestCase):
     def test_start_experiment(self):
         """Test start experiment of iotlab control node."""
         assert self.cn_node.start_experiment(None) == 0
-        self.cn_node.protocol.green_led_blink.assert_called_once()
-        self.cn_node.protocol.set_time.assert_called_once()
-        self.cn_node.protocol.set_node_id.assert_called_once()
-        self.cn_node.protocol.set_node_id.assert_called_with('test')
-        self.cn_node.protocol.config_consumption.assert_called_once()
-        self.cn_node.protocol.config_consumption.assert_called_with(
-            'test_consumption')
-        self.cn_node.protocol.config_radio.assert_called_once()
-        self.cn_node.protocol.config_radio.assert_called_with(
-            'test_radio')
-        self.cn_node.protocol.start_stop.assert_called_once()
-        self.cn_node.protocol.start_stop.assert_called_with(
-            'stop', 'test_power')
+        self.cn_node.protocol.experiment_cmds.assert_called_with('test')
+        self.cn_node.protocol.profile_cmds.assert_called_with(
+            'stop', self.cn_node.default_profile)
+        # One batch
+        self.cn_node.protocol.send_cmds.assert_called_once_with([
+            ['green_led_blink'], ['set_time'], ['set_node_id', 'test'],
+            ['stop', 'test_power'], ['test_consumption'], ['test_radio']])
+
+        self.cn_node.protocol.send_cmds.return_value = 2
+        assert self.cn_node.start_experiment(None) == 2
 
     def test_stop_experiment(self):
         """Test stop experiment of iotlab control node."""
         assert self.cn_node.stop_experiment() == 0
         self.cn_node.protocol.green_led_on.assert_called_once()
-        assert self.cn_node.protocol.start_stop.call_count == 2
-        assert self.cn_node.protocol.start_stop.call_args_list == \
-            [call('stop', 'test_power'), call('start', 'dc')]
+        self.cn_node.protocol.start_stop.assert_called_once_with('start', 'dc')
+
+        self.cn_node.protocol.profile_cmds.assert_called_once_with(
+            'stop', self.cn_node.default_profile)
+        self.cn_node.protocol.send_cmds.assert_called_once_with([
+            ['stop', 'test_power'], ['test_consumption'], ['test_radio']])
+
+    def test_configure_profile_changes(self):
+        """Test only changed profile commands are sent."""
+        send_cmds = self.cn_node.protocol.send_cmds
+        profile_cmds = self.cn_node.protocol.profile_cmds
+        assert self.cn_node.configure_profile(None) == 0
+        send_cmds.assert_called_once_with([
+            ['stop', 'test_power'], ['test_consumption'], ['test_radio']])
+
+        # Unchanged
+        send_cmds.reset_mock()
+        assert self.cn_node.configure_profile(None) == 0
+        assert not send_cmds.called
 
-        self.cn_node.protocol.config_consumption.assert_called_once()
-        self.cn_node.protocol.config_consumption.assert_called_with(
-            'test_consumption')
-        self.cn_node.protocol.config_radio.assert_called_once()
-        self.cn_node.protocol.config_radio.assert_called_with(
-            'test_radio')
+        # Only radio changed
+        profile_cmds.return_value = _profile_cmds(
+            ['stop', 'test_power'], ['test_consumption'], ['radio_stop'])
+        assert self.cn_node.configure_profile(None) == 0
+        send_cmds.assert_called_once_with([['radio_stop']])
+
+        # Power state changed outside of profile
+        send_cmds.reset_mock()
+        assert self.cn_node.open_start() == 0
+        assert self.cn_node.configure_profile(None) == 0
+        send_cmds.assert_called_once_with([['stop', 'test_power']])
+
+        # Error, everything is sent again
+        send_cmds.reset_mock()
+        send_cmds.return_value = 1
+        profile_cmds.return_value = _profile_cmds(
+            ['stop', 'test_power'], ['test_consumption'], ['test_radio'])
+        assert self.cn_node.configure_profile(None) == 1
+        send_cmds.return_value = 0
+        assert self.cn_node.configure_profile(None) == 0
+        send_cmds.assert_called_with([
+            ['stop', 'test_power'], ['test_consumption'], ['test_radio']])
+
+        # Control node reset loses its configuration
+        send_cmds.reset_mock()
+        assert self.cn_node.reset() == 0
+        assert self.cn_node.configure_profile(None) == 0
+        assert len(send_cmds.call_args[0][0]) == 3
 
     def test_autotest_setup(self):
         """Test autotest setup of iotlab control node."""
@@ -159,9 +261,101 @@ class TestCnIotlab(unittest.TestCase):
         self.cn_node.protocol.start_stop.assert_called_once()
         self.cn_node.protocol.start_stop.assert_called_with('stop', 'dc')
 
+    @patch('gateway_code.control_nodes.cn_iotlab.time')
+    def test_wait_control_node_ready(self, time_mock):
+        """Test waiting control node firmware after reset."""
+        time_mock.time.side_effect = [10.0, 10.5]
+        assert self.cn_node.reset() == 0
+        self.wait_path.assert_called_with('/dev/ttyCN', True, 2.0)
+        self.assertAlmostEqual(0.7, time_mock.sleep.call_args[0][0])
+        # serial interface not used
+        assert not self.cn_node.cn_serial.start.called
+
+        # tty not present, still wait firmware start
+        time_mock.time.side_effect = [10.0, 12.0]
+        self.wait_path.return_value = False
+        assert self.cn_node.flash() == 0
+        time_mock.sleep.assert_called_with(0)
+
     def test_status(self):
         """Test status method of iotlab control node."""
         with patch('gateway_code.utils.ftdi_check.ftdi_check') as ftdi_check:
             ftdi_check.return_value = 42
             assert self.cn_node.status() == 42
             ftdi_check.assert_called_with('control', '4232')
+
+    @patch('gateway_code.control_nodes.cn_iotlab.SnifferRelay')
+    def test_sniffer_relay(self, relay_class):
+        """Test sniffer relay started for sniffer profiles."""
+        relay = relay_class.return_value
+        relay.start.return_value = 0
+        relay.stop.return_value = 0
+        relay.upstream_port = 30001
+        relay.stats.return_value = {
+            'channels': {11: {'packets': 2, 'crc_errors': 0}},
+            'dropped': 0, 'queue_high_water': 1, 'queue_size': 1024}
+        exp_files = {'sniffer_pcap': 'test.pcapng'}
+        assert self.cn_node.start('123', exp_files) == 0
+        relay_class.assert_called_with(pcap='test.pcapng')
+        assert self.cn_node.cn_serial.sniffer_port == 30001
+
+        # Not started without radio sniffer mode
+        profile = Mock(consumption=None)
+        profile.radio.mode = 'rssi'
+        assert self.cn_node.start_experiment(profile) == 0
+        assert not relay.start.called
+
+        profile.radio.mode = 'sniffer'
+        assert self.cn_node.configure_profile(profile) == 0
+        relay.start.assert_called_once()
+
+        assert self.cn_node.stop() == 0
+        relay.stop.assert_called_once()
+        assert self.cn_node.sniffer_relay is None
+
+    @patch('gateway_code.utils.sniffer_relay.SnifferRelay._listen')
+    @patch('gateway_code.utils.sniffer_relay.LOGGER')
+    @patch('gateway_code.control_nodes.cn_iotlab.LOGGER')
+    def test_sniffer_relay_bind_error(self, logger, relay_logger, listen):
+        """Test experiment started even if sniffer relay can't bind."""
+        listen.side_effect = socket.error(errno.EADDRINUSE, 'In use')
+        exp_files = {'sniffer_pcap': 'test.pcapng'}
+        assert self.cn_node.start('123', exp_files) == 0
+        profile = Mock(consumption=None)
+        profile.radio.mode = 'sniffer'
+        assert self.cn_node.start_experiment(profile) == 0
+        assert relay_logger.error.called
+        assert logger.error.called
+
+        assert self.cn_node.stop() == 0
+
+    @patch('gateway_code.control_nodes.cn_iotlab.LOGGER')
+    def test_measures_metrics(self, logger):
+        """Test measures metrics and summary logged on stop."""
+        assert self.cn_node.measures_metrics() is None
+        assert self.cn_node.start('123') == 0
+
+        profile = Mock(consumption=None)
+        profile.radio.sample_period = 1000
+        assert self.cn_node.configure_profile(profile) == 0
+        stream = self.cn_node.cn_serial.measures_stream
+        stream.handler('radio', {'timestamp_s': array('I', [1, 1, 1]),
+                                 'timestamp_us': array('I', [0, 1000, 4000]),
+                                 'channel': array('I', [11, 11, 11]),
+                                 'rssi': array('i', [-91, -91, -91])})
+
+        metrics = self.cn_node.measures_metrics()
+        radio = metrics['measures']['radio']
+        assert (radio['samples'], radio['gaps'], radio['missing']) == (3, 1, 2)
+        assert metrics['stream_lost'] == 0
+        assert metrics['feed']['subscribers'] == 0
+
+        assert self.cn_node.stop() == 0
+        logger.info.assert_any_call(
+            'Measures %s: %d samples in %d packets, %d gaps, '
+            '%d missing samples, jitter %.0fus, max interval %dus',
+            'radio', 3, 1, 1, 2, 2000.0, 3000)
+        logger.warning.assert_called_once()
+        # previous experiment metrics are not reported anymore
+        assert self.cn_node.measures_metrics() is None
+        assert self.cn_node.cn_serial.measures_stream is None
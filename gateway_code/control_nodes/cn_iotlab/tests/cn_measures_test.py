@@ -0,0 +1,112 @@
+# -*- coding:utf-8 -*-
+
+# This file is a part of IoT-LAB gateway_code
+# Copyright (C) 2015 INRIA (Contact: admin@iot-lab.info)
+# Contributor(s) : see AUTHORS file
+#
+# This software is governed by the CeCILL license under French law
+# and abiding by the rules of distribution of free software.  You can  use,
+# modify and/ or redistribute the software under the terms of the CeCILL
+# license as circulated by CEA, CNRS and INRIA at the following URL
+# http://www.cecill.info.
+#
+# As a counterpart to the access to the source code and  rights to copy,
+# modify and redistribute granted by the license, users are provided only
+# with a limited warranty  and the software's author,  the holder of the
+# economic rights,  and the successive licensors  have only  limited
+# liability.
+#
+# The fact that you are presently reading this means that you have had
+# knowledge of the CeCILL license and that you accept its terms.
+
+
+# pylint: disable=missing-docstring
+# pylint: disable=invalid-name
+# pylint: disable=protected-access
+
+import math
+import time
+import socket
+import struct
+import os.path
+import unittest
+
+import mock
+
+from .. import cn_measures
+
+
+def _datagram(m_type, seq, fmt, records):
+    data = cn_measures.HEADER.pack(m_type, len(records), seq)
+    return data + b''.join(struct.pack(fmt, *rec) for rec in records)
+
+
+class TestDecode(unittest.TestCase):
+
+    def test_decode_consumption(self):
+        data = _datagram(1, 3, '=IIfff', [(10, 1, 0.5, 3.25, float('nan')),
+                                          (10, 2, 1.5, 3.5, float('nan'))])
+        name, seq, columns = cn_measures.decode(data)
+        self.assertEqual('consumption', name)
+        self.assertEqual(3, seq)
+        self.assertEqual([10, 10], columns['timestamp_s'].tolist())
+        self.assertEqual([1, 2], columns['timestamp_us'].tolist())
+        self.assertEqual([0.5, 1.5], columns['power'].tolist())
+        self.assertEqual([3.25, 3.5], columns['voltage'].tolist())
+        self.assertTrue(all(math.isnan(c) for c in columns['current']))
+
+    def test_decode_empty(self):
+        name, _, columns = cn_measures.decode(_datagram(2, 0, '', []))
+        self.assertEqual('radio', name)
+        self.assertEqual([], columns['rssi'].tolist())
+
+    def test_decode_errors(self):
+        self.assertRaises(ValueError, cn_measures.decode, b'\x01')
+        self.assertRaises(ValueError, cn_measures.decode,
+                          _datagram(42, 0, '', []))
+        # Truncated
+        data = _datagram(2, 0, '=IIIi', [(1, 2, 11, -91)])
+        self.assertRaises(ValueError, cn_measures.decode, data[:-1])
+
+
+class TestMeasuresStream(unittest.TestCase):
+
+    def setUp(self):
+        self.handler = mock.Mock()
+        self.stream = cn_measures.MeasuresStream(self.handler)
+
+    def tearDown(self):
+        self.stream.stop()
+
+    def test_handle_datagram_lost(self):
+        radio = [(1, 2, 11, -91)]
+        self.stream.handle_datagram(_datagram(2, 4, '=IIIi', radio))
+        self.stream.handle_datagram(_datagram(2, 5, '=IIIi', radio))
+        self.assertEqual(0, self.stream.lost)
+        self.stream.handle_datagram(_datagram(2, 8, '=IIIi', radio))
+        self.assertEqual(2, self.stream.lost)
+        self.assertEqual(3, self.handler.call_count)
+
+        # Invalid datagram is dropped
+        self.stream.handle_datagram(b'\x00')
+        self.assertEqual(3, self.handler.call_count)
+
+    def test_socket(self):
+        self.stream.stop()  # not started
+        self.stream.start()
+        path = self.stream.path
+        self.assertTrue(os.path.exists(path))
+
+        sender = socket.socket(socket.AF_UNIX, socket.SOCK_DGRAM)
+        sender.sendto(_datagram(2, 0, '=IIIi', [(1, 2, 26, -80)]), path)
+        sender.close()
+
+        t_end = time.time() + 5
+        while not self.handler.called and time.time() < t_end:
+            time.sleep(0.01)
+        name, columns = self.handler.call_args[0]
+        self.assertEqual('radio', name)
+        self.assertEqual([26], columns['channel'].tolist())
+
+        self.stream.stop()
+        self.assertFalse(os.path.exists(path))
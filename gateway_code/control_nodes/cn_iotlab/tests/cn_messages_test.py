@@ -0,0 +1,109 @@
+# -*- coding: utf-8 -*-
+
+# This file is a part of IoT-LAB gateway_code
+# Copyright (C) 2015 INRIA (Contact: admin@iot-lab.info)
+# Contributor(s) : see AUTHORS file
+#
+# This software is governed by the CeCILL license under French law
+# and abiding by the rules of distribution of free software.  You can  use,
+# modify and/ or redistribute the software under the terms of the CeCILL
+# license as circulated by CEA, CNRS and INRIA at the following URL
+# http://www.cecill.info.
+#
+# As a counterpart to the access to the source code and  rights to copy,
+# modify and redistribute granted by the license, users are provided only
+# with a limited warranty  and the software's author,  the holder of the
+# economic rights,  and the successive licensors  have only  limited
+# liability.
+#
+# The fact that you are presently reading this means that you have had
+# knowledge of the CeCILL license and that you accept its terms.
+
+
+# pylint: disable=missing-docstring
+# pylint: disable=protected-access
+
+import logging
+import threading
+import unittest
+
+import mock
+from testfixtures import LogCapture
+
+from .. import cn_messages
+
+
+class TestDispatcher(unittest.TestCase):
+
+    def setUp(self):
+        self.default = mock.Mock()
+        self.dispatcher = cn_messages.Dispatcher(self.default)
+        self.log = LogCapture('gateway_code', level=logging.WARNING)
+
+    def tearDown(self):
+        self.dispatcher.stop()
+        self.log.uninstall()
+
+    def test_dispatch(self):
+        error = mock.Mock()
+        self.dispatcher.register('error', error)
+
+        self.dispatcher.dispatch('error 42')
+        self.dispatcher.dispatch('start ACK')
+        self.dispatcher.dispatch('errors')
+        error.assert_called_once_with('error 42')
+        self.assertEqual([mock.call('start ACK'), mock.call('errors')],
+                         self.default.call_args_list)
+
+        other = mock.Mock()
+        self.dispatcher.dispatch('debug line', default=other)
+        other.assert_called_once_with('debug line')
+
+    def test_queued_handler_overflow(self):
+        """ Slow handler messages dropped when queue is full """
+        handled = []
+        blocked = threading.Event()
+        running = threading.Event()
+
+        def _slow_handler(message):
+            running.set()
+            blocked.wait()
+            handled.append(message)
+
+        self.dispatcher.register('measures_debug:', _slow_handler, 2)
+        self.dispatcher.start()
+        self.dispatcher.dispatch('measures_debug: 0')
+        running.wait()
+        for num in range(1, 6):
+            self.dispatcher.dispatch('measures_debug: %d' % num)
+        # Other messages are not delayed
+        self.dispatcher.dispatch('start ACK')
+        self.default.assert_called_once_with('start ACK')
+
+        blocked.set()
+        self.dispatcher.stop()
+        self.assertEqual(['measures_debug: 0', 'measures_debug: 1',
+                          'measures_debug: 2'], handled)
+        self.assertEqual({'measures_debug:': 3}, self.dispatcher.overflows)
+        self.log.check(
+            ('gateway_code', 'WARNING',
+             'Control node measures_debug: messages dropped: 1'),
+            ('gateway_code', 'WARNING',
+             'Control node measures_debug: messages dropped: 2'))
+
+        # Restart resets counters
+        self.dispatcher.start()
+        self.assertEqual({}, self.dispatcher.overflows)
+
+    def test_queued_handler_error(self):
+        handler = mock.Mock(side_effect=[ValueError(), None])
+        self.dispatcher.register('measures_debug:', handler, 10)
+        self.dispatcher.start()
+        self.dispatcher.start()  # already started
+        self.dispatcher.dispatch('measures_debug: 1')
+        self.dispatcher.dispatch('measures_debug: 2')
+        self.dispatcher.stop()
+
+        self.assertEqual(2, handler.call_count)
+        self.assertEqual('Control node measures_debug: handler error',
+                         self.log.records[0].getMessage())
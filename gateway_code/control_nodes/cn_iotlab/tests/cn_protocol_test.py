@@ -247,3 +247,87 @@ class TestProtocolRadio(unittest.TestCase):
 
         self.sender.assert_called_with(['config_radio_stop'])
         self.assertEqual(0, ret)
+
+
+class TestProtocolBatch(unittest.TestCase):
+
+    def setUp(self):
+        self.sender = mock.Mock()
+        self.batch_sender = mock.Mock(side_effect=self._answers)
+        self.protocol = cn_protocol.Protocol(self.sender, self.batch_sender)
+        self.nack = set()
+
+    def _answers(self, commands):
+        return [[cmd[0], 'NACK' if cmd[0] in self.nack else 'ACK']
+                for cmd in commands]
+
+    def test_configure_profile(self):
+        prof = mock.Mock(power='dc', consumption=None,
+                         radio=profile.Radio('sniffer', [11]))
+
+        self.assertEqual(0, self.protocol.configure_profile('start', prof))
+        self.batch_sender.assert_called_once_with([
+            ['start', 'dc'],
+            ['config_consumption_measure', 'stop'],
+            ['config_radio_sniffer', '11', '0']])
+        self.assertFalse(self.sender.called)
+
+        # Failures are counted
+        self.nack = {'start', 'config_radio_sniffer'}
+        self.assertEqual(2, self.protocol.configure_profile('start', prof))
+
+    def test_profile_cmds_cache(self):
+        radio = profile.Radio('rssi', [26, 11], period=10, num_per_channel=1)
+        prof = mock.Mock(power='dc', consumption=None, radio=radio)
+        cmds = self.protocol.profile_cmds('start', prof)
+        self.assertEqual(list(cn_protocol.PROFILE_PARTS), list(cmds))
+        self.assertEqual([['start', 'dc'],
+                          ['config_consumption_measure', 'stop'],
+                          ['config_radio_measure', '11,26', '10', '1']],
+                         list(cmds.values()))
+
+        # Same configuration from a new profile uses cached commands
+        prof.radio = profile.Radio('rssi', [11, 26], period=10,
+                                   num_per_channel=1)
+        new_cmds = self.protocol.profile_cmds('stop', prof)
+        self.assertIs(cmds['radio'], new_cmds['radio'])
+        self.assertEqual(['stop', 'dc'], new_cmds['power'])
+
+        prof.radio = profile.Radio('rssi', [11, 26], period=20,
+                                   num_per_channel=1)
+        self.assertEqual(['config_radio_measure', '11,26', '20', '1'],
+                         self.protocol.profile_cmds('stop', prof)['radio'])
+
+        # Cache size is bounded
+        with mock.patch.object(cn_protocol, 'CMDS_CACHE_SIZE', 2):
+            prof.radio = profile.Radio('sniffer', [11])
+            self.protocol.profile_cmds('stop', prof)
+        self.assertEqual(1, len(self.protocol._cmds_cache))
+
+    def test_send_cmds(self):
+        # Missing answers
+        self.batch_sender.side_effect = None
+        self.batch_sender.return_value = [['green_led_on', 'ACK'], None]
+        ret = self.protocol.send_cmds([['green_led_on'], ['set_time']])
+        self.assertEqual(1, ret)
+
+        # One command, no batch
+        self.batch_sender.reset_mock()
+        self.sender.return_value = ['set_time', 'ACK']
+        self.assertEqual(0, self.protocol.send_cmds([['set_time']]))
+        self.sender.assert_called_with(['set_time'])
+        self.assertFalse(self.batch_sender.called)
+
+        # No batch sender
+        protocol = cn_protocol.Protocol(self.sender)
+        self.sender.side_effect = lambda cmd: [cmd[0], 'ACK']
+        self.assertEqual(0, protocol.send_cmds([['set_time'],
+                                                ['green_led_on']]))
+        self.assertEqual(3, self.sender.call_count)
+
+    def test_experiment_cmds(self):
+        self.assertEqual([['green_led_blink'], ['set_time'],
+                          ['set_node_id', 'm3', '12']],
+                         self.protocol.experiment_cmds('m3-12'))
+        self.assertEqual([['green_led_blink'], ['set_time']],
+                         self.protocol.experiment_cmds('leonardo-1'))
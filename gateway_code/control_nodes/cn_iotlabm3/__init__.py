@@ -40,16 +40,10 @@ class ControlNodeIotlabm3(ControlNodeIotlab):
     OPENOCD_CFG_FILE = static_path('iot-lab.cfg')
     OPENOCD_OPTS = (static_path('iot-lab-cn-m3.cfg'),)
 
-    @logger_call("Control node : profile configuration")
-    def configure_profile(self, profile=None):
-        """ Configure the given profile on the control node """
-        LOGGER.info('Configure profile on Control Node')
-        self.profile = profile or self.default_profile
-        ret_val = 0
-
+    def _profile_cmds(self):
+        """ Commands configuring current profile """
         # Monitoring : Radio only, ignore other fields
-        ret_val += self.protocol.config_radio(self.profile.radio)
-        return ret_val
+        return {'radio': self.protocol.radio_cmd(self.profile.radio)}
 
     @logger_call("Control node : start power of open node - Ignored")
     def open_start(self, power=None):
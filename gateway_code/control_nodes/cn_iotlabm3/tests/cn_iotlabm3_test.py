@@ -64,3 +64,9 @@ def test_configure_profile(send_cmd):
     profile.radio.mode = 'sniffer'
     assert cn_iotlabm3.configure_profile(profile) == 0
     send_cmd.assert_called_with(['config_radio_sniffer', '1,2,3', '10'])
+
+    # Radio configuration unchanged by open node power
+    send_cmd.reset_mock()
+    assert cn_iotlabm3.open_start() == 0
+    assert cn_iotlabm3.configure_profile(profile) == 0
+    assert not send_cmd.called
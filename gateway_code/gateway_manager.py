@@ -28,13 +28,16 @@ import re
 import time
 import errno
 import shutil
+import functools
 from threading import RLock, Timer
+from collections import OrderedDict
 
 import gateway_code.config as config
 from gateway_code import common
 from gateway_code.common import logger_call, wait_tty, wait_no_tty
 from gateway_code.autotest import autotest
 from gateway_code.utils import elftarget
+from gateway_code import profile_timeline
 
 import gateway_code.board_config as board_config
 
@@ -43,6 +46,48 @@ from gateway_code import gateway_logging
 LOGGER = gateway_logging.LOGGER
 
 
+def _phase_callback(func):
+    """ Decorator handling `on_phase` keyword argument
+
+    `on_phase` is called with the phases of this call only, nested calls
+    phases included. """
+    @functools.wraps(func)
+    def _wrapped(self, *args, **kwargs):
+        """ Function with `on_phase` callback """
+        on_phase = kwargs.pop('on_phase', None)
+        previous = self.phase_callback
+        if on_phase is not None:
+            self.phase_callback = on_phase
+        try:
+            return func(self, *args, **kwargs)
+        finally:
+            self.phase_callback = previous
+    return _wrapped
+
+
+def _raw_consumption(profile):
+    """ Are raw consumption measures written for `profile` experiment
+
+    >>> _raw_consumption(None)
+    True
+    """
+    if profile is None or profile.consumption is None:
+        return True
+    return profile.consumption.raw
+
+
+def _check_raw_consumption(profile, raw):
+    """ Check `profile` keeps the experiment raw consumption option
+
+    Raw measures output is chosen at experiment start.
+    :raises ValueError: if `profile` changes it """
+    if profile is None or profile.consumption is None:
+        return
+    if profile.consumption.raw != raw:
+        raise ValueError('Consumption raw option can not be changed '
+                         'during an experiment')
+
+
 class GatewayManager(object):  # pylint:disable=too-many-instance-attributes
     """ Gateway Manager class,
 
@@ -66,8 +111,18 @@ class GatewayManager(object):  # pylint:disable=too-many-instance-attributes
         self.exp_files = {}
 
         self.experiment_is_running = False
+        # raw consumption measures written for the current experiment
+        self.raw_consumption = True
         self.user_log_handler = None
         self.timeout_timer = None
+        self.profile_timeline = None
+
+        # current operation phase, listeners are called on phase change
+        self.phase = None
+        self.phase_listeners = []
+        # current call `on_phase` callback
+        self.phase_callback = None
+        self.phase_timings = {}
 
     @logger_call("Gateway Manager : Setup")
     def setup(self):
@@ -95,11 +150,33 @@ class GatewayManager(object):  # pylint:disable=too-many-instance-attributes
         """
         return re.match('^nrf52[0-9]{0,3}dk$', board) is not None
 
+    def _phase(self, name):
+        """ Set current operation phase to `name` and notify listeners
+
+        Use None when the operation is finished """
+        LOGGER.debug('Phase: %s', name)
+        self.phase = name
+        for listener in list(self.phase_listeners):
+            listener(name)
+        if self.phase_callback is not None:
+            self.phase_callback(name)
+
+    def _run_phase(self, name, func):
+        """ Run operation phase `name` and record its duration """
+        self._phase(name)
+        t_start = time.time()
+        try:
+            return func()
+        finally:
+            self.phase_timings[name] = time.time() - t_start
+
     # R0913 too many arguments 6/5
     @common.synchronous('rlock')
+    @_phase_callback
     @logger_call("Gateway Manager : Start experiment")
     def exp_start(self, user, exp_id,  # pylint: disable=R0913
-                  firmware_path=None, profile_dict=None, timeout=0):
+                  firmware_path=None, profile_dict=None, timeout=0,
+                  timeline=None):
         """
         Start an experiment
 
@@ -108,36 +185,101 @@ class GatewayManager(object):  # pylint:disable=too-many-instance-attributes
         :param firmware_path: path of the firmware file to use, can be None
         :param profile_dict: monitoring profile
         :param timeout: Experiment expiration timeout. On 0 no timeout.
+        :param timeline: [offset, profile_dict] entries, profiles applied
+            at offset seconds after experiment start
+        :param on_phase: called with this call phases names
 
-        Experiment start steps
+        Experiment start steps, run as phases
 
-        1) Prepare Gateway: User experiment files and log:
-        2) Prepare Control node: Start communication and power on open node
-        3) Prepare Open node: Check OK, setup firmware and serial redirection
-        4) Configure Control Node Profile and experiment
-        5) Set Experiment expiration timer
+        1) Validate profile and firmware, nothing is created on error
+        2) Prepare Gateway: User experiment files and log
+        3) Prepare Control node: Start communication and power on open node
+        4) Prepare Open node: Check OK, setup firmware and serial redirection
+        5) Configure Control Node Profile and experiment
+        6) Set Experiment expiration timer and start profile timeline
 
         """
         if self.experiment_is_running:
             LOGGER.debug('Experiment running. Stop previous experiment')
             self.exp_stop()
 
+        exp = {'user': user, 'exp_id': exp_id, 'firmware': firmware_path}
+        validation = [
+            ('profile', functools.partial(self._exp_profile, exp,
+                                          profile_dict, timeline)),
+            ('firmware_check', functools.partial(self._exp_firmware_check,
+                                                 exp)),
+        ]
+        setup = [
+            ('exp_files', functools.partial(self._exp_files, exp)),
+            ('control_node_start', functools.partial(
+                self._exp_control_node_start, exp)),
+        ]
+        # with Pycom boards, trigger 2 power-cycle to ensure REPL is correctly
+        # started
+        if self.open_node.TYPE == 'pycom':
+            setup.append(('open_node_power_cycle',
+                          self._exp_pycom_power_cycle))
+        setup += [
+            ('open_node_setup', functools.partial(self.open_node.setup,
+                                                  firmware_path)),
+            ('control_node_experiment', functools.partial(
+                self._exp_control_node_experiment, exp)),
+        ]
+
+        self.phase_timings = OrderedDict()
         try:
-            profile = self.board_cfg.profile_from_dict(profile_dict)
+            for name, func in validation:
+                if self._run_phase(name, func):
+                    return 1
+            ret_val = 0
+            for name, func in setup:
+                ret_val += self._run_phase(name, func)
+        finally:
+            self._phase(None)
+        LOGGER.debug('Phases timings: %s', ', '.join(
+            '%s=%.3fs' % item for item in self.phase_timings.items()))
+
+        if timeout != 0:
+            LOGGER.debug("Setting timeout to: %d", timeout)
+            self.timeout_timer = Timer(timeout, self._timeout_exp_stop,
+                                       args=(exp_id, user))
+            self.timeout_timer.start()
+        if exp['timeline']:
+            LOGGER.debug("Starting profile timeline: %d entries",
+                         len(exp['timeline']))
+            # Not applied with 'rlock', user requests stay available
+            self.profile_timeline = profile_timeline.ProfileTimeline(
+                exp['timeline'], self.control_node.configure_profile)
+            self.profile_timeline.start()
+        LOGGER.info("Start experiment succeeded")
+        return ret_val
+
+    def _exp_profile(self, exp, profile_dict, timeline=None):
+        """ exp_start phase: Parse experiment profile and timeline """
+        try:
+            exp['profile'] = self.board_cfg.profile_from_dict(profile_dict)
+            exp['timeline'] = profile_timeline.parse(
+                timeline or [], self.board_cfg.profile_from_dict)
+            raw = _raw_consumption(exp['profile'])
+            for _, entry_profile in exp['timeline']:
+                _check_raw_consumption(entry_profile, raw)
         except ValueError as err:
             LOGGER.error('%r', err)
             return 1
-        if not elftarget.is_compatible_with_node(firmware_path,
+        return 0
+
+    def _exp_firmware_check(self, exp):
+        """ exp_start phase: Check firmware target """
+        if not elftarget.is_compatible_with_node(exp['firmware'],
                                                  self.open_node):
             LOGGER.error('Invalid firmware target, aborting experiment.')
             return 1
+        return 0
 
-        ret_val = 0
-
-        self.experiment_is_running = True
-        self.exp_id = exp_id
-        self.user = user
-
+    def _exp_files(self, exp):
+        """ exp_start phase: Create user experiment files """
+        user, exp_id = exp['user'], exp['exp_id']
         if (self.board_cfg.robot_type == 'turtlebot2' or
                 self.board_cfg.cn_class.TYPE == 'no'):  # pragma: no cover
             LOGGER.info('Create user exp folder')
@@ -145,45 +287,52 @@ class GatewayManager(object):  # pylint:disable=too-many-instance-attributes
 
         self.exp_files = self.create_user_exp_files(self.board_cfg.node_id,
                                                     user, exp_id)
+        return 0
+
+    def _exp_control_node_start(self, exp):
+        """ exp_start phase: Start experiment user log and control node """
+        self.experiment_is_running = True
+        self.exp_id = exp['exp_id']
+        self.user = exp['user']
 
         # Create user log
         self.user_log_handler = gateway_logging.user_logger(
             self.exp_files['log'])
         LOGGER.addHandler(self.user_log_handler)
-        LOGGER.info('Start experiment: %s-%i', user, exp_id)
+        LOGGER.info('Start experiment: %s-%i', self.user, self.exp_id)
 
         # Init ControlNode
-        ret_val += self.control_node.start(self.exp_id, self.exp_files)
+        exp_files = self.exp_files
+        self.raw_consumption = _raw_consumption(exp['profile'])
+        if not self.raw_consumption:
+            # Only aggregated consumption measures are kept, the raw
+            # option can't be changed until the experiment stops
+            exp_files = dict(exp_files, consumption=os.devnull)
+        return self.control_node.start(self.exp_id, exp_files)
+
+    def _exp_pycom_power_cycle(self):
+        """ exp_start phase: Power cycle pycom board twice """
+        ret_val = 0
+        for _ in range(2):
+            LOGGER.debug("Power cycle %s board", self.open_node.TYPE)
+            ret_val += self.control_node.open_stop()
+            ret_val += wait_no_tty(self.open_node.TTY, timeout=10)
+            ret_val += self.control_node.open_start()
+            ret_val += wait_tty(self.open_node.TTY, LOGGER, timeout=10)
+        return ret_val
 
-        # with Pycom boards, trigger 2 power-cycle to ensure REPL is correctly
-        # started
-        if self.open_node.TYPE == 'pycom':
-            for _ in range(2):
-                LOGGER.debug("Power cycle %s board", self.open_node.TYPE)
-                ret_val += self.control_node.open_stop()
-                ret_val += wait_no_tty(self.open_node.TTY, timeout=10)
-                ret_val += self.control_node.open_start()
-                ret_val += wait_tty(self.open_node.TTY, LOGGER, timeout=10)
-        # Configure Open Node
-        ret_val += self.open_node.setup(firmware_path)
-        # Configure experiment and monitoring on ControlNode
-        ret_val += self.control_node.start_experiment(profile)
+    def _exp_control_node_experiment(self, exp):
+        """ exp_start phase: Configure experiment and monitoring """
+        ret_val = self.control_node.start_experiment(exp['profile'])
 
         # nrf52dk and nrf52840dk needs a power cycle before their serial
         # becomes fully usable.
-        if (firmware_path is not None and
+        if (exp['firmware'] is not None and
                 self._board_require_power_cycle(self.open_node.TYPE)):
             LOGGER.info("Power cycle node %s",
                         self.control_node.node_id.replace('_', '-'))
             ret_val += self.control_node.open_stop()
             ret_val += self.control_node.open_start()
-
-        if timeout != 0:
-            LOGGER.debug("Setting timeout to: %d", timeout)
-            self.timeout_timer = Timer(timeout, self._timeout_exp_stop,
-                                       args=(exp_id, user))
-            self.timeout_timer.start()
-        LOGGER.info("Start experiment succeeded")
         return ret_val
 
     @common.synchronous('rlock')
@@ -207,14 +356,17 @@ class GatewayManager(object):  # pylint:disable=too-many-instance-attributes
             raise
 
     @common.synchronous('rlock')
+    @_phase_callback
     @logger_call("Gateway Manager : Stop experiment")
     def exp_stop(self):
         """
         Stop the current running experiment
 
+        :param on_phase: called with this call phases names
+
         Experiment stop steps
 
-        1) Clear expiration timeout
+        1) Clear expiration timeout and profile timeline
         2) Stop OpenNode experiment and reset profile
         3) Cleanup OpenNode
         4) Stop control node
@@ -229,18 +381,23 @@ class GatewayManager(object):  # pylint:disable=too-many-instance-attributes
         if self.timeout_timer is not None:
             self.timeout_timer.cancel()
             self.timeout_timer = None
+        self._stop_profile_timeline()
 
         # Cleanup Control node Monitoring and experiment #
+        self._phase('control_node_stop_experiment')
         ret_val += self.control_node.stop_experiment()
         # Pycom TTY must be available before it's teared down.
         if self.open_node.TYPE == 'pycom':
             wait_tty(self.open_node.TTY, LOGGER, timeout=10)
         # Cleanup open node
+        self._phase('open_node_teardown')
         ret_val += self.open_node.teardown()
         # Stop control node interaction
+        self._phase('control_node_stop')
         self.control_node.stop()
 
         # Remove empty user experiment files
+        self._phase('exp_files_cleanup')
         self.cleanup_user_exp_files(self.exp_files)
         self.exp_files = {}
 
@@ -248,6 +405,8 @@ class GatewayManager(object):  # pylint:disable=too-many-instance-attributes
         self.exp_id = None
         self.user = None
         self.experiment_is_running = False
+        self.raw_consumption = True
+        self._phase(None)
 
         LOGGER.info("Stop experiment succeeded")
         LOGGER.removeHandler(self.user_log_handler)
@@ -255,17 +414,32 @@ class GatewayManager(object):  # pylint:disable=too-many-instance-attributes
 
         return ret_val
 
+    def _stop_profile_timeline(self):
+        """ Stop profile timeline, wait for the entry being applied """
+        if self.profile_timeline is None:
+            return
+        self.profile_timeline.stop()
+        self.profile_timeline.join()
+        self.profile_timeline = None
+
     @common.synchronous('rlock')
     def exp_update_profile(self, profile_dict):
-        """ Update the experiment profile """
+        """ Update the experiment profile
+
+        A manual profile update stops the experiment profile timeline """
         LOGGER.info('Update experiment profile')
 
         try:
             profile = self.board_cfg.profile_from_dict(profile_dict)
+            if self.experiment_is_running:
+                _check_raw_consumption(profile, self.raw_consumption)
         except ValueError as err:
             LOGGER.error('%r', err)
             ret = 1
         else:
+            if self.profile_timeline is not None:
+                LOGGER.info('Profile timeline stopped by profile update')
+                self._stop_profile_timeline()
             ret = self.control_node.configure_profile(profile)
 
         if ret != 0:  # pragma: no cover
@@ -355,6 +529,28 @@ class GatewayManager(object):  # pylint:disable=too-many-instance-attributes
             LOGGER.error('Flash firmware failed on %s node: %d', node, ret)
         return ret
 
+    def subscribe_measures(self, **filters):
+        """ Subscribe to the running experiment live measures
+
+        Not locked, it does not interact with the nodes.
+
+        :returns: a measures subscription, None if no experiment is running
+        """
+        if not self.experiment_is_running:
+            return None
+        return self.control_node.subscribe_measures(**filters)
+
+    def measures_metrics(self):
+        """ Running experiment measures pipeline quality metrics
+
+        Not locked, it does not interact with the nodes.
+
+        :returns: metrics dict, None if no experiment is running
+        """
+        if not self.experiment_is_running:
+            return None
+        return self.control_node.measures_metrics()
+
     @common.synchronous('rlock')
     def auto_tests(self, channel, blink, flash, gps):
         """ Run Auto-tests on nodes and gateway """
@@ -364,6 +560,13 @@ class GatewayManager(object):  # pylint:disable=too-many-instance-attributes
     @common.synchronous('rlock')
     def status(self):
         """ Run a node sanity status check """
+        return self.nodes_status()
+
+    def nodes_status(self):
+        """ Run nodes sanity status checks without taking `rlock`
+
+        Checks only list ftdi devices, they can run concurrently with
+        experiment operations. """
         ret = 0
         ret += self.control_node.status()
         ret += self.open_node.status()
@@ -406,9 +609,9 @@ class GatewayManager(object):  # pylint:disable=too-many-instance-attributes
         Also useful for integration tests
         """
         exp_files_dir = config.EXP_FILES_DIR.format(user=user, exp_id=exp_id)
-        for file_dir in config.EXP_FILES:
+        for exp_file in config.EXP_FILES.values():
             try:
-                os.makedirs(exp_files_dir + file_dir)
+                os.makedirs(exp_files_dir + os.path.dirname(exp_file))
             except OSError:
                 pass
 
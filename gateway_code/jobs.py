@@ -0,0 +1,176 @@
+# -*- coding: utf-8 -*-
+
+# This file is a part of IoT-LAB gateway_code
+# Copyright (C) 2015 INRIA (Contact: admin@iot-lab.info)
+# Contributor(s) : see AUTHORS file
+#
+# This software is governed by the CeCILL license under French law
+# and abiding by the rules of distribution of free software.  You can  use,
+# modify and/ or redistribute the software under the terms of the CeCILL
+# license as circulated by CEA, CNRS and INRIA at the following URL
+# http://www.cecill.info.
+#
+# As a counterpart to the access to the source code and  rights to copy,
+# modify and redistribute granted by the license, users are provided only
+# with a limited warranty  and the software's author,  the holder of the
+# economic rights,  and the successive licensors  have only  limited
+# liability.
+#
+# The fact that you are presently reading this means that you have had
+# knowledge of the CeCILL license and that you accept its terms.
+
+
+""" Background jobs for long gateway manager operations
+
+A job runs a gateway manager method in its own thread and records the
+phases it goes through and its final return value.
+"""
+
+import time
+import errno
+import itertools
+import threading
+from collections import OrderedDict
+
+import logging
+LOGGER = logging.getLogger('gateway_code')
+
+
+class Job(object):  # pylint:disable=too-many-instance-attributes
+    """ Gateway manager operation running in background """
+    PENDING = 'pending'
+    RUNNING = 'running'
+    DONE = 'done'
+    ERROR = 'error'
+
+    def __init__(self, job_id, name, func, *args, **kwargs):
+        self.job_id = job_id
+        self.name = name
+        self.state = self.PENDING
+        self.ret = None
+        self.error = None
+        self.phases = []
+        self.created = time.time()
+
+        self._func = func
+        self._args = args
+        self._kwargs = kwargs
+        self._cleanup = []
+        self._thread = threading.Thread(target=self._target)
+        self._thread.daemon = True
+
+    def add_cleanup(self, func):
+        """ Register `func` to be called when the job terminates """
+        self._cleanup.append(func)
+
+    def follow_phases(self, kwarg='on_phase'):
+        """ Record phases of the job call only
+
+        `phase_update` is given to the job function as `kwarg` callback """
+        self._kwargs[kwarg] = self.phase_update
+
+    def start(self):
+        """ Start running the job in background """
+        self._thread.start()
+
+    def join(self, timeout=None):
+        """ Wait for the job to terminate """
+        self._thread.join(timeout)
+
+    @property
+    def phase(self):
+        """ Current phase name, None if no phase started """
+        return self.phases[-1]['name'] if self.phases else None
+
+    def phase_update(self, name):
+        """ Record the start of phase `name` """
+        now = time.time()
+        self._phase_end(now)
+        self.phases.append({'name': name, 'start': now, 'duration': None})
+
+    def _phase_end(self, now):
+        """ Set the duration of the current phase """
+        if self.phases and self.phases[-1]['duration'] is None:
+            self.phases[-1]['duration'] = now - self.phases[-1]['start']
+
+    def _target(self):
+        """ Thread worker, run function and save its result """
+        self.state = self.RUNNING
+        try:
+            self.ret = self._func(*self._args, **self._kwargs)
+            self.state = self.DONE
+        except EnvironmentError as err:
+            self.state = self.ERROR
+            if err.errno == errno.EWOULDBLOCK:
+                self.error = 'Gateway manager busy'
+            else:
+                self.error = str(err)
+            LOGGER.error('Job %s-%d: %s', self.name, self.job_id, self.error)
+        except Exception as err:  # pylint:disable=broad-except
+            self.state = self.ERROR
+            self.error = repr(err)
+            LOGGER.exception('Job %s-%d failed', self.name, self.job_id)
+        finally:
+            self._phase_end(time.time())
+            for func in self._cleanup:
+                func()
+
+    @property
+    def finished(self):
+        """ Job has terminated """
+        return self.state in (self.DONE, self.ERROR)
+
+    def as_dict(self):
+        """ Job description, usable as REST answer """
+        return {
+            'id': self.job_id,
+            'name': self.name,
+            'state': self.state,
+            'phase': self.phase,
+            'phases': [dict(phase) for phase in self.phases],
+            'ret': self.ret,
+            'error': self.error,
+            'created': self.created,
+        }
+
+
+class JobManager(object):
+    """ Create jobs and keep the last `history` ones
+
+    Finished jobs are forgotten first, unfinished ones are only forgotten
+    when there are more than `history` of them. """
+    HISTORY = 32
+
+    def __init__(self, history=HISTORY):
+        self.history = history
+        self.jobs = OrderedDict()
+        self._ids = itertools.count(1)
+        self._lock = threading.Lock()
+
+    def submit(self, name, func, *args, **kwargs):
+        """ Create a job running `func(*args, **kwargs)`, not started """
+        with self._lock:
+            job = Job(next(self._ids), name, func, *args, **kwargs)
+            self.jobs[job.job_id] = job
+            self._prune()
+        return job
+
+    def _prune(self):
+        """ Forget oldest jobs when above history size, finished first """
+        finished = [job_id for job_id, job in self.jobs.items()
+                    if job.finished]
+        while len(self.jobs) > self.history and finished:
+            del self.jobs[finished.pop(0)]
+        while len(self.jobs) > self.history:
+            _, job = self.jobs.popitem(last=False)
+            LOGGER.warning('Job %s-%d forgotten while %s', job.name,
+                           job.job_id, job.state)
+
+    def get(self, job_id):
+        """ Return job `job_id` or None """
+        return self.jobs.get(job_id)
+
+    def as_list(self):
+        """ Description of all known jobs """
+        with self._lock:
+            return [job.as_dict() for job in self.jobs.values()]
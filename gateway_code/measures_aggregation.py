@@ -0,0 +1,227 @@
+# -*- coding: utf-8 -*-
+
+# This file is a part of IoT-LAB gateway_code
+# Copyright (C) 2015 INRIA (Contact: admin@iot-lab.info)
+# Contributor(s) : see AUTHORS file
+#
+# This software is governed by the CeCILL license under French law
+# and abiding by the rules of distribution of free software.  You can  use,
+# modify and/ or redistribute the software under the terms of the CeCILL
+# license as circulated by CEA, CNRS and INRIA at the following URL
+# http://www.cecill.info.
+#
+# As a counterpart to the access to the source code and  rights to copy,
+# modify and redistribute granted by the license, users are provided only
+# with a limited warranty  and the software's author,  the holder of the
+# economic rights,  and the successive licensors  have only  limited
+# liability.
+#
+# The fact that you are presently reading this means that you have had
+# knowledge of the CeCILL license and that you accept its terms.
+
+
+""" Gateway side aggregation of consumption measures
+
+Consumption measures received from the control node, see `cn_measures`,
+are aggregated incrementally over windows aligned on their timestamps.
+Each window gives the number of measures, min, max and mean of power,
+voltage and current, and the energy and charge integrals.
+
+Windows are written as lines of an OML text file, the
+'consumption_aggregate' experiment file, with the same format as the
+control node measures files so it can be read with `utils.oml_reader`.
+"""
+
+import math
+import logging
+import threading
+from bisect import bisect_left
+
+LOGGER = logging.getLogger('gateway_code')
+
+FIELDS = ('power', 'voltage', 'current')
+STATS = ('min', 'max', 'mean')
+SCHEMA = 'control_node_measures_consumption_aggregate'
+OML_HEADER = '''protocol: 5
+domain: {exp_id}
+start-time: {start_time}
+sender-id: {node_id}
+app-name: control_node_measures
+schema: 0 _experiment_metadata subject:string key:string value:string
+schema: 1 {schema} timestamp_s:uint32 timestamp_us:uint32 window:double \
+count:uint32 {stats} energy:double charge:double
+content: text
+
+'''
+NAN = float('nan')
+
+
+class Window(object):  # pylint:disable=too-few-public-methods
+    """ Aggregated values of one window
+
+    >>> window = Window(10, 1.0)
+    >>> window.add({'power': [1.0, 3.0], 'voltage': [NAN, NAN],
+    ...             'current': [0.5, 0.5]}, 0, 2, [0.5, 0.5])
+    >>> window.count, window.values('power'), window.values('voltage')
+    (2, (1.0, 3.0, 2.0), (nan, nan, nan))
+    >>> window.energy, window.charge
+    (2.0, 0.5)
+    """
+
+    def __init__(self, index, length):
+        self.index = index
+        self.length = length
+        self.count = 0
+        self.energy = 0.0
+        self.charge = 0.0
+        self._stats = dict((field, None) for field in FIELDS)
+
+    @property
+    def start(self):
+        """ Window start time """
+        return self.index * self.length
+
+    def add(self, columns, start, stop, intervals):
+        """ Add measures columns rows [start, stop[
+
+        :param intervals: time since previous measure for these rows """
+        for field in FIELDS:
+            values = columns[field][start:stop]
+            if math.isnan(values[0]):  # not measured
+                continue
+            stats = self._stats[field]
+            if stats is None:
+                stats = [values[0], values[0], 0.0]
+                self._stats[field] = stats
+            low, high = min(values), max(values)
+            stats[0] = min(stats[0], low)
+            stats[1] = max(stats[1], high)
+            stats[2] += math.fsum(values)
+        self.count += stop - start
+        self.energy += self._integral(columns['power'][start:stop], intervals)
+        self.charge += self._integral(columns['current'][start:stop],
+                                      intervals)
+
+    @staticmethod
+    def _integral(values, intervals):
+        """ Sum of values multiplied by the time since previous measure """
+        return math.fsum(value * interval
+                         for value, interval in zip(values, intervals))
+
+    def values(self, field):
+        """ (min, max, mean) of `field`, nan if not measured """
+        stats = self._stats[field]
+        if stats is None:
+            return (NAN, NAN, NAN)
+        return (stats[0], stats[1], stats[2] / self.count)
+
+
+# pylint:disable=too-many-instance-attributes
+class ConsumptionAggregation(object):
+    """ Aggregate consumption measures and write windows to `path`
+
+    The file is only written when aggregation is configured.
+
+    :param path: aggregated measures OML file
+    """
+
+    def __init__(self, path, node_id, exp_id):
+        self.path = path
+        self.node_id = node_id
+        self.exp_id = exp_id
+        self.window = None
+        self._lock = threading.Lock()
+        self._file = None
+        self._start_time = None
+        self._seq = 0
+        self._current = None
+        self._last_time = None
+
+    def configure(self, window=None):
+        """ Set aggregation `window` in seconds, None to disable """
+        with self._lock:
+            self._flush()
+            self.window = window
+            self._last_time = None
+
+    def add(self, columns):
+        """ Aggregate consumption measures columns """
+        with self._lock:
+            if self.window is None or not columns['power']:
+                return
+            # Integer microseconds so windows limits are exact
+            window = int(round(self.window * 1e6))
+            measures_times = [sec * 1000000 + usec for sec, usec in zip(
+                columns['timestamp_s'], columns['timestamp_us'])]
+            intervals = self._intervals(measures_times)
+            start = 0
+            while start < len(measures_times):
+                index = measures_times[start] // window
+                if self._current is None or self._current.index != index:
+                    self._flush()
+                    self._current = Window(index, self.window)
+                stop = max(start + 1, bisect_left(
+                    measures_times, (index + 1) * window, start))
+                self._current.add(columns, start, stop,
+                                  intervals[start:stop])
+                start = stop
+
+    def _intervals(self, measures_times):
+        """ Seconds since previous measure, 0 for the first one """
+        previous = [self._last_time] + measures_times[:-1]
+        self._last_time = measures_times[-1]
+        return [0.0 if prev is None else max(0, cur - prev) / 1e6
+                for prev, cur in zip(previous, measures_times)]
+
+    def close(self):
+        """ Write current window and close the file """
+        with self._lock:
+            self._flush()
+            self.window = None
+            if self._file is not None:
+                self._file.close()
+                self._file = None
+
+    def _flush(self):
+        """ Write current window """
+        window, self._current = self._current, None
+        if window is None or not window.count:
+            return
+        try:
+            self._write(window)
+        except IOError as err:
+            LOGGER.error('Consumption aggregation write failed: %r', err)
+
+    def _write(self, window):
+        """ Write `window` as an OML text line """
+        if self._file is None:
+            self._start_time = int(window.start)
+            self._file = open(self.path, 'w')
+            stats = ' '.join('%s_%s:double' % (field, stat)
+                             for field in FIELDS for stat in STATS)
+            self._file.write(OML_HEADER.format(
+                exp_id=self.exp_id, start_time=self._start_time,
+                node_id=self.node_id, schema=SCHEMA, stats=stats))
+
+        self._seq += 1
+        seconds = int(window.start)
+        values = [window.start - self._start_time, 1, self._seq,
+                  seconds, int(round((window.start - seconds) * 1e6)),
+                  window.length, window.count]
+        for field in FIELDS:
+            values.extend(window.values(field))
+        values.extend([window.energy, window.charge])
+        self._file.write('\t'.join(_format(value) for value in values) +
+                         '\n')
+        self._file.flush()
+
+
+def _format(value):
+    """ OML text value
+
+    >>> _format(12), _format(0.1), _format(NAN)
+    ('12', '0.1', 'nan')
+    """
+    if isinstance(value, int):
+        return str(value)
+    return '%.9g' % value
@@ -0,0 +1,231 @@
+# -*- coding: utf-8 -*-
+
+# This file is a part of IoT-LAB gateway_code
+# Copyright (C) 2015 INRIA (Contact: admin@iot-lab.info)
+# Contributor(s) : see AUTHORS file
+#
+# This software is governed by the CeCILL license under French law
+# and abiding by the rules of distribution of free software.  You can  use,
+# modify and/ or redistribute the software under the terms of the CeCILL
+# license as circulated by CEA, CNRS and INRIA at the following URL
+# http://www.cecill.info.
+#
+# As a counterpart to the access to the source code and  rights to copy,
+# modify and redistribute granted by the license, users are provided only
+# with a limited warranty  and the software's author,  the holder of the
+# economic rights,  and the successive licensors  have only  limited
+# liability.
+#
+# The fact that you are presently reading this means that you have had
+# knowledge of the CeCILL license and that you accept its terms.
+
+
+""" Live measures feed for the running experiment
+
+Control node measures are published as columns dicts, see
+`cn_measures.decode`. Each subscriber gets them through a bounded queue,
+a slow subscriber drops measures instead of blocking the control node
+reader. Subscribers read frames: measures received during a period, merged,
+filtered and decimated.
+"""
+
+import math
+import time
+import threading
+from itertools import compress
+from array import array
+
+try:
+    import Queue as queue
+except ImportError:
+    import queue
+
+QUEUE_SIZE = 1024
+FRAME_PERIOD = 1.0
+TIMESTAMP_FIELDS = ('timestamp_s', 'timestamp_us')
+
+
+class MeasuresFeed(object):
+    """ Publish measures to subscribers """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._subscribers = []
+
+    def subscribe(self, **filters):
+        """ Return a new subscription, see `Subscription` for filters """
+        subscription = Subscription(self, **filters)
+        with self._lock:
+            self._subscribers.append(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription):
+        """ Remove `subscription` """
+        with self._lock:
+            if subscription in self._subscribers:
+                self._subscribers.remove(subscription)
+
+    def publish(self, name, columns):
+        """ Send `name` measures columns to all subscribers """
+        with self._lock:
+            subscribers = list(self._subscribers)
+        for subscription in subscribers:
+            subscription.put((name, columns))
+
+    def stats(self):
+        """ Subscribers count, dropped measures and queues high water """
+        with self._lock:
+            subscribers = list(self._subscribers)
+        return {'subscribers': len(subscribers),
+                'dropped': sum(sub.dropped for sub in subscribers),
+                'queue_high_water': max([sub.high_water
+                                         for sub in subscribers] or [0]),
+                'queue_size': QUEUE_SIZE}
+
+    def close(self):
+        """ End all subscriptions """
+        with self._lock:
+            subscribers, self._subscribers = self._subscribers, []
+        for subscription in subscribers:
+            subscription.put(None)
+
+
+class Subscription(object):  # pylint:disable=too-many-instance-attributes
+    """ Measures subscription
+
+    :param types: measures types names to receive, all if None
+    :param fields: values fields to keep, all if None
+    :param channels: radio channels to keep, all if None
+    :param rate: maximum samples per second for each type, no limit if None
+    """
+
+    def __init__(self, feed, types=None, fields=None, channels=None,
+                 rate=None):
+        # pylint:disable=too-many-arguments
+        self.feed = feed
+        self.types = set(types) if types else None
+        self.fields = set(fields) if fields else None
+        self.channels = set(channels) if channels else None
+        self.rate = rate
+        self.dropped = 0
+        self.high_water = 0
+        self.closed = False
+        self._queue = queue.Queue(QUEUE_SIZE)
+
+    def put(self, item):
+        """ Queue item without blocking, count it as dropped if full """
+        if item is not None and self.types and item[0] not in self.types:
+            return
+        try:
+            self._queue.put_nowait(item)
+            self.high_water = max(self.high_water, self._queue.qsize())
+        except queue.Full:
+            if item is None:  # make room for the end marker
+                self._drain()
+                self._queue.put_nowait(None)
+            else:
+                self.dropped += 1
+
+    def _drain(self):
+        """ Remove queued items """
+        try:
+            while True:
+                self._queue.get_nowait()
+        except queue.Empty:
+            pass
+
+    def cancel(self):
+        """ Unsubscribe from the feed """
+        self.feed.unsubscribe(self)
+        self.closed = True
+
+    def frame(self, period=FRAME_PERIOD):
+        """ Wait `period` and return measures received in the meantime
+
+        :returns: dict of columns dict for each measures type, None when the
+            feed is closed """
+        t_end = time.time() + period
+        received = {}
+        while not self.closed:
+            try:
+                item = self._queue.get(timeout=max(0, t_end - time.time()))
+            except queue.Empty:
+                break
+            if item is None:
+                self.closed = True
+                break
+            name, columns = item
+            received.setdefault(name, []).append(columns)
+
+        frame = dict((name, self._select(name, merge(columns_list)))
+                     for name, columns_list in received.items())
+        if self.closed and not frame:
+            return None
+        return frame
+
+    def _select(self, name, columns):
+        """ Filter and decimate columns """
+        if name == 'radio' and self.channels is not None:
+            columns = filter_rows(columns, [channel in self.channels
+                                            for channel in columns['channel']])
+        columns = decimate(columns, self.rate)
+        return dict((field, values) for field, values in columns.items()
+                    if self._keep_field(field, values))
+
+    def _keep_field(self, field, values):
+        """ Keep timestamps, selected fields and not measured fields """
+        if field in TIMESTAMP_FIELDS:
+            return True
+        if self.fields is not None and field not in self.fields:
+            return False
+        # not configured consumption values are NaN
+        return not (values and isinstance(values[0], float) and
+                    math.isnan(values[0]))
+
+
+def merge(columns_list):
+    """ Concatenate columns dicts
+
+    >>> merged = merge([{'rssi': array('i', [1])}, {'rssi': array('i', [2])}])
+    >>> merged['rssi'].tolist()
+    [1, 2]
+    """
+    merged = dict((field, array(values.typecode, values))
+                  for field, values in columns_list[0].items())
+    for columns in columns_list[1:]:
+        for field, values in columns.items():
+            merged[field].extend(values)
+    return merged
+
+
+def filter_rows(columns, mask):
+    """ Keep rows where `mask` is True
+
+    >>> filter_rows({'channel': array('I', [11, 26])}, [False, True])
+    {'channel': array('I', [26])}
+    """
+    return dict((field, array(values.typecode, compress(values, mask)))
+                for field, values in columns.items())
+
+
+def decimate(columns, rate):
+    """ Keep one row every N to get at most `rate` rows per second
+
+    >>> cols = {'timestamp_s': array('I', [0, 0, 0, 0, 1]),
+    ...         'timestamp_us': array('I', [0, 250000, 500000, 750000, 0])}
+    >>> decimate(cols, 2)['timestamp_us']
+    array('I', [0, 500000, 0])
+    >>> decimate(cols, None) is cols
+    True
+    """
+    seconds = columns.get('timestamp_s')
+    if not rate or not seconds or len(seconds) < 2:
+        return columns
+    usecs = columns['timestamp_us']
+    duration = (seconds[-1] - seconds[0]) + (usecs[-1] - usecs[0]) / 1e6
+    if duration <= 0:
+        return columns
+    step = int(math.ceil((len(seconds) - 1) / (duration * rate)))
+    if step <= 1:
+        return columns
+    return dict((field, values[::step]) for field, values in columns.items())
@@ -0,0 +1,140 @@
+# -*- coding: utf-8 -*-
+
+# This file is a part of IoT-LAB gateway_code
+# Copyright (C) 2015 INRIA (Contact: admin@iot-lab.info)
+# Contributor(s) : see AUTHORS file
+#
+# This software is governed by the CeCILL license under French law
+# and abiding by the rules of distribution of free software.  You can  use,
+# modify and/ or redistribute the software under the terms of the CeCILL
+# license as circulated by CEA, CNRS and INRIA at the following URL
+# http://www.cecill.info.
+#
+# As a counterpart to the access to the source code and  rights to copy,
+# modify and redistribute granted by the license, users are provided only
+# with a limited warranty  and the software's author,  the holder of the
+# economic rights,  and the successive licensors  have only  limited
+# liability.
+#
+# The fact that you are presently reading this means that you have had
+# knowledge of the CeCILL license and that you accept its terms.
+
+
+""" Quality metrics of the experiment measures pipeline
+
+Measures received from the control node, see `cn_measures`, are checked
+against the configured profile: samples and packets are counted per
+measures type, and timestamps intervals give gaps, where samples were
+lost between the control node and the gateway, and jitter.
+
+Lost datagrams and queues usage of the other pipeline stages are added
+by the control node, see `ControlNodeIotlab.measures_metrics`.
+"""
+
+import threading
+
+GAP_FACTOR = 2.0
+
+
+def sample_periods(profile):
+    """ Expected measures period in microseconds for each measures type """
+    periods = {}
+    for name in ('consumption', 'radio'):
+        monitoring = getattr(profile, name, None)
+        if monitoring is not None and monitoring.sample_period:
+            periods[name] = monitoring.sample_period
+    return periods
+
+
+class TypeMetrics(object):  # pylint:disable=too-many-instance-attributes
+    """ Metrics of one measures type
+
+    >>> metrics = TypeMetrics()
+    >>> metrics.reset_period(1000)
+    >>> metrics.add([0, 1000, 2000, 5000, 6100])
+    >>> summary = metrics.summary()
+    >>> summary['gaps'], summary['missing'], summary['max_interval_us']
+    (1, 2, 3000)
+    >>> summary['jitter_us']
+    1300.0
+    """
+
+    def __init__(self):
+        self.packets = 0
+        self.samples = 0
+        self.gaps = 0
+        self.missing = 0
+        self.period = None
+        self.max_interval = 0
+        self._jitter_sum = 0
+        self._jitter_count = 0
+        self._last = None
+        self._last_interval = None
+
+    def reset_period(self, period):
+        """ Expected period changed, next interval is not checked """
+        self.period = period
+        self._last = None
+        self._last_interval = None
+
+    def add(self, times):
+        """ Add a packet of measures `times` in microseconds """
+        self.packets += 1
+        self.samples += len(times)
+        period = self.period
+        last, last_interval = self._last, self._last_interval
+        for timestamp in times:
+            if last is not None:
+                interval = timestamp - last
+                self.max_interval = max(self.max_interval, interval)
+                if period and interval > GAP_FACTOR * period:
+                    self.gaps += 1
+                    self.missing += int(round(float(interval) / period)) - 1
+                if last_interval is not None:
+                    self._jitter_sum += abs(interval - last_interval)
+                    self._jitter_count += 1
+                last_interval = interval
+            last = timestamp
+        self._last, self._last_interval = last, last_interval
+
+    def summary(self):
+        """ Metrics dict """
+        jitter = (float(self._jitter_sum) / self._jitter_count
+                  if self._jitter_count else 0.0)
+        return {'packets': self.packets, 'samples': self.samples,
+                'gaps': self.gaps, 'missing': self.missing,
+                'period_us': self.period, 'jitter_us': jitter,
+                'max_interval_us': self.max_interval}
+
+
+class MeasuresMetrics(object):
+    """ Measures metrics for each measures type """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._periods = {}
+        self.types = {}
+
+    def configure(self, profile):
+        """ Set expected periods from `profile` """
+        with self._lock:
+            self._periods = sample_periods(profile)
+            for name, metrics in self.types.items():
+                metrics.reset_period(self._periods.get(name))
+
+    def add(self, name, columns):
+        """ Add measures `columns` of type `name` """
+        times = [sec * 1000000 + usec for sec, usec in
+                 zip(columns['timestamp_s'], columns['timestamp_us'])]
+        with self._lock:
+            metrics = self.types.get(name)
+            if metrics is None:
+                metrics = self.types[name] = TypeMetrics()
+                metrics.reset_period(self._periods.get(name))
+            metrics.add(times)
+
+    def summary(self):
+        """ Metrics dict for each measures type """
+        with self._lock:
+            return dict((name, metrics.summary())
+                        for name, metrics in self.types.items())
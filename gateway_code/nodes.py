@@ -24,8 +24,10 @@
 """ Common logic for plugin nodes classes """
 import abc
 import os
+import re
 import inspect
 import pkgutil
+import importlib
 
 from gateway_code.utils import elftarget
 
@@ -130,29 +132,69 @@ class OpenNodeBase(NodeBase):
         return ret_val
 
 
-REGISTRY = dict()
+# Nodes plugins packages, a node TYPE in a later package replaces earlier ones
+NODES_PACKAGES = ('open_nodes', 'control_nodes')
+TYPE_RE = re.compile(r'''^\s+TYPE\s*=\s*['"]([\w-]+)['"]''', re.MULTILINE)
 
 
-# import all the nodes/plugins
-def import_all_nodes(pkg_dir):
-    """Looks into the given relative path for modules and imports them"""
-    pkg_dir = os.path.join(os.path.dirname(__file__), pkg_dir)
-    for module_loader, name, _ in pkgutil.iter_modules([pkg_dir]):
-        if name in ['tests', 'common']:
-            continue
-        module = module_loader.find_module(name).load_module(name)
-        class_members = inspect.getmembers(module, inspect.isclass)
-        for class_member_tuple in class_members:
-            class_member_name, class_member = class_member_tuple
-            if (not issubclass(
-                    class_member, NodeBase) or
-                    class_member_name.endswith("Base")):
+def scan_nodes(packages=NODES_PACKAGES):
+    """Return {TYPE: module name} of nodes plugins modules.
+
+    Modules sources are scanned for their TYPE, nothing is imported."""
+    index = {}
+    for package in packages:
+        pkg_dir = os.path.join(os.path.dirname(__file__), package)
+        for _, name, is_pkg in pkgutil.iter_modules([pkg_dir]):
+            if name in ['tests', 'common']:
+                continue
+            path = (os.path.join(pkg_dir, name, '__init__.py') if is_pkg
+                    else os.path.join(pkg_dir, name + '.py'))
+            with open(path) as source:
+                for node_type in TYPE_RE.findall(source.read()):
+                    index[node_type] = 'gateway_code.%s.%s' % (package, name)
+    return index
+
+
+class NodesRegistry(dict):
+    """Nodes classes by TYPE, a node module is imported on first lookup.
+
+    Classes can also be registered directly."""
+
+    def __init__(self, packages=NODES_PACKAGES):
+        dict.__init__(self)
+        self.packages = packages
+        self._index = None
+
+    @property
+    def index(self):
+        """{TYPE: module name} of nodes plugins, scanned once."""
+        if self._index is None:
+            self._index = scan_nodes(self.packages)
+        return self._index
+
+    def __missing__(self, node_type):
+        module_name = self.index.get(node_type)
+        if module_name is None:
+            raise KeyError(node_type)
+        self.import_module(module_name)
+        return dict.__getitem__(self, node_type)
+
+    def import_module(self, module_name):
+        """Import nodes module and register the node classes it provides."""
+        module = importlib.import_module(module_name)
+        for name, member in inspect.getmembers(module, inspect.isclass):
+            if (not issubclass(member, NodeBase) or name.endswith("Base") or
+                    self.index.get(member.TYPE) != module_name):
                 continue
-            REGISTRY[class_member.TYPE] = class_member
+            self.setdefault(member.TYPE, member)
+
+    def import_all(self):
+        """Import all the nodes modules."""
+        for module_name in sorted(set(self.index.values())):
+            self.import_module(module_name)
 
 
-import_all_nodes('open_nodes')
-import_all_nodes('control_nodes')
+REGISTRY = NodesRegistry()
 
 
 def _node_class(board_type):
@@ -189,11 +231,13 @@ def control_node_class(cn_type):
 
 def all_open_nodes_types():
     """Returns all the open nodes classes"""
+    REGISTRY.import_all()
     return [key for key in REGISTRY
             if issubclass(REGISTRY[key], OpenNodeBase)]
 
 
 def all_control_nodes_types():
     """Returns all the control nodes classes"""
+    REGISTRY.import_all()
     return [key for key in REGISTRY
             if issubclass(REGISTRY[key], ControlNodeBase)]
@@ -36,6 +36,8 @@ class NodeA8M3(NodeOpenOCDBase):
     ROM_START_ADDR = 0x08000000
     OPENOCD_CFG_FILE = static_path('iot-lab.cfg')
     OPENOCD_OPTS = (static_path('iot-lab-a8-m3.cfg'),)
+    # STM32F103REY flash pages
+    OPENOCD_SECTOR_SIZE = 2048
     FW_IDLE = static_path('a8-m3_idle.elf')
     FW_AUTOTEST = static_path('a8-m3_autotest.elf')
     ALIM = '3.3V'
@@ -30,6 +30,8 @@ class NodeNrf52840Mdk(NodeOpenOCDBase):
 
     TYPE = 'nrf52840mdk'
     OPENOCD_CFG_FILE = static_path('iot-lab-nrf528xxmdk.cfg')
+    # nRF52 flash pages
+    OPENOCD_SECTOR_SIZE = 4096
     FW_IDLE = static_path('nrf52840mdk_idle.elf')
     FW_AUTOTEST = static_path('nrf52840mdk_autotest.elf')
     TTY = '/dev/iotlab/ttyON_CMSIS-DAP'
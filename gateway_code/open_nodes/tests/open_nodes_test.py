@@ -29,7 +29,8 @@ from mock import patch
 
 from gateway_code.nodes import (open_node_class, control_node_class,
                                 all_open_nodes_types, all_control_nodes_types,
-                                OpenNodeBase, ControlNodeBase, REGISTRY)
+                                OpenNodeBase, ControlNodeBase, REGISTRY,
+                                NodesRegistry)
 from gateway_code.open_nodes.node_a8 import NodeA8
 from gateway_code.open_nodes.node_m3 import NodeM3
 
@@ -95,6 +96,22 @@ def test_registry_open_node():
     del REGISTRY[MyNode.TYPE]
 
 
+def test_registry_lazy_import():
+    """ Only the requested node module is imported """
+    registry = NodesRegistry()
+    assert registry.index['m3'] == 'gateway_code.open_nodes.node_m3'
+    assert registry.index['iotlab'] == 'gateway_code.control_nodes.cn_iotlab'
+    assert registry['m3'] is NodeM3
+    assert list(registry) == ['m3']
+    with pytest.raises(KeyError):
+        registry['unknown']  # pylint:disable=pointless-statement
+
+    registry.import_all()
+    assert set(registry) == set(registry.index)
+    # 'rpi3' control node replaces the open node
+    assert issubclass(registry['rpi3'], ControlNodeBase)
+
+
 def test_registry_control_node():
     """ Verify the control node registry metaclass """
     class MyControlNode(ControlNodeBase):
@@ -27,6 +27,42 @@ and methods to convert it to config commands
 
 # pylint:disable=too-many-arguments,too-few-public-methods
 
+import copy
+import logging
+
+LOGGER = logging.getLogger('gateway_code')
+
+# Control node serial link, 500000 bauds 8N1
+LINK_CAPACITY = 500000 // 10
+# Keep a margin for commands answers and measures packets not full
+LINK_MAX_USAGE = 0.8
+LINK_BUDGETS = ('warn', 'reject', 'downsample')
+
+# Measures packets layout, see 'control_node_serial/src/measures_handler.c'
+FRAME_HEADER_SIZE = 2  # sync, length
+MAX_PAYLOAD_SIZE = 255
+MEASURES_HEADER_SIZE = 6  # type, count, time reference seconds
+MEASURE_TIME_SIZE = 4  # time reference microseconds
+CONSUMPTION_VALUE_SIZE = 4  # float for each power, voltage, current
+RADIO_MEASURE_SIZE = 2  # channel, rssi
+
+
+def measures_throughput(sample_period, measure_size):
+    """ Serial link bytes per second for measures of `measure_size` bytes
+    every `sample_period` microseconds, sent in full measures packets
+
+    >>> int(measures_throughput(1000, 2))
+    6195
+    >>> measures_throughput(None, 2)
+    0.0
+    """
+    if not sample_period or not measure_size:
+        return 0.0
+    record = MEASURE_TIME_SIZE + measure_size
+    per_packet = (MAX_PAYLOAD_SIZE - MEASURES_HEADER_SIZE) // record
+    overhead = float(FRAME_HEADER_SIZE + MEASURES_HEADER_SIZE) / per_packet
+    return 1000000.0 / sample_period * (record + overhead)
+
 
 class Profile(object):
 
@@ -34,9 +70,12 @@ class Profile(object):
 
     def __init__(self, open_node_type,  # pylint:disable=unused-argument
                  profilename, power,
-                 consumption=None, radio=None, **_kwargs):
+                 consumption=None, radio=None, link_budget='warn',
+                 **_kwargs):
         self.profilename = profilename
         self.power = power
+        assert link_budget in LINK_BUDGETS, 'Link budget'
+        self.link_budget = link_budget
 
         self.consumption = None
         self.radio = None
@@ -64,23 +103,81 @@ class Profile(object):
         if profile_dict is None:
             return None
         try:
-            return Profile(open_node_type, **profile_dict)
+            profile = Profile(open_node_type, **profile_dict)
         except (ValueError, TypeError, AssertionError) as err:
             raise ValueError('Invalid profile: %r' % err)
-
-
-class Consumption(object):
+        return profile._check_budget(open_node_type, profile_dict)
+
+    def throughput(self):
+        """ Estimated control node serial link bytes per second """
+        return sum(monitoring.throughput()
+                   for monitoring in (self.consumption, self.radio)
+                   if monitoring is not None)
+
+    def budget(self, open_node_type, profile_dict):
+        """ Serial link budget of this profile created from `profile_dict`
+
+        :returns: dict with 'throughput' and 'capacity' in bytes per second
+            and 'suggested', a downsampled `profile_dict` fitting in the link
+            budget, or None if not needed """
+        throughput = self.throughput()
+        suggested = None
+        if throughput > LINK_MAX_USAGE * LINK_CAPACITY:
+            suggested = self._downsampled(open_node_type, profile_dict)
+        return {'throughput': int(throughput), 'capacity': LINK_CAPACITY,
+                'suggested': suggested}
+
+    def _downsampled(self, open_node_type, profile_dict):
+        """ Increase measures periods until profile fits in link budget """
+        suggested = copy.deepcopy(profile_dict)
+        profile = self
+        while profile.throughput() > LINK_MAX_USAGE * LINK_CAPACITY:
+            # Downsample the most demanding monitoring first
+            monitorings = sorted(
+                ((monitoring.throughput(), name, monitoring)
+                 for name, monitoring in (('consumption', profile.consumption),
+                                          ('radio', profile.radio))
+                 if monitoring is not None and monitoring.throughput()),
+                key=lambda item: item[0], reverse=True)
+            if not any(monitoring.downsample(suggested[name])
+                       for _, name, monitoring in monitorings):
+                break
+            profile = Profile(open_node_type, **suggested)
+        return suggested
+
+    def _check_budget(self, open_node_type, profile_dict):
+        """ Warn, reject or downsample profile over the link budget
+
+        :raises ValueError: if over budget with 'reject' link_budget """
+        budget = self.budget(open_node_type, profile_dict)
+        if budget['suggested'] is None:
+            return self
+        msg = ('Profile %s needs %d B/s, over %d%% of control node link '
+               '%d B/s, suggested: %r' % (
+                   self.profilename, budget['throughput'],
+                   100 * LINK_MAX_USAGE, LINK_CAPACITY, budget['suggested']))
+        if self.link_budget == 'reject':
+            raise ValueError('Invalid profile: %s' % msg)
+        LOGGER.warning(msg)
+        if self.link_budget == 'downsample':
+            return Profile(open_node_type, **budget['suggested'])
+        return self
+
+
+class Consumption(object):  # pylint:disable=too-many-instance-attributes
 
     """ Consumption monitoring configuration """
     choices = {
         'consumption': {
             'period': [140, 204, 332, 588, 1100, 2116, 4156, 8244],
             'average': [1, 4, 16, 64, 128, 256, 512, 1024]},
+        'aggregation': (100, 60000),  # window in ms
         'alim': ('3.3V', '5V'),
     }
 
     def __init__(self, alim, source, period, average,
-                 power=False, voltage=False, current=False):
+                 power=False, voltage=False, current=False,
+                 aggregation=None, raw=True):
         _err = "Required values period/average for consumption measure."
         assert period is not None and average is not None, _err
         period = int(period)
@@ -98,6 +195,47 @@ class Consumption(object):
         self.voltage = voltage
         self.current = current
 
+        # Gateway side aggregation window, and keep raw measures or not
+        if aggregation is not None:
+            aggregation = int(aggregation)
+            _min, _max = self.choices['aggregation']
+            assert _min <= aggregation <= _max, 'Aggregation'
+        assert raw or aggregation is not None, 'Raw'
+        self.aggregation = aggregation
+        self.raw = raw
+
+    def key(self):
+        """ Hashable control node measures configuration """
+        return (self.source, self.period, self.average, bool(self.power),
+                bool(self.voltage), bool(self.current))
+
+    @property
+    def sample_period(self):
+        """ Measures period in microseconds
+
+        Voltage and shunt conversions take `period`, `average` times """
+        return 2 * self.period * self.average
+
+    def throughput(self):
+        """ Estimated serial link bytes per second """
+        values = sum(1 for value in (self.power, self.voltage, self.current)
+                     if value)
+        return measures_throughput(self.sample_period,
+                                   values * CONSUMPTION_VALUE_SIZE)
+
+    def downsample(self, consumption_dict):
+        """ Update `consumption_dict` to the next lower sampling rate
+
+        Increase average, then period.
+        :returns: False if already at the lowest rate """
+        for key in ('average', 'period'):
+            choices = self.choices['consumption'][key]
+            index = choices.index(getattr(self, key))
+            if index + 1 < len(choices):
+                consumption_dict[key] = choices[index + 1]
+                return True
+        return False
+
 
 class Radio(object):
 
@@ -164,3 +302,31 @@ class Radio(object):
             assert self.num_per_channel is None, 'Num per channel'
 
         assert self.mode in ('rssi', 'sniffer'), 'Mode'
+
+    def key(self):
+        """ Hashable control node radio configuration """
+        return (self.mode, tuple(sorted(set(self.channels))), self.period,
+                self.num_per_channel)
+
+    @property
+    def sample_period(self):
+        """ RSSI measures period in microseconds, None for sniffer """
+        if self.mode != 'rssi':
+            return None
+        return self.period * 1000
+
+    def throughput(self):
+        """ Estimated serial link bytes per second
+
+        Sniffed packets depend on the radio traffic, they are not counted """
+        return measures_throughput(self.sample_period, RADIO_MEASURE_SIZE)
+
+    def downsample(self, radio_dict):
+        """ Update `radio_dict` with a doubled period
+
+        :returns: False if already at the lowest rate """
+        if self.mode != 'rssi':
+            return False
+        period = min(2 * self.period, max(self.choices['rssi']['period']))
+        radio_dict['period'] = period
+        return period != self.period
@@ -0,0 +1,133 @@
+# -*- coding: utf-8 -*-
+
+# This file is a part of IoT-LAB gateway_code
+# Copyright (C) 2015 INRIA (Contact: admin@iot-lab.info)
+# Contributor(s) : see AUTHORS file
+#
+# This software is governed by the CeCILL license under French law
+# and abiding by the rules of distribution of free software.  You can  use,
+# modify and/ or redistribute the software under the terms of the CeCILL
+# license as circulated by CEA, CNRS and INRIA at the following URL
+# http://www.cecill.info.
+#
+# As a counterpart to the access to the source code and  rights to copy,
+# modify and redistribute granted by the license, users are provided only
+# with a limited warranty  and the software's author,  the holder of the
+# economic rights,  and the successive licensors  have only  limited
+# liability.
+#
+# The fact that you are presently reading this means that you have had
+# knowledge of the CeCILL license and that you accept its terms.
+
+
+""" Profile timeline for the running experiment
+
+A timeline is a list of (offset, profile) entries, offsets are seconds from
+the timeline start. Profiles are applied at their offset by a local
+scheduler instead of one `exp_update_profile` request for each change.
+"""
+
+import time
+import threading
+
+import logging
+LOGGER = logging.getLogger('gateway_code')
+
+# 'time.monotonic' is not available in python2
+CLOCK = getattr(time, 'monotonic', time.time)
+
+
+def parse(timeline, profile_from_dict):
+    """ Return timeline entries sorted by offset, with parsed profiles
+
+    :param timeline: list of [offset, profile_dict] entries
+    :param profile_from_dict: function returning a profile from a dict
+    :raises ValueError: on invalid entries or profiles
+
+    >>> parse([[2.5, 'b'], [0, 'a']], str.upper)
+    [(0.0, 'A'), (2.5, 'B')]
+    >>> parse([[-1, 'a']], str.upper)
+    Traceback (most recent call last):
+    ...
+    ValueError: Invalid timeline entry 0: negative offset
+    >>> parse([['a']], str.upper)
+    Traceback (most recent call last):
+    ...
+    ValueError: Invalid timeline entry 0: not an [offset, profile] pair
+    """
+    if not isinstance(timeline, (list, tuple)):
+        raise ValueError('Invalid timeline: not a list')
+
+    entries = []
+    for index, entry in enumerate(timeline):
+        try:
+            offset, profile_dict = entry
+            offset = float(offset)
+        except (TypeError, ValueError):
+            raise ValueError('Invalid timeline entry %d: '
+                             'not an [offset, profile] pair' % index)
+        if offset < 0:
+            raise ValueError('Invalid timeline entry %d: negative offset' %
+                             index)
+        entries.append((offset, profile_from_dict(profile_dict)))
+    entries.sort(key=lambda entry: entry[0])
+    return entries
+
+
+class ProfileTimeline(object):
+    """ Apply profiles at their timeline offset in a background thread
+
+    :param entries: (offset, profile) entries, sorted by offset
+    :param apply_profile: function configuring a profile, returns 0 on
+        success
+    :param lock: lock held while applying a profile, entries are not
+        applied anymore once the timeline is stopped
+
+    `stop` does not wait for the thread, so it can be called with `lock`
+    held.
+    """
+
+    def __init__(self, entries, apply_profile, lock=None):
+        self.entries = list(entries)
+        self.apply_profile = apply_profile
+        self.lock = lock or threading.Lock()
+        self.applied = []
+        self._stopped = threading.Event()
+        self._thread = threading.Thread(target=self._run)
+        self._thread.daemon = True
+        self._t_start = None
+
+    def start(self):
+        """ Start timeline, offsets are relative to now """
+        self._t_start = CLOCK()
+        self._thread.start()
+
+    def stop(self):
+        """ Stop applying remaining entries """
+        self._stopped.set()
+
+    def join(self, timeout=None):
+        """ Wait until all entries are applied or timeline is stopped """
+        self._thread.join(timeout)
+
+    def _run(self):
+        """ Wait for each entry offset and apply its profile """
+        for index, (offset, profile) in enumerate(self.entries):
+            if self._stopped.wait(self._t_start + offset - CLOCK()):
+                return
+            with self.lock:
+                if self._stopped.is_set():
+                    return
+                late = CLOCK() - self._t_start - offset
+                ret = self._apply(profile)
+            self.applied.append({'offset': offset, 'late': late, 'ret': ret})
+            LOGGER.info('Profile timeline entry %d at %.3fs: ret %d, '
+                        'late %.1fms', index, offset, ret, 1000 * late)
+
+    def _apply(self, profile):
+        """ Apply profile, an error does not stop the timeline """
+        try:
+            return self.apply_profile(profile)
+        except Exception as err:  # pylint:disable=broad-except
+            LOGGER.error('Profile timeline: %r', err)
+            return 1
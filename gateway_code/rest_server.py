@@ -25,6 +25,7 @@
 REST server listening to the experiment handler
 """
 
+import codecs
 import argparse
 import json
 import errno
@@ -38,12 +39,18 @@ from bottle import request
 
 from gateway_code.gateway_manager import GatewayManager
 from gateway_code import board_config
+from gateway_code import jobs
+from gateway_code import measures_feed
+from gateway_code.profile import Profile
+from gateway_code.status_monitor import StatusMonitor
+from gateway_code.utils import elftarget
+from gateway_code.utils.firmware_cache import FirmwareCache, copy_sha256
 from gateway_code.common import booleanize
 
 LOGGER = logging.getLogger('gateway_code')
 
 
-class GatewayRest(bottle.Bottle):
+class GatewayRest(bottle.Bottle):  # pylint:disable=too-many-public-methods
 
     """
     Gateway Rest class
@@ -55,6 +62,9 @@ class GatewayRest(bottle.Bottle):
         super(GatewayRest, self).__init__()
         self.gateway_manager = gateway_manager
         self.board_config = board_config.BoardConfig()
+        self.jobs = jobs.JobManager()
+        self.status_monitor = StatusMonitor(gateway_manager)
+        self.firmware_cache = FirmwareCache()
         self._app_routing()
 
     def _app_routing(self):
@@ -66,12 +76,21 @@ class GatewayRest(bottle.Bottle):
         self.route('/exp/stop', 'DELETE', self.exp_stop)
         self.route('/status', 'GET', self.status)
 
+        # Background jobs, started with 'async' query string
+        self.route('/jobs', 'GET', self.jobs_list)
+        self.route('/jobs/<job_id:int>', 'GET', self.job_status)
+
         # Control node functions
         self.route('/exp/update', 'POST', self.exp_update_profile)
         self.cn_conditional_route('open_start', '/open/start', 'PUT',
                                   self.open_start)
         self.cn_conditional_route('open_stop', '/open/stop', 'PUT',
                                   self.open_stop)
+        # query_string: types, fields, channels, rate, period
+        self.cn_conditional_route('subscribe_measures', '/exp/measures',
+                                  'GET', self.exp_measures)
+        self.cn_conditional_route('measures_metrics', '/exp/metrics', 'GET',
+                                  self.exp_metrics)
         # Autotest functions
         # query_string: channel=int[11:26]
         self.route('/autotest', 'PUT', self.auto_tests)
@@ -84,6 +103,9 @@ class GatewayRest(bottle.Bottle):
                                   self.open_flash)
         self.on_conditional_route('flash', '/open/flash/idle', 'PUT',
                                   self.open_flash_idle)
+        self.on_conditional_route('flash',
+                                  '/open/flash/<sha256:re:[0-9a-f]{64}>',
+                                  'PUT', self.open_flash_cached)
         self.on_conditional_route('reset', '/open/reset', 'PUT',
                                   self.open_soft_reset)
         self.on_conditional_route('debug_start', '/open/debug/start', 'PUT',
@@ -99,6 +121,9 @@ class GatewayRest(bottle.Bottle):
         :param exp_id: experiment id
 
         Query string: 'timeout' int
+        Query string: 'async' bool, run in background and return job id
+        Optional files: 'firmware', 'profile' and 'timeline', a json list of
+        [offset, profile] entries
         """
 
         LOGGER.debug('REST: Start experiment: %s-%i', user, exp_id)
@@ -110,18 +135,34 @@ class GatewayRest(bottle.Bottle):
             timeout = 0
 
         # Extract firmware file
-        firmware_file = self._extract_firmware()
+        try:
+            firmware_file = self._extract_firmware()
+        except ValueError as err:
+            LOGGER.error('REST: Invalid firmware: %s', err)
+            return {'ret': 1, 'error': str(err)}
         firmware = firmware_file.name if firmware_file else None
 
-        # Extract profile to a dict
+        # Extract profile and timeline
         try:
             profile = self._extract_profile()
+            timeline = self._extract_timeline()
         except ValueError:
-            LOGGER.error('REST: Invalid json for profile')
+            LOGGER.error('REST: Invalid json for profile or timeline')
+            if firmware_file is not None:
+                firmware_file.close()
             return {'ret': 1}
+        kwargs = {} if timeline is None else {'timeline': timeline}
+
+        if self._async_requested():
+            job = self.jobs.submit('exp_start', self.gateway_manager.exp_start,
+                                   user, exp_id, firmware, profile, timeout,
+                                   **kwargs)
+            if firmware_file is not None:
+                job.add_cleanup(firmware_file.close)
+            return self._start_job(job)
 
         ret = self.gateway_manager.exp_start(user, exp_id, firmware, profile,
-                                             timeout)
+                                             timeout, **kwargs)
         # cleanup of temp file
         if firmware_file is not None:
             firmware_file.close()
@@ -130,15 +171,26 @@ class GatewayRest(bottle.Bottle):
         return {'ret': ret}
 
     def exp_stop(self):
-        """ Stop the current experiment """
+        """ Stop the current experiment
+
+        Query string: 'async' bool, run in background and return job id
+        """
         LOGGER.debug('REST: Stop experiment')
+        if self._async_requested():
+            job = self.jobs.submit('exp_stop', self.gateway_manager.exp_stop)
+            return self._start_job(job)
+
         ret = self.gateway_manager.exp_stop()
         if ret:  # pragma: no cover
             LOGGER.error('REST: Stop experiment errors: ret: %d', ret)
         return {'ret': ret}
 
     def exp_update_profile(self):
-        """ Update current experiment profile """
+        """ Update current experiment profile
+
+        The answer 'budget' gives the profile serial link usage, and a
+        downsampled profile suggestion if needed, see `Profile.budget`.
+        """
         LOGGER.debug('REST: Update profile')
         try:
             profile = request.json
@@ -148,28 +200,168 @@ class GatewayRest(bottle.Bottle):
             return {'ret': 1}
 
         ret = self.gateway_manager.exp_update_profile(profile)
-        return {'ret': ret}
+        answer = {'ret': ret}
+        budget = self._profile_budget(profile)
+        if budget is not None:
+            answer['budget'] = budget
+        return answer
+
+    def _profile_budget(self, profile_dict):
+        """ Serial link budget of `profile_dict`, None if invalid """
+        board_class = self.board_config.board_class
+        try:
+            profile = Profile(board_class, **profile_dict)
+        except (ValueError, TypeError, AssertionError):
+            return None
+        return profile.budget(board_class, profile_dict)
+
+    def exp_measures(self):
+        """ Stream the running experiment live measures
+
+        Newline delimited json frames are sent every 'period' seconds with
+        the measures received in the meantime, until the experiment stops.
+
+        Query string options:
+         * types, fields, channels: comma separated values to keep
+         * rate: maximum samples per second for each measure type
+         * period: frames period in seconds
+        """
+        LOGGER.debug('REST: Measures stream')
+        try:
+            filters, period = self._measures_query()
+        except ValueError as err:
+            bottle.response.status = 400
+            return {'ret': 1, 'error': str(err)}
+
+        subscription = self.gateway_manager.subscribe_measures(**filters)
+        if subscription is None:
+            bottle.response.status = 409
+            return {'ret': 1, 'error': 'No experiment running'}
+
+        bottle.response.content_type = 'application/x-ndjson'
+        return self._measures_frames(subscription, period)
+
+    def exp_metrics(self):
+        """ Return the running experiment measures quality metrics
+
+        Per measures type packets, samples, timestamps gaps and jitter,
+        lost and dropped measures and queues high water marks.
+        """
+        LOGGER.debug('REST: Measures metrics')
+        metrics = self.gateway_manager.measures_metrics()
+        if metrics is None:
+            bottle.response.status = 409
+            return {'ret': 1, 'error': 'No experiment running'}
+        return {'ret': 0, 'metrics': metrics}
 
     @staticmethod
-    def _extract_profile():
-        """ Extract profile dict from request files
-        :raises: ValueError on an invalid pofile """
+    def _measures_query():
+        """ Parse measures stream query string
+
+        :raises ValueError: on invalid values """
+        query = request.query  # pylint:disable=no-member
+
+        def _list(key, conv=str):
+            value = query.get(key)
+            return [conv(v) for v in value.split(',')] if value else None
+
+        filters = {
+            'types': _list('types'),
+            'fields': _list('fields'),
+            'channels': _list('channels', int),
+            'rate': float(query.get('rate')) if query.get('rate') else None,
+        }
+        period = float(query.get('period') or measures_feed.FRAME_PERIOD)
+        if not 0 < period <= 60 or (filters['rate'] is not None and
+                                    filters['rate'] <= 0):
+            raise ValueError('Invalid period or rate')
+        return filters, period
+
+    @staticmethod
+    def _measures_frames(subscription, period):
+        """ Measures frames generator, unsubscribe when client leaves """
+        try:
+            while True:
+                frame = subscription.frame(period)
+                if frame is None:
+                    break
+                measures = dict(
+                    (name, dict((field, values.tolist())
+                                for field, values in columns.items()))
+                    for name, columns in frame.items())
+                yield json.dumps({'measures': measures,
+                                  'dropped': subscription.dropped}) + '\n'
+        finally:
+            subscription.cancel()
+
+    def _start_job(self, job):
+        """ Start `job` following gateway manager phases """
+        job.follow_phases()
+        job.start()
+        LOGGER.info('REST: Started job %s-%d', job.name, job.job_id)
+        return {'ret': 0, 'job': job.job_id}
+
+    def jobs_list(self):
+        """ Return all known background jobs """
+        return {'ret': 0, 'jobs': self.jobs.as_list()}
+
+    def job_status(self, job_id):
+        """ Return background job `job_id` state, phases and result """
+        job = self.jobs.get(job_id)
+        if job is None:
+            bottle.response.status = 404
+            return {'ret': 1, 'error': 'Unknown job %d' % job_id}
+        return {'ret': 0, 'job': job.as_dict()}
+
+    @staticmethod
+    def _async_requested():
+        """ Return if request query string asks for a background job """
+        # 'async' is a reserved keyword, no attribute access
+        value = request.query.get('async')  # pylint:disable=no-member
+        try:
+            return booleanize(value or False)
+        except ValueError:
+            return False
+
+    @staticmethod
+    def _extract_json(name):
+        """ Extract json file `name` from request files, None if absent
+        :raises: ValueError on invalid json """
         try:
             # Issues with 'request.files'
             # pylint:disable=unsubscriptable-object
-            _prof = request.files['profile']
+            _file = request.files[name]
         except (ValueError, KeyError):
             # ValueError: no files in multipart request
             return None
 
-        # ValueError on invalid profile
-        profile = json.loads(_prof.file.read().decode())
+        # ValueError on invalid json
+        return json.load(codecs.getreader('utf-8')(_file.file))
+
+    def _extract_profile(self):
+        """ Extract profile dict from request files
+        :raises: ValueError on an invalid pofile """
+        profile = self._extract_json('profile')
         LOGGER.debug('REST: Profile json dict: %r', profile)
         return profile
 
-    @staticmethod
-    def _extract_firmware():
-        """ Extract firmware from request files """
+    def _extract_timeline(self):
+        """ Extract profile timeline list from request files
+        :raises: ValueError on an invalid timeline """
+        timeline = self._extract_json('timeline')
+        if timeline is not None and not isinstance(timeline, list):
+            raise ValueError('Timeline is not a list')
+        return timeline
+
+    def _extract_firmware(self, binary=False, cache=False):
+        """ Extract firmware from request files
+
+        The firmware is copied to disk by chunks, its hash is stored in the
+        returned file `sha256` attribute.
+
+        :param binary: firmware is not an elf file, no target check
+        :param cache: add firmware to the firmware cache
+        :raises ValueError: elf firmware for another open node target """
         try:
             # Issues with 'request.files'
             # pylint:disable=unsubscriptable-object
@@ -178,18 +370,75 @@ class GatewayRest(bottle.Bottle):
             # ValueError: no files in multipart request
             return None
 
+        check = None if binary else self._check_firmware_header
         # save http file to disk
         firmware_file = NamedTemporaryFile(suffix='--' + _firm.filename)
-        firmware_file.write(_firm.file.read())
-        firmware_file.flush()
+        try:
+            sha256 = copy_sha256(_firm.file, firmware_file, check)
+        except ValueError:
+            firmware_file.close()
+            raise
+        firmware_file.sha256 = sha256
+        if cache:
+            self.firmware_cache.add(firmware_file.name, sha256)
         return firmware_file
 
+    def _check_firmware_header(self, header):
+        """ Reject elf firmwares not matching open node target
+
+        Non elf files are left to the gateway manager checks
+        :raises ValueError: on incompatible target """
+        target = getattr(self.board_config.board_class, 'ELF_TARGET', None)
+        if target is None or not header.startswith(elftarget.ELF_MAGIC):
+            return
+        firmware_target = elftarget.elf_header_target(header)
+        if firmware_target != tuple(target):
+            raise ValueError('Firmware target %r does not match %r' %
+                             (firmware_target, tuple(target)))
+
     # Open node commands
     def open_flash(self):
         """ Flash open node
-        Requires: request.files contains 'firmware' file argument """
+        Requires: request.files contains 'firmware' file argument
+
+        Elf firmwares are cached, they can be flashed again with their
+        returned 'sha256' """
         LOGGER.debug('REST: Flash OpenNode')
 
+        binary, offset = self._flash_options()
+        try:
+            firmware_file = self._extract_firmware(binary, cache=not binary)
+        except ValueError as err:
+            LOGGER.error('REST: Invalid firmware: %s', err)
+            return {'ret': 1, 'error': str(err)}
+        if firmware_file is None:
+            return {'ret': 1, 'error': "Wrong file args: required 'firmware'"}
+
+        ret = self.gateway_manager.node_flash(
+            'open', firmware_file.name, binary, offset
+        )
+
+        firmware_file.close()
+        return {'ret': ret, 'sha256': firmware_file.sha256}
+
+    def open_flash_cached(self, sha256):
+        """ Flash open node with firmware `sha256` from firmware cache
+
+        Elf firmwares are cached when uploaded with POST /open/flash """
+        LOGGER.debug('REST: Flash cached firmware OpenNode: %s', sha256)
+
+        binary, offset = self._flash_options()
+        firmware = self.firmware_cache.get(sha256)
+        if firmware is None:
+            bottle.response.status = 404
+            return {'ret': 1, 'error': 'Firmware %s not in cache' % sha256}
+
+        ret = self.gateway_manager.node_flash('open', firmware, binary, offset)
+        return {'ret': ret, 'sha256': sha256}
+
+    @staticmethod
+    def _flash_options():
+        """ Extract flash (binary, offset) from request query string """
         query = request.query
         binary_value = query.binary  # pylint:disable=no-member
         if binary_value == '':
@@ -201,16 +450,7 @@ class GatewayRest(bottle.Bottle):
             offset = 0
         else:
             offset = int(offset_value)
-        firmware_file = self._extract_firmware()
-        if firmware_file is None:
-            return {'ret': 1, 'error': "Wrong file args: required 'firmware'"}
-
-        ret = self.gateway_manager.node_flash(
-            'open', firmware_file.name, binary, offset
-        )
-
-        firmware_file.close()
-        return {'ret': ret}
+        return binary, offset
 
     # Open node commands
     def open_flash_idle(self):
@@ -300,9 +540,13 @@ class GatewayRest(bottle.Bottle):
     def status(self):
         """ Return node status
          * Check nodes ftdi
+         * Experiment state, current phase, serial redirection state
+
+        Served from the status monitor snapshot, it does not wait for
+        running operations. 'updated' is the nodes check timestamp.
         """
         LOGGER.debug('REST: Status')
-        return {'ret': self.gateway_manager.status()}
+        return self.status_monitor.snapshot()
 
     def on_conditional_route(self, func, path, *route_args, **route_kwargs):
         """Add route if node implements 'func'."""
@@ -390,5 +634,6 @@ def _main(args):
     g_m.setup()
 
     server = GatewayRest(g_m)
+    server.status_monitor.start()
     server.run(host=args.host, port=args.port, server='paste',
                reloader=args.reloader)
@@ -0,0 +1,147 @@
+# -*- coding: utf-8 -*-
+
+# This file is a part of IoT-LAB gateway_code
+# Copyright (C) 2015 INRIA (Contact: admin@iot-lab.info)
+# Contributor(s) : see AUTHORS file
+#
+# This software is governed by the CeCILL license under French law
+# and abiding by the rules of distribution of free software.  You can  use,
+# modify and/ or redistribute the software under the terms of the CeCILL
+# license as circulated by CEA, CNRS and INRIA at the following URL
+# http://www.cecill.info.
+#
+# As a counterpart to the access to the source code and  rights to copy,
+# modify and redistribute granted by the license, users are provided only
+# with a limited warranty  and the software's author,  the holder of the
+# economic rights,  and the successive licensors  have only  limited
+# liability.
+#
+# The fact that you are presently reading this means that you have had
+# knowledge of the CeCILL license and that you accept its terms.
+
+
+""" Gateway status snapshot refreshed in background
+
+Nodes status requires running ftdi tools, it is refreshed periodically and
+after each gateway manager phase, so status requests are answered
+immediately, even during experiment operations. Monitoring starts with the
+first status request if not started before. Refresh never takes the
+gateway manager lock, so it does not compete with user operations.
+Experiment state, current phase and serial redirection liveness are read
+without locking on each request.
+"""
+
+import time
+import threading
+
+import logging
+LOGGER = logging.getLogger('gateway_code')
+
+REFRESH_PERIOD = 30.0
+# 'ret' value when nodes status could not be checked
+STATUS_ERROR = 1
+
+
+class StatusMonitor(object):
+    """ Keep a snapshot of `gateway_manager` nodes status """
+
+    def __init__(self, gateway_manager, period=REFRESH_PERIOD):
+        self.gateway_manager = gateway_manager
+        self.period = period
+        self.nodes_ret = None
+        self.updated = None
+
+        self._lock = threading.Lock()
+        self._start_lock = threading.Lock()
+        self._stopped = threading.Event()
+        self._wake = threading.Event()
+        self._thread = None
+
+    def start(self):
+        """ Check status now, then refresh it in background
+
+        Refreshed every `period` and after gateway manager phases """
+        with self._start_lock:
+            if self._thread is not None:
+                return
+            self._stopped.clear()
+            self._wake.clear()
+            self._safe_refresh()
+            self.gateway_manager.phase_listeners.append(self.phase_changed)
+            self._thread = threading.Thread(target=self._target)
+            self._thread.daemon = True
+            self._thread.start()
+
+    def stop(self):
+        """ Stop background refresh """
+        with self._start_lock:
+            if self._thread is None:
+                return
+            self.gateway_manager.phase_listeners.remove(self.phase_changed)
+            self._stopped.set()
+            self._wake.set()
+            self._thread.join()
+            self._thread = None
+
+    def phase_changed(self, _phase):
+        """ Gateway manager phase listener, nodes state may have changed """
+        self._wake.set()
+
+    def _target(self):
+        """ Refresh status every `period` or when woken, until stopped """
+        while True:
+            self._wake.wait(self.period)
+            if self._stopped.is_set():
+                break
+            self._wake.clear()
+            self._safe_refresh()
+
+    def _safe_refresh(self):
+        """ Refresh status, log errors and keep previous snapshot """
+        try:
+            self.refresh()
+        except Exception:  # pylint:disable=broad-except
+            LOGGER.exception('Status: refresh failed')
+
+    def refresh(self):
+        """ Update nodes status, without taking gateway manager lock """
+        ret = self.gateway_manager.nodes_status()
+        with self._lock:
+            self.nodes_ret = ret
+            self.updated = time.time()
+
+    def snapshot(self):
+        """ Return gateway status dict, without taking gateway manager lock
+
+        Background refresh is started on first call.
+        If nodes status could not be checked, 'ret' is STATUS_ERROR and
+        'updated' None
+        """
+        if self._thread is None:
+            self.start()
+        elif self.updated is None:
+            self._safe_refresh()
+        g_m = self.gateway_manager
+        with self._lock:
+            nodes_ret, updated = self.nodes_ret, self.updated
+        if updated is None:
+            nodes_ret = STATUS_ERROR
+        return {
+            'ret': nodes_ret,
+            'updated': updated,
+            'experiment': {
+                'running': bool(g_m.experiment_is_running),
+                'exp_id': g_m.exp_id,
+                'user': g_m.user,
+            },
+            'phase': g_m.phase,
+            'serial_redirection': self._serial_redirection_alive(),
+        }
+
+    def _serial_redirection_alive(self):
+        """ Open node serial redirection state, None if not available """
+        redirection = getattr(self.gateway_manager.open_node,
+                              'serial_redirection', None)
+        if redirection is None:
+            return None
+        return bool(redirection.is_alive())
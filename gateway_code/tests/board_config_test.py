@@ -48,6 +48,15 @@ class TestBoardConfig(unittest.TestCase):
         self.assertEqual('turtlebot2', board_cfg.robot_type)
         self.assertNotEqual('', board_config.BoardConfig().node_id)
 
+    @mock.patch(utils.CFG_VAR_PATH, utils.test_cfg_dir('m3_robot'))
+    def test_single_config_snapshot(self):
+        snapshot = board_config.config.config_snapshot
+        with mock.patch.object(board_config.config, 'config_snapshot',
+                               wraps=snapshot) as config_snapshot:
+            board_cfg = board_config.BoardConfig()
+        config_snapshot.assert_called_once_with()
+        self.assertEqual('turtlebot2', board_cfg.robot_type)
+
     @mock.patch(utils.CFG_VAR_PATH, utils.test_cfg_dir('m3_no_robot'))
     def test_board_type_no_robot(self):
         board_cfg = board_config.BoardConfig()
@@ -28,6 +28,8 @@
 # pylint: disable=no-member
 
 import os
+import shutil
+import tempfile
 import unittest
 
 import mock
@@ -50,6 +52,59 @@ class TestConfig(unittest.TestCase):
             self.assertEqual('m3', config.read_config('board_type'))
             self.assertEqual('turtlebot2', config.read_config('robot'))
 
+        # Read from a given snapshot
+        snapshot = config.ConfigSnapshot({'robot': 'turtlebot2'})
+        self.assertEqual('turtlebot2',
+                         config.read_config('robot', snapshot=snapshot))
+        self.assertRaises(IOError, config.read_config, 'board_type',
+                          snapshot=snapshot)
+
+    def test_config_snapshot(self):
+        tmp_dir = tempfile.mkdtemp()
+        cfg_dir = os.path.join(tmp_dir, 'config')
+
+        def _write(key, value):
+            with open(os.path.join(cfg_dir, key), 'w') as cfg:
+                cfg.write(value)
+
+        try:
+            with mock.patch(utils.CFG_VAR_PATH, cfg_dir):
+                self.assertRaises(IOError, config.read_config, 'board_type')
+
+                # Directory created after first read
+                os.mkdir(cfg_dir)
+                _write('board_type', 'M3\n')
+                snapshot = config.config_snapshot()
+                self.assertEqual({'board_type': 'm3'}, dict(snapshot))
+                self.assertIs(snapshot, config.config_snapshot())
+
+                # Changes create a new snapshot
+                _write('board_type', 'a8-m3\n')
+                _write('hostname', 'a8-1\n')
+                self.assertEqual('a8_m3', config.read_config('board_type'))
+                self.assertEqual('a8_1', config.read_config('hostname'))
+                self.assertEqual('m3', snapshot['board_type'])
+
+                os.remove(os.path.join(cfg_dir, 'hostname'))
+                self.assertIsNone(config.read_config('hostname', None))
+        finally:
+            shutil.rmtree(tmp_dir)
+
+    @mock.patch('gateway_code.utils.dev_watch._LIBC', None)
+    def test_config_dir_no_inotify(self):
+        tmp_dir = tempfile.mkdtemp()
+        try:
+            config_dir = config.ConfigDir(tmp_dir)
+            self.assertEqual({}, dict(config_dir.snapshot()))
+            os.mkdir(os.path.join(tmp_dir, 'directory'))
+            with open(os.path.join(tmp_dir, 'robot'), 'w') as cfg:
+                cfg.write('turtlebot2')
+            snapshot = config_dir.snapshot()
+            self.assertEqual({'robot': 'turtlebot2'}, dict(snapshot))
+            self.assertIs(snapshot, config_dir.snapshot())
+        finally:
+            shutil.rmtree(tmp_dir)
+
     def test_default_profile(self):
         default_profile_dict = {
             u'power': u'dc',
@@ -64,6 +64,215 @@ class TestGatewayManager(unittest.TestCase):
         g_m = gateway_manager.GatewayManager()
         self.assertEqual(1, g_m.exp_update_profile(profile_dict={}))
 
+    @mock.patch('gateway_code.config.EXP_FILES_DIR', './iotlab/')
+    def test_exp_start_phases(self):
+        """ Start experiment, phases are run and timed """
+        g_m = gateway_manager.GatewayManager()
+        g_m.control_node = mock.Mock()
+        g_m.control_node.start.return_value = 0
+        g_m.control_node.start_experiment.return_value = 0
+        g_m.control_node.stop_experiment.return_value = 0
+        g_m.open_node = mock.Mock(TYPE='m3')
+        g_m.open_node.setup.return_value = 0
+        g_m.open_node.teardown.return_value = 0
+        phases = []
+        g_m.phase_listeners.append(phases.append)
+        call_phases = []
+
+        g_m._create_user_exp_folders('user', 123)
+        try:
+            self.assertEqual(0, g_m.exp_start('user', 123,
+                                              on_phase=call_phases.append))
+            self.assertTrue(g_m.experiment_is_running)
+            self.assertEqual(phases, call_phases)
+            self.assertIsNone(g_m.phase_callback)
+            g_m.open_node.setup.assert_called_with(None)
+            self.assertEqual(['profile', 'firmware_check', 'exp_files',
+                              'control_node_start', 'open_node_setup',
+                              'control_node_experiment', None], phases)
+            self.assertEqual(phases[:-1], list(g_m.phase_timings.keys()))
+        finally:
+            g_m.exp_stop()
+            g_m._destroy_user_exp_folders('user', 123)
+        # Other calls phases not given to exp_start callback
+        self.assertNotIn('open_node_teardown', call_phases)
+        self.assertIn('open_node_teardown', phases)
+
+    @mock.patch('gateway_code.config.EXP_FILES_DIR', './iotlab/')
+    def test_exp_start_aggregated_consumption(self):
+        """ Raw consumption measures not written if only aggregated """
+        g_m = gateway_manager.GatewayManager()
+        g_m.control_node = mock.Mock()
+        g_m.control_node.start.return_value = 0
+        g_m.control_node.start_experiment.return_value = 0
+        g_m.control_node.stop_experiment.return_value = 0
+        g_m.open_node = mock.Mock(TYPE='m3')
+        g_m.open_node.setup.return_value = 0
+        g_m.open_node.teardown.return_value = 0
+        profile = {'profilename': 'aggregation', 'power': 'dc',
+                   'consumption': {'period': 140, 'average': 1,
+                                   'power': True, 'aggregation': 1000,
+                                   'raw': False}}
+
+        g_m._create_user_exp_folders('user', 123)
+        try:
+            self.assertEqual(0, g_m.exp_start('user', 123,
+                                              profile_dict=profile))
+            exp_files = g_m.control_node.start.call_args[0][1]
+            self.assertEqual(os.devnull, exp_files['consumption'])
+            self.assertEqual(g_m.exp_files['consumption_aggregate'],
+                             exp_files['consumption_aggregate'])
+            self.assertTrue(os.path.isfile(g_m.exp_files['consumption']))
+
+            # Raw measures can't be enabled again during the experiment
+            profile['consumption']['raw'] = True
+            self.assertEqual(1, g_m.exp_update_profile(profile))
+            self.assertFalse(g_m.control_node.configure_profile.called)
+            del profile['consumption']
+            g_m.control_node.configure_profile.return_value = 0
+            self.assertEqual(0, g_m.exp_update_profile(profile))
+        finally:
+            g_m.exp_stop()
+            g_m._destroy_user_exp_folders('user', 123)
+
+    @mock.patch('gateway_code.config.EXP_FILES_DIR', './iotlab/')
+    def test_exp_start_timeline(self):
+        """ Start experiment with a profile timeline """
+        g_m = gateway_manager.GatewayManager()
+        g_m.control_node = mock.Mock()
+        g_m.control_node.start.return_value = 0
+        g_m.control_node.start_experiment.return_value = 0
+        g_m.control_node.stop_experiment.return_value = 0
+        g_m.control_node.configure_profile.return_value = 0
+        g_m.open_node = mock.Mock(TYPE='m3')
+        g_m.open_node.setup.return_value = 0
+        g_m.open_node.teardown.return_value = 0
+        profile = {'profilename': 'timeline', 'power': 'dc',
+                   'consumption': {'period': 140, 'average': 1,
+                                   'power': True}}
+        timeline = [[0, profile],
+                    [60, {'profilename': 'b', 'power': 'dc'}]]
+
+        g_m._create_user_exp_folders('user', 123)
+        try:
+            self.assertEqual(0, g_m.exp_start('user', 123,
+                                              timeline=timeline))
+            timeline = g_m.profile_timeline
+            self.assertEqual([0.0, 60.0], [ent[0] for ent in timeline.entries])
+            # Entries applied without the gateway manager lock
+            with g_m.rlock:
+                timeline.join(0.5)
+                self.assertEqual(
+                    1, g_m.control_node.configure_profile.call_count)
+            applied = g_m.control_node.configure_profile.call_args[0][0]
+            self.assertEqual(140, applied.consumption.period)
+        finally:
+            g_m.exp_stop()
+            g_m._destroy_user_exp_folders('user', 123)
+        self.assertIsNone(g_m.profile_timeline)
+        timeline.join(5)
+        self.assertEqual(1, g_m.control_node.configure_profile.call_count)
+
+    @mock.patch('gateway_code.config.EXP_FILES_DIR', './iotlab/')
+    def test_exp_update_profile_stops_timeline(self):
+        """ Manual profile update stops the profile timeline """
+        g_m = gateway_manager.GatewayManager()
+        g_m.control_node = mock.Mock()
+        g_m.control_node.start.return_value = 0
+        g_m.control_node.start_experiment.return_value = 0
+        g_m.control_node.stop_experiment.return_value = 0
+        g_m.control_node.configure_profile.return_value = 0
+        g_m.open_node = mock.Mock(TYPE='m3')
+        g_m.open_node.setup.return_value = 0
+        g_m.open_node.teardown.return_value = 0
+        profile = {'profilename': 'b', 'power': 'dc'}
+
+        g_m._create_user_exp_folders('user', 123)
+        try:
+            self.assertEqual(0, g_m.exp_start('user', 123,
+                                              timeline=[[60, profile]]))
+            timeline = g_m.profile_timeline
+            self.assertEqual(0, g_m.exp_update_profile(profile))
+            self.assertIsNone(g_m.profile_timeline)
+            self.assertFalse(timeline._thread.is_alive())
+            self.assertEqual(1, g_m.control_node.configure_profile.call_count)
+        finally:
+            g_m.exp_stop()
+            g_m._destroy_user_exp_folders('user', 123)
+
+    @mock.patch('gateway_code.config.EXP_FILES_DIR', './iotlab/')
+    def test_exp_start_timeline_raw_consumption(self):
+        """ Timeline can't change the raw consumption option """
+        g_m = gateway_manager.GatewayManager()
+        g_m.control_node = mock.Mock()
+        profile = {'profilename': 'aggregation', 'power': 'dc',
+                   'consumption': {'period': 140, 'average': 1,
+                                   'power': True, 'aggregation': 1000,
+                                   'raw': False}}
+
+        g_m._create_user_exp_folders('user', 123)
+        try:
+            self.assertEqual(1, g_m.exp_start('user', 123,
+                                              timeline=[[10, profile]]))
+            self.assertFalse(g_m.control_node.start.called)
+        finally:
+            g_m._destroy_user_exp_folders('user', 123)
+
+    @mock.patch('gateway_code.config.EXP_FILES_DIR', './iotlab/')
+    def test_exp_start_invalid_timeline(self):
+        """ Start experiment with an invalid timeline, nothing started """
+        g_m = gateway_manager.GatewayManager()
+        g_m.control_node = mock.Mock()
+
+        g_m._create_user_exp_folders('user', 123)
+        try:
+            self.assertEqual(1, g_m.exp_start('user', 123,
+                                              timeline=[[0, {}]]))
+            self.assertFalse(g_m.experiment_is_running)
+            self.assertFalse(g_m.control_node.start.called)
+            self.assertIsNone(g_m.profile_timeline)
+        finally:
+            g_m._destroy_user_exp_folders('user', 123)
+
+    def test_subscribe_measures(self):
+        """ Live measures only during an experiment """
+        g_m = gateway_manager.GatewayManager()
+        self.assertIsNone(g_m.subscribe_measures())
+
+        g_m.experiment_is_running = True
+        subscription = g_m.subscribe_measures(types=['radio'])
+        self.assertEqual({'radio'}, subscription.types)
+        subscription.cancel()
+
+    def test_measures_metrics(self):
+        """ Measures metrics only during an experiment """
+        g_m = gateway_manager.GatewayManager()
+        g_m.control_node = mock.Mock()
+        g_m.control_node.measures_metrics.return_value = {'measures': {}}
+        self.assertIsNone(g_m.measures_metrics())
+
+        g_m.experiment_is_running = True
+        self.assertEqual({'measures': {}}, g_m.measures_metrics())
+
+    @mock.patch('gateway_code.config.EXP_FILES_DIR', './iotlab/')
+    def test_exp_start_invalid_firmware(self):
+        """ Start experiment with invalid firmware, nothing started """
+        g_m = gateway_manager.GatewayManager()
+        g_m.control_node = mock.Mock()
+
+        g_m._create_user_exp_folders('user', 123)
+        try:
+            with mock.patch.object(g_m, 'create_user_exp_files') as create:
+                self.assertEqual(1, g_m.exp_start('user', 123, __file__))
+            self.assertFalse(g_m.experiment_is_running)
+            self.assertFalse(g_m.control_node.start.called)
+            # Validation done before creating experiment files
+            self.assertFalse(create.called)
+            self.assertEqual({}, g_m.exp_files)
+            self.assertNotIn('exp_files', g_m.phase_timings)
+        finally:
+            g_m._destroy_user_exp_folders('user', 123)
+
 # # # # # # # # # # # # # # # # # # # # #
 # Measures folder and files management  #
 # # # # # # # # # # # # # # # # # # # # #
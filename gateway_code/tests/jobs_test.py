@@ -0,0 +1,125 @@
+#! /usr/bin/env python
+
+# This file is a part of IoT-LAB gateway_code
+# Copyright (C) 2015 INRIA (Contact: admin@iot-lab.info)
+# Contributor(s) : see AUTHORS file
+#
+# This software is governed by the CeCILL license under French law
+# and abiding by the rules of distribution of free software.  You can  use,
+# modify and/ or redistribute the software under the terms of the CeCILL
+# license as circulated by CEA, CNRS and INRIA at the following URL
+# http://www.cecill.info.
+#
+# As a counterpart to the access to the source code and  rights to copy,
+# modify and redistribute granted by the license, users are provided only
+# with a limited warranty  and the software's author,  the holder of the
+# economic rights,  and the successive licensors  have only  limited
+# liability.
+#
+# The fact that you are presently reading this means that you have had
+# knowledge of the CeCILL license and that you accept its terms.
+
+
+""" Unit tests for background jobs """
+
+# pylint: disable=missing-docstring
+# pylint: disable=invalid-name
+# pylint: disable=protected-access
+
+import os
+import errno
+import unittest
+
+from gateway_code import jobs
+
+
+class TestJob(unittest.TestCase):
+
+    def test_job_run(self):
+        def _func(value, on_phase=None):
+            for phase in ('one', 'two'):
+                on_phase(phase)
+            return value
+
+        job = jobs.Job(1, 'test', _func, 42)
+        job.follow_phases()
+        self.assertEqual('pending', job.state)
+        job.start()
+        job.join()
+
+        self.assertEqual('done', job.state)
+        self.assertEqual(42, job.ret)
+        self.assertEqual('two', job.phase)
+        self.assertEqual(['one', 'two'],
+                         [phase['name'] for phase in job.phases])
+        self.assertTrue(all(phase['duration'] is not None
+                            for phase in job.phases))
+
+        job_dict = job.as_dict()
+        self.assertEqual(1, job_dict['id'])
+        self.assertEqual(42, job_dict['ret'])
+
+    def test_job_cleanup(self):
+        cleaned = []
+        job = jobs.Job(1, 'test', lambda: 0)
+        job.add_cleanup(lambda: cleaned.append(True))
+        job.start()
+        job.join()
+        self.assertEqual([True], cleaned)
+
+    def test_job_busy(self):
+        def _func():
+            err = errno.EWOULDBLOCK
+            raise EnvironmentError(err, os.strerror(err), 'GatewayManager')
+
+        job = jobs.Job(1, 'test', _func)
+        job.start()
+        job.join()
+        self.assertEqual('error', job.state)
+        self.assertEqual('Gateway manager busy', job.error)
+        self.assertIsNone(job.ret)
+
+    def test_job_errors(self):
+        def _env_error():
+            raise EnvironmentError(errno.EIO, 'io error')
+
+        job = jobs.Job(1, 'test', _env_error)
+        job.start()
+        job.join()
+        self.assertEqual('error', job.state)
+        self.assertIn('io error', job.error)
+
+        def _value_error():
+            raise ValueError('invalid')
+
+        job = jobs.Job(2, 'test', _value_error)
+        job.start()
+        job.join()
+        self.assertEqual('error', job.state)
+        self.assertIn('invalid', job.error)
+
+
+class TestJobManager(unittest.TestCase):
+
+    def test_submit_and_history(self):
+        manager = jobs.JobManager(history=2)
+        job_1 = manager.submit('test', lambda: 0)
+        job_1.start()
+        job_1.join()
+        job_2 = manager.submit('test', lambda: 0)
+        job_3 = manager.submit('test', lambda: 0)
+
+        # finished job_1 removed, unfinished kept
+        self.assertIsNone(manager.get(job_1.job_id))
+        self.assertIs(job_2, manager.get(job_2.job_id))
+        self.assertIs(job_3, manager.get(job_3.job_id))
+        self.assertEqual([2, 3], [job['id'] for job in manager.as_list()])
+
+    def test_history_unfinished(self):
+        manager = jobs.JobManager(history=2)
+        pending = [manager.submit('test', lambda: 0) for _ in range(3)]
+
+        # oldest unfinished job forgotten
+        self.assertEqual(2, len(manager.jobs))
+        self.assertIsNone(manager.get(pending[0].job_id))
+        self.assertEqual([2, 3], [job['id'] for job in manager.as_list()])
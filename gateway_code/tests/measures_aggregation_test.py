@@ -0,0 +1,126 @@
+# -*- coding: utf-8 -*-
+
+# This file is a part of IoT-LAB gateway_code
+# Copyright (C) 2015 INRIA (Contact: admin@iot-lab.info)
+# Contributor(s) : see AUTHORS file
+#
+# This software is governed by the CeCILL license under French law
+# and abiding by the rules of distribution of free software.  You can  use,
+# modify and/ or redistribute the software under the terms of the CeCILL
+# license as circulated by CEA, CNRS and INRIA at the following URL
+# http://www.cecill.info.
+#
+# As a counterpart to the access to the source code and  rights to copy,
+# modify and redistribute granted by the license, users are provided only
+# with a limited warranty  and the software's author,  the holder of the
+# economic rights,  and the successive licensors  have only  limited
+# liability.
+#
+# The fact that you are presently reading this means that you have had
+# knowledge of the CeCILL license and that you accept its terms.
+
+
+# pylint: disable=missing-docstring
+# pylint: disable=protected-access
+
+import os
+import math
+import shutil
+import tempfile
+import unittest
+from array import array
+
+from gateway_code import measures_aggregation
+from gateway_code.utils import oml_reader
+
+NAN = float('nan')
+
+
+def _consumption(seconds, usecs, power, current=None):
+    current = current or [NAN] * len(power)
+    return {'timestamp_s': array('I', seconds),
+            'timestamp_us': array('I', usecs),
+            'power': array('f', power),
+            'voltage': array('f', [NAN] * len(power)),
+            'current': array('f', current)}
+
+
+class TestConsumptionAggregation(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.path = os.path.join(self.tmp_dir, 'm3-1_aggregate.oml')
+        self.aggregation = measures_aggregation.ConsumptionAggregation(
+            self.path, 'm3-1', 123)
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir)
+
+    def _windows(self):
+        measures = oml_reader.load(self.path)
+        return measures[measures_aggregation.SCHEMA]
+
+    def test_aggregation(self):
+        self.aggregation.configure(0.5)
+        # Windows spread over datagrams and datagram over windows
+        self.aggregation.add(_consumption(
+            [10, 10, 10], [0, 250000, 500000], [1.0, 3.0, 2.0],
+            [0.5, 0.5, 0.5]))
+        self.aggregation.add(_consumption(
+            [10, 11, 12], [750000, 0, 250000], [2.0, 4.0, 0.25],
+            [0.5, 0.5, 0.5]))
+        self.aggregation.close()
+
+        windows = self._windows()
+        self.assertEqual([10, 10, 11, 12], windows['timestamp_s'].tolist())
+        self.assertEqual([0, 500000, 0, 0], windows['timestamp_us'].tolist())
+        self.assertEqual([0.5] * 4, windows['window'].tolist())
+        self.assertEqual([2, 2, 1, 1], windows['count'].tolist())
+        self.assertEqual([1.0, 2.0, 4.0, 0.25],
+                         windows['power_min'].tolist())
+        self.assertEqual([3.0, 2.0, 4.0, 0.25],
+                         windows['power_max'].tolist())
+        self.assertEqual([2.0, 2.0, 4.0, 0.25],
+                         windows['power_mean'].tolist())
+        self.assertTrue(all(math.isnan(value)
+                            for value in windows['voltage_mean']))
+        # Measures times the interval since the previous measure
+        self.assertEqual([0.75, 1.0, 1.0, 0.3125],
+                         windows['energy'].tolist())
+        self.assertEqual([0.125, 0.25, 0.125, 0.625],
+                         windows['charge'].tolist())
+
+        with open(self.path) as oml:
+            header = oml.read().split('\n\n')[0]
+        self.assertIn('domain: 123', header)
+        self.assertIn('start-time: 10', header)
+        self.assertIn('sender-id: m3-1', header)
+
+    def test_configure(self):
+        # Not configured, file not written
+        self.aggregation.add(_consumption([10], [0], [1.0]))
+        self.aggregation.close()
+        self.assertFalse(os.path.exists(self.path))
+
+        # New window length flushes current window
+        self.aggregation.configure(1.0)
+        self.aggregation.add(_consumption([10, 10], [0, 100000], [1.0, 2.0]))
+        self.aggregation.configure(0.1)
+        self.aggregation.add(_consumption([10, 10], [200000, 250000],
+                                          [3.0, 5.0]))
+        self.aggregation.configure(None)
+        self.aggregation.add(_consumption([10], [300000], [1.0]))
+        self.aggregation.add(_consumption([], [], []))
+        self.aggregation.close()
+
+        windows = self._windows()
+        self.assertEqual([1.0, 0.1], windows['window'].tolist())
+        self.assertEqual([1.5, 4.0], windows['power_mean'].tolist())
+        self.assertEqual([2, 2], windows['count'].tolist())
+
+    def test_write_error(self):
+        self.aggregation.path = os.path.join(self.tmp_dir, 'no', 'file')
+        self.aggregation.configure(1.0)
+        self.aggregation.add(_consumption([10], [0], [1.0]))
+        self.aggregation.close()
+        self.assertFalse(os.path.exists(self.aggregation.path))
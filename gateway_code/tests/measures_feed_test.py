@@ -0,0 +1,128 @@
+# -*- coding: utf-8 -*-
+
+# This file is a part of IoT-LAB gateway_code
+# Copyright (C) 2015 INRIA (Contact: admin@iot-lab.info)
+# Contributor(s) : see AUTHORS file
+#
+# This software is governed by the CeCILL license under French law
+# and abiding by the rules of distribution of free software.  You can  use,
+# modify and/ or redistribute the software under the terms of the CeCILL
+# license as circulated by CEA, CNRS and INRIA at the following URL
+# http://www.cecill.info.
+#
+# As a counterpart to the access to the source code and  rights to copy,
+# modify and redistribute granted by the license, users are provided only
+# with a limited warranty  and the software's author,  the holder of the
+# economic rights,  and the successive licensors  have only  limited
+# liability.
+#
+# The fact that you are presently reading this means that you have had
+# knowledge of the CeCILL license and that you accept its terms.
+
+
+# pylint: disable=missing-docstring
+# pylint: disable=protected-access
+
+import math
+import unittest
+from array import array
+
+import mock
+
+from gateway_code import measures_feed
+
+
+def _consumption(seconds, usecs, power):
+    nan = float('nan')
+    return {'timestamp_s': array('I', seconds),
+            'timestamp_us': array('I', usecs),
+            'power': array('f', power),
+            'voltage': array('f', [nan] * len(power)),
+            'current': array('f', [nan] * len(power))}
+
+
+class TestMeasuresFeed(unittest.TestCase):
+
+    def setUp(self):
+        self.feed = measures_feed.MeasuresFeed()
+
+    def test_frame(self):
+        subscription = self.feed.subscribe()
+        self.feed.publish('consumption', _consumption([1], [0], [0.5]))
+        self.feed.publish('consumption', _consumption([1], [10], [1.5]))
+
+        frame = subscription.frame(0)
+        # merged and not measured values removed
+        self.assertEqual(['power', 'timestamp_s', 'timestamp_us'],
+                         sorted(frame['consumption'].keys()))
+        self.assertEqual([0.5, 1.5], frame['consumption']['power'].tolist())
+
+        # Nothing received
+        self.assertEqual({}, subscription.frame(0))
+
+        self.feed.close()
+        self.assertIsNone(subscription.frame(0))
+        self.assertTrue(subscription.closed)
+
+    def test_filters(self):
+        subscription = self.feed.subscribe(types=['radio'], channels=[26],
+                                           fields=['channel'])
+        self.feed.publish('consumption', _consumption([1], [0], [0.5]))
+        self.feed.publish('radio', {
+            'timestamp_s': array('I', [1, 1, 1]),
+            'timestamp_us': array('I', [0, 1, 2]),
+            'channel': array('I', [11, 26, 26]),
+            'rssi': array('i', [-91, -80, -70])})
+
+        frame = subscription.frame(0)
+        self.assertEqual(['radio'], list(frame.keys()))
+        self.assertEqual({'timestamp_s': array('I', [1, 1]),
+                          'timestamp_us': array('I', [1, 2]),
+                          'channel': array('I', [26, 26])}, frame['radio'])
+
+    def test_rate(self):
+        subscription = self.feed.subscribe(rate=10)
+        # 1000 Hz for one second
+        seconds = [i // 1000 for i in range(1001)]
+        usecs = [(i % 1000) * 1000 for i in range(1001)]
+        self.feed.publish('consumption',
+                          _consumption(seconds, usecs, range(1001)))
+
+        frame = subscription.frame(0)
+        power = frame['consumption']['power']
+        self.assertEqual(11, len(power))
+        self.assertEqual([0.0, 100.0], power[:2].tolist())
+
+    def test_slow_subscriber(self):
+        subscription = self.feed.subscribe()
+        with mock.patch.object(measures_feed, 'QUEUE_SIZE', 2):
+            slow = self.feed.subscribe()
+
+        for _ in range(3):
+            self.feed.publish('consumption', _consumption([1], [0], [0.5]))
+        self.assertEqual(0, subscription.dropped)
+        self.assertEqual(1, slow.dropped)
+        self.assertEqual({'subscribers': 2, 'dropped': 1,
+                          'queue_high_water': 3,
+                          'queue_size': measures_feed.QUEUE_SIZE},
+                         self.feed.stats())
+
+        # End marker is always queued
+        self.feed.close()
+        self.assertIsNone(slow.frame(0))
+        self.assertEqual(3, len(subscription.frame(0)['consumption']['power']))
+
+    def test_cancel(self):
+        subscription = self.feed.subscribe()
+        subscription.cancel()
+        self.feed.publish('consumption', _consumption([1], [0], [0.5]))
+        self.assertIsNone(subscription.frame(0))
+        self.assertEqual([], self.feed._subscribers)
+
+
+class TestDecimate(unittest.TestCase):
+
+    def test_decimate_no_duration(self):
+        columns = _consumption([1, 1], [0, 0], [1, 2])
+        self.assertIs(columns, measures_feed.decimate(columns, 1))
+        self.assertTrue(math.isnan(columns['current'][0]))
@@ -0,0 +1,94 @@
+# -*- coding: utf-8 -*-
+
+# This file is a part of IoT-LAB gateway_code
+# Copyright (C) 2015 INRIA (Contact: admin@iot-lab.info)
+# Contributor(s) : see AUTHORS file
+#
+# This software is governed by the CeCILL license under French law
+# and abiding by the rules of distribution of free software.  You can  use,
+# modify and/ or redistribute the software under the terms of the CeCILL
+# license as circulated by CEA, CNRS and INRIA at the following URL
+# http://www.cecill.info.
+#
+# As a counterpart to the access to the source code and  rights to copy,
+# modify and redistribute granted by the license, users are provided only
+# with a limited warranty  and the software's author,  the holder of the
+# economic rights,  and the successive licensors  have only  limited
+# liability.
+#
+# The fact that you are presently reading this means that you have had
+# knowledge of the CeCILL license and that you accept its terms.
+
+
+# pylint: disable=missing-docstring
+
+import unittest
+from array import array
+
+import mock
+
+from gateway_code import measures_metrics
+from gateway_code.profile import Consumption, Radio
+
+
+def _radio(seconds, usecs):
+    return {'timestamp_s': array('I', seconds),
+            'timestamp_us': array('I', usecs),
+            'channel': array('I', [11] * len(seconds)),
+            'rssi': array('i', [-91] * len(seconds))}
+
+
+class TestMeasuresMetrics(unittest.TestCase):
+
+    def setUp(self):
+        self.metrics = measures_metrics.MeasuresMetrics()
+
+    def test_sample_periods(self):
+        profile = mock.Mock(
+            consumption=Consumption('3.3V', 'dc', 1100, 4, power=True),
+            radio=Radio('rssi', [11, 26], period=10, num_per_channel=1))
+        self.assertEqual({'consumption': 8800, 'radio': 10000},
+                         measures_metrics.sample_periods(profile))
+
+        profile.radio = Radio('sniffer', [11])
+        profile.consumption = None
+        self.assertEqual({}, measures_metrics.sample_periods(profile))
+        self.assertEqual({}, measures_metrics.sample_periods(None))
+
+    def test_gaps(self):
+        profile = mock.Mock(consumption=None)
+        profile.radio = Radio('rssi', [11], period=1, num_per_channel=1)
+        self.metrics.configure(profile)
+
+        self.metrics.add('radio', _radio([1, 1, 1], [0, 1000, 2000]))
+        # Gap between packets, 3 measures lost
+        self.metrics.add('radio', _radio([1, 1], [6000, 7000]))
+
+        radio = self.metrics.summary()['radio']
+        self.assertEqual((2, 5), (radio['packets'], radio['samples']))
+        self.assertEqual((1, 3), (radio['gaps'], radio['missing']))
+        self.assertEqual((1000, 4000),
+                         (radio['period_us'], radio['max_interval_us']))
+        self.assertEqual(2000.0, radio['jitter_us'])
+
+    def test_no_period(self):
+        # Not configured types only count samples
+        self.metrics.add('radio', _radio([1, 1], [0, 500000]))
+        radio = self.metrics.summary()['radio']
+        self.assertEqual((2, 0, None),
+                         (radio['samples'], radio['gaps'], radio['period_us']))
+
+    def test_configure_period_change(self):
+        profile = mock.Mock(consumption=None)
+        profile.radio = Radio('rssi', [11], period=1, num_per_channel=1)
+        self.metrics.configure(profile)
+        self.metrics.add('radio', _radio([1, 1], [0, 1000]))
+
+        # Interval across the configuration change is not a gap
+        profile.radio = Radio('rssi', [11], period=100, num_per_channel=1)
+        self.metrics.configure(profile)
+        self.metrics.add('radio', _radio([2, 2], [0, 100000]))
+
+        radio = self.metrics.summary()['radio']
+        self.assertEqual((4, 0), (radio['samples'], radio['gaps']))
+        self.assertEqual(100000, radio['period_us'])
@@ -26,6 +26,8 @@ import unittest
 import os
 import re
 import json
+import mock
+from gateway_code import profile
 from gateway_code.profile import Profile
 from gateway_code.open_nodes.node_m3 import NodeM3
 
@@ -118,3 +120,63 @@ class TestsMixedProfile(unittest.TestCase):
             ret = Profile.from_dict(NodeM3, profile_dict(profile_file))
             self.assertTrue(ret.radio is not None, str(ret))
             self.assertTrue(ret.consumption is not None, str(ret))
+
+
+class TestsLinkBudget(unittest.TestCase):
+
+    def setUp(self):
+        self.prof_d = profile_dict(PROFILES_DIR + 'link_budget_max.json')
+
+    def test_throughput(self):
+        mixed_d = profile_dict(PROFILES_DIR + 'mixed_profile.json')
+        ret = Profile.from_dict(NodeM3, mixed_d)
+        # 8 bytes power measures every 16ms, 6 bytes rssi every 1024ms
+        self.assertEqual(506, int(ret.throughput()))
+        self.assertEqual({'throughput': 506, 'capacity': 50000,
+                          'suggested': None}, ret.budget(NodeM3, mixed_d))
+
+        ret = Profile.from_dict(NodeM3, profile_dict(
+            PROFILES_DIR + 'radio_sniffer_1.json'))
+        self.assertEqual(0, ret.throughput())
+
+    @mock.patch('gateway_code.profile.LOGGER')
+    def test_warn(self, logger):
+        ret = Profile.from_dict(NodeM3, self.prof_d)
+        self.assertEqual(1, ret.consumption.average)
+        self.assertTrue(logger.warning.called)
+
+        budget = ret.budget(NodeM3, self.prof_d)
+        self.assertTrue(budget['throughput'] > budget['capacity'])
+        suggested = Profile.from_dict(NodeM3, budget['suggested'])
+        self.assertTrue(suggested.throughput() <
+                        profile.LINK_MAX_USAGE * profile.LINK_CAPACITY)
+        # Consumption is downsampled first
+        self.assertEqual(4, suggested.consumption.average)
+        self.assertEqual(1, suggested.radio.period)
+        # Original dict not modified
+        self.assertEqual(1, self.prof_d['consumption']['average'])
+
+    def test_reject(self):
+        self.prof_d['link_budget'] = 'reject'
+        self.assertRaises(ValueError, Profile.from_dict, NodeM3, self.prof_d)
+
+        self.prof_d['link_budget'] = 'unknown'
+        self.assertRaises(ValueError, Profile.from_dict, NodeM3, self.prof_d)
+
+    def test_downsample(self):
+        self.prof_d['link_budget'] = 'downsample'
+        self.prof_d['consumption'].update(average=1024, period=8244)
+        # Only radio can be downsampled
+        with mock.patch.object(profile, 'LINK_CAPACITY', 1000):
+            ret = Profile.from_dict(NodeM3, self.prof_d)
+        self.assertEqual((1024, 8244), (ret.consumption.average,
+                                        ret.consumption.period))
+        self.assertEqual(8, ret.radio.period)
+
+    def test_downsample_limit(self):
+        self.prof_d['link_budget'] = 'downsample'
+        del self.prof_d['consumption']
+        self.prof_d['radio']['period'] = 2 ** 16 - 1
+        with mock.patch.object(profile, 'LINK_CAPACITY', 1):
+            ret = Profile.from_dict(NodeM3, self.prof_d)
+        self.assertEqual(2 ** 16 - 1, ret.radio.period)
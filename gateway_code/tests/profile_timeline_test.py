@@ -0,0 +1,107 @@
+# -*- coding: utf-8 -*-
+
+# This file is a part of IoT-LAB gateway_code
+# Copyright (C) 2015 INRIA (Contact: admin@iot-lab.info)
+# Contributor(s) : see AUTHORS file
+#
+# This software is governed by the CeCILL license under French law
+# and abiding by the rules of distribution of free software.  You can  use,
+# modify and/ or redistribute the software under the terms of the CeCILL
+# license as circulated by CEA, CNRS and INRIA at the following URL
+# http://www.cecill.info.
+#
+# As a counterpart to the access to the source code and  rights to copy,
+# modify and redistribute granted by the license, users are provided only
+# with a limited warranty  and the software's author,  the holder of the
+# economic rights,  and the successive licensors  have only  limited
+# liability.
+#
+# The fact that you are presently reading this means that you have had
+# knowledge of the CeCILL license and that you accept its terms.
+
+
+# pylint: disable=missing-docstring
+# pylint: disable=protected-access
+
+import threading
+import unittest
+
+import mock
+
+from gateway_code import profile_timeline
+
+
+class TestParse(unittest.TestCase):
+
+    def test_parse(self):
+        entries = profile_timeline.parse([(1, 'b'), ('0.5', 'a')], str.upper)
+        self.assertEqual([(0.5, 'A'), (1.0, 'B')], entries)
+        self.assertEqual([], profile_timeline.parse([], str.upper))
+
+    def test_parse_errors(self):
+        self.assertRaises(ValueError, profile_timeline.parse,
+                          {'0': 'a'}, str.upper)
+        self.assertRaises(ValueError, profile_timeline.parse,
+                          [('a', 'b')], str.upper)
+        self.assertRaises(ValueError, profile_timeline.parse,
+                          [(-0.1, 'a')], str.upper)
+        # Invalid profile
+        profile_from_dict = mock.Mock(side_effect=ValueError('profile'))
+        self.assertRaises(ValueError, profile_timeline.parse,
+                          [(0, {})], profile_from_dict)
+
+
+class TestProfileTimeline(unittest.TestCase):
+
+    def test_apply(self):
+        applied = []
+
+        def _apply(profile):
+            applied.append((profile, profile_timeline.CLOCK() - t_start))
+            return 0 if profile != 'error' else 1
+
+        entries = [(0, 'a'), (0.05, 'error'), (0.1, 'c')]
+        timeline = profile_timeline.ProfileTimeline(entries, _apply)
+        t_start = profile_timeline.CLOCK()
+        timeline.start()
+        timeline.join(5)
+
+        self.assertEqual(['a', 'error', 'c'], [prof for prof, _ in applied])
+        for (offset, _), (_, delay) in zip(entries, applied):
+            self.assertGreaterEqual(delay, offset)
+        self.assertEqual([0, 1, 0], [ent['ret'] for ent in timeline.applied])
+        self.assertEqual([0, 0.05, 0.1],
+                         [ent['offset'] for ent in timeline.applied])
+
+    def test_apply_exception(self):
+        apply_profile = mock.Mock(side_effect=[RuntimeError('err'), 0])
+        timeline = profile_timeline.ProfileTimeline(
+            [(0, 'a'), (0, 'b')], apply_profile)
+        timeline.start()
+        timeline.join(5)
+        self.assertEqual([1, 0], [ent['ret'] for ent in timeline.applied])
+
+    def test_stop(self):
+        apply_profile = mock.Mock(return_value=0)
+        timeline = profile_timeline.ProfileTimeline(
+            [(0, 'a'), (60, 'b')], apply_profile)
+        timeline.start()
+        while not apply_profile.called:
+            timeline.join(0.01)
+        timeline.stop()
+        timeline.join(5)
+        self.assertFalse(timeline._thread.is_alive())
+        apply_profile.assert_called_once_with('a')
+
+    def test_stop_with_lock_held(self):
+        """ Entry waiting for the lock is not applied after stop """
+        lock = threading.RLock()
+        apply_profile = mock.Mock(return_value=0)
+        timeline = profile_timeline.ProfileTimeline(
+            [(0, 'a')], apply_profile, lock)
+        with lock:
+            timeline.start()
+            timeline.join(0.05)
+            timeline.stop()
+        timeline.join(5)
+        self.assertFalse(apply_profile.called)
@@ -26,6 +26,7 @@ Complement the 'integration' tests
 """
 
 # pylint: disable=missing-docstring
+# pylint: disable=too-many-public-methods
 # too long tests names
 # pylint: disable=invalid-name
 # pylint: disable=protected-access
@@ -33,13 +34,18 @@ Complement the 'integration' tests
 # pylint: disable=no-member
 
 import os
+import json
 import errno
+import shutil
+import tempfile
 import unittest
+from array import array
 
 import webtest
 import mock
 
 from gateway_code import rest_server
+from gateway_code import measures_feed
 from . import utils
 
 
@@ -63,13 +69,18 @@ class TestRestMethods(unittest.TestCase):
 
     def setUp(self):
         mock.patch(utils.READ_CONFIG, utils.read_config_mock('m3')).start()
+        self.cache_dir = tempfile.mkdtemp()
+        mock.patch('gateway_code.config.FIRMWARE_CACHE_DIR',
+                   self.cache_dir).start()
 
         self.g_m = mock.Mock()
         self.s_r = rest_server.GatewayRest(self.g_m)
         self.server = webtest.TestApp(self.s_r)
 
     def tearDown(self):
+        self.s_r.status_monitor.stop()
         mock.patch.stopall()
+        shutil.rmtree(self.cache_dir)
 
     def test_routes(self):
         with mock.patch.object(self.s_r, 'route') as m_route:
@@ -132,6 +143,25 @@ class TestRestMethods(unittest.TestCase):
         self.assertEqual(('user', 123), call_args[0: 2])
         self.assertTrue('idle.elf' in call_args[2])
         self.assertEqual(self.PROFILE_DICT, call_args[3])
+        # no phases callback for synchronous calls
+        self.assertNotIn('on_phase', self.g_m.exp_start.call_args[1])
+
+    def test_exp_start_timeline(self):
+        self.g_m.exp_start.return_value = 0
+
+        timeline = '[[0, %s], [10.5, %s]]' % (self.PROFILE_STR,
+                                              self.PROFILE_STR)
+        files = [('timeline', 'timeline.json', timeline.encode())]
+        ret = self.server.post(self.EXP_START, upload_files=files)
+        self.assertEqual(0, ret.json['ret'])
+        self.g_m.exp_start.assert_called_with(
+            'user', 123, None, None, 0,
+            timeline=[[0, self.PROFILE_DICT], [10.5, self.PROFILE_DICT]])
+
+        # Not a list
+        files = [('timeline', 'timeline.json', self.PROFILE_STR.encode())]
+        ret = self.server.post(self.EXP_START, upload_files=files)
+        self.assertEqual(1, ret.json['ret'])
 
     def test_exp_start_invalid_profile(self):
 
@@ -139,6 +169,27 @@ class TestRestMethods(unittest.TestCase):
         ret = self.server.post(self.EXP_START, upload_files=files)
         self.assertEqual(1, ret.json['ret'])
 
+    def test_exp_start_wrong_firmware_target(self):
+        self.g_m.exp_start.return_value = 0
+        # m3 node expects an ARM firmware
+        files = [('firmware', 'idle.elf', self._elf_firmware('leonardo'))]
+        ret = self.server.post(self.EXP_START, upload_files=files)
+        self.assertEqual(1, ret.json['ret'])
+        self.assertIn('EM_AVR', ret.json['error'])
+        self.assertFalse(self.g_m.exp_start.called)
+
+        files = [('firmware', 'idle.elf', self._elf_firmware('m3'))]
+        ret = self.server.post(self.EXP_START, upload_files=files)
+        self.assertEqual(0, ret.json['ret'])
+        self.assertTrue(self.g_m.exp_start.called)
+
+    @staticmethod
+    def _elf_firmware(node):
+        path = os.path.join(os.path.dirname(__file__), '..', 'utils', 'tests',
+                            'elftarget_firmwares', '%s_idle.elf' % node)
+        with open(path, 'rb') as _file:
+            return _file.read()
+
     def test_exp_start_no_files(self):
         self.g_m.exp_start.return_value = 0
 
@@ -184,6 +235,52 @@ class TestRestMethods(unittest.TestCase):
         ret = self.server.delete('/exp/stop')
         self.assertEqual(1, ret.json['ret'])
 
+    def test_exp_start_stop_async(self):
+        self.g_m.exp_start.return_value = 0
+        self.g_m.exp_stop.return_value = 0
+
+        files = [('firmware', 'idle.elf', b'elf32arm0X1234')]
+        extra = query_string('async=1')
+        ret = self.server.post(self.EXP_START, upload_files=files,
+                               extra_environ=extra)
+        self.assertEqual(0, ret.json['ret'])
+        job_id = ret.json['job']
+        self.s_r.jobs.get(job_id).join()
+
+        ret = self.server.get('/jobs/%d' % job_id)
+        self.assertEqual(0, ret.json['ret'])
+        self.assertEqual('exp_start', ret.json['job']['name'])
+        self.assertEqual('done', ret.json['job']['state'])
+        self.assertEqual(0, ret.json['job']['ret'])
+        call_args = self.g_m.exp_start.call_args[0]
+        self.assertEqual(('user', 123), call_args[0: 2])
+        self.assertTrue('idle.elf' in call_args[2])
+        # phases followed for this call only
+        job = self.s_r.jobs.get(job_id)
+        self.assertEqual(job.phase_update,
+                         self.g_m.exp_start.call_args[1]['on_phase'])
+
+        ret = self.server.delete('/exp/stop', extra_environ=extra)
+        job_id = ret.json['job']
+        self.s_r.jobs.get(job_id).join()
+        self.assertTrue(self.g_m.exp_stop.called)
+
+        ret = self.server.get('/jobs')
+        self.assertEqual(['exp_start', 'exp_stop'],
+                         [job['name'] for job in ret.json['jobs']])
+
+        # Unknown job
+        ret = self.server.get('/jobs/42', status=404)
+        self.assertEqual(1, ret.json['ret'])
+
+    def test_exp_start_async_invalid_value(self):
+        self.g_m.exp_start.return_value = 0
+        extra = query_string('async=maybe')
+        ret = self.server.post(self.EXP_START, extra_environ=extra)
+        self.assertEqual(0, ret.json['ret'])
+        self.assertNotIn('job', ret.json)
+        self.g_m.exp_start.assert_called_with('user', 123, None, None, 0)
+
     def test_exp_stop_wrong_request_type(self):
         ret = self.server.post('/exp/stop', status='*')
         self.assertEqual(405, ret.status_int)
@@ -248,6 +345,62 @@ class TestRestMethods(unittest.TestCase):
         ret = self.server.post('/open/flash', upload_files=[])
         self.assertEqual(1, ret.json['ret'])
 
+    def test_flash_cached(self):
+        self.g_m.node_flash.return_value = 0
+        files = [('firmware', 'idle.elf', b'elf32arm0X1234')]
+
+        ret = self.server.post('/open/flash', upload_files=files)
+        sha256 = ret.json['sha256']
+        self.assertEqual(64, len(sha256))
+        self.g_m.node_flash.reset_mock()
+
+        # Flash from cache, the upload temporary file is gone
+        extra = query_string('binary=true&offset=42')
+        ret = self.server.put('/open/flash/%s' % sha256, extra_environ=extra)
+        self.assertEqual(0, ret.json['ret'])
+        args = self.g_m.node_flash.call_args[0]
+        self.assertEqual(('open', True, 42), (args[0], args[2], args[3]))
+        with open(args[1], 'rb') as firmware:
+            self.assertEqual(b'elf32arm0X1234', firmware.read())
+
+        # Not in cache
+        self.g_m.node_flash.reset_mock()
+        ret = self.server.put('/open/flash/%s' % ('0' * 64), status=404)
+        self.assertEqual(1, ret.json['ret'])
+        self.assertFalse(self.g_m.node_flash.called)
+
+    def test_flash_not_cached(self):
+        self.g_m.node_flash.return_value = 0
+        self.g_m.exp_start.return_value = 0
+
+        # Binary and experiment firmwares are not cached
+        files = [('firmware', 'fw.bin', b'binary firmware')]
+        extra = query_string('binary=true')
+        ret = self.server.post('/open/flash', upload_files=files,
+                               extra_environ=extra)
+        self.assertEqual(0, ret.json['ret'])
+        self.server.put('/open/flash/%s' % ret.json['sha256'], status=404)
+
+        files = [('firmware', 'idle.elf', b'elf32arm0X1234')]
+        ret = self.server.post(self.EXP_START, upload_files=files)
+        self.assertEqual(0, ret.json['ret'])
+        self.assertEqual([], os.listdir(self.cache_dir))
+
+    def test_flash_wrong_firmware_target(self):
+        self.g_m.node_flash.return_value = 0
+        files = [('firmware', 'idle.elf', self._elf_firmware('leonardo'))]
+
+        ret = self.server.post('/open/flash', upload_files=files)
+        self.assertEqual(1, ret.json['ret'])
+        self.assertFalse(self.g_m.node_flash.called)
+
+        # binary files are not checked
+        extra = query_string('binary=true')
+        ret = self.server.post('/open/flash', upload_files=files,
+                               extra_environ=extra)
+        self.assertEqual(0, ret.json['ret'])
+        self.assertTrue(self.g_m.node_flash.called)
+
     def test_flash_idle(self):
         self.g_m.node_flash.return_value = 0
 
@@ -273,11 +426,89 @@ class TestRestMethods(unittest.TestCase):
         ret = self.server.put('/open/stop')
         self.assertEqual(0, ret.json['ret'])
 
+    def test_exp_measures(self):
+        feed = measures_feed.MeasuresFeed()
+        columns = {'timestamp_s': array('I', [1, 1]),
+                   'timestamp_us': array('I', [0, 500]),
+                   'channel': array('I', [11, 26]),
+                   'rssi': array('i', [-91, -80])}
+
+        def _subscribe(**filters):
+            subscription = feed.subscribe(**filters)
+            feed.publish('radio', columns)
+            feed.close()
+            return subscription
+        self.g_m.subscribe_measures.side_effect = _subscribe
+
+        ret = self.server.get('/exp/measures?channels=26&fields=rssi'
+                              '&period=0.1')
+        self.assertEqual('application/x-ndjson', ret.content_type)
+        frames = [json.loads(line) for line in ret.text.splitlines()]
+        self.assertEqual([{'measures': {'radio': {'timestamp_s': [1],
+                                                  'timestamp_us': [500],
+                                                  'rssi': [-80]}},
+                           'dropped': 0}], frames)
+        self.g_m.subscribe_measures.assert_called_with(
+            types=None, fields=['rssi'], channels=[26], rate=None)
+
+    def test_exp_measures_errors(self):
+        self.g_m.subscribe_measures.return_value = None
+        ret = self.server.get('/exp/measures', status=409)
+        self.assertEqual(1, ret.json['ret'])
+
+        for query in ('period=0', 'rate=-1', 'channels=a', 'rate=fast'):
+            ret = self.server.get('/exp/measures?' + query, status=400)
+            self.assertEqual(1, ret.json['ret'])
+
+    def test_exp_update_profile_budget(self):
+        self.g_m.exp_update_profile = mock.Mock(return_value=0)
+        with open(os.path.join(os.path.dirname(__file__), 'profiles',
+                               'link_budget_max.json')) as prof:
+            profile = json.load(prof)
+
+        ret = self.server.post_json('/exp/update', profile)
+        self.assertEqual(0, ret.json['ret'])
+        budget = ret.json['budget']
+        self.assertTrue(budget['throughput'] > budget['capacity'])
+        self.assertEqual(4, budget['suggested']['consumption']['average'])
+
+        # Invalid profile, no budget
+        ret = self.server.post_json('/exp/update', {'power': 'dc'})
+        self.assertNotIn('budget', ret.json)
+
+    def test_exp_metrics(self):
+        metrics = {'measures': {'radio': {'samples': 2, 'gaps': 0}},
+                   'stream_lost': 0}
+        self.g_m.measures_metrics.return_value = metrics
+        ret = self.server.get('/exp/metrics')
+        self.assertEqual({'ret': 0, 'metrics': metrics}, ret.json)
+
+        self.g_m.measures_metrics.return_value = None
+        ret = self.server.get('/exp/metrics', status=409)
+        self.assertEqual(1, ret.json['ret'])
+
     def test_status(self):
-        self.g_m.status.return_value = 0
+        self.g_m.nodes_status.return_value = 0
+        self.g_m.configure_mock(experiment_is_running=True, exp_id=123,
+                                user='harter', phase='open_node_setup')
+        self.g_m.open_node.serial_redirection.is_alive.return_value = False
 
         ret = self.server.get('/status')
         self.assertEqual(0, ret.json['ret'])
+        self.assertEqual({'running': True, 'exp_id': 123, 'user': 'harter'},
+                         ret.json['experiment'])
+        self.assertEqual('open_node_setup', ret.json['phase'])
+        self.assertFalse(ret.json['serial_redirection'])
+
+        # Served from snapshot, without the gateway manager lock
+        self.g_m.nodes_status.return_value = 1
+        ret = self.server.get('/status')
+        self.assertEqual(0, ret.json['ret'])
+        self.s_r.status_monitor.refresh()
+        ret = self.server.get('/status')
+        self.assertEqual(1, ret.json['ret'])
+        self.assertEqual(2, self.g_m.nodes_status.call_count)
+        self.assertFalse(self.g_m.status.called)
 
     def test_auto_test(self):
         self.g_m.auto_tests.return_value = {
@@ -0,0 +1,128 @@
+#! /usr/bin/env python
+
+# This file is a part of IoT-LAB gateway_code
+# Copyright (C) 2015 INRIA (Contact: admin@iot-lab.info)
+# Contributor(s) : see AUTHORS file
+#
+# This software is governed by the CeCILL license under French law
+# and abiding by the rules of distribution of free software.  You can  use,
+# modify and/ or redistribute the software under the terms of the CeCILL
+# license as circulated by CEA, CNRS and INRIA at the following URL
+# http://www.cecill.info.
+#
+# As a counterpart to the access to the source code and  rights to copy,
+# modify and redistribute granted by the license, users are provided only
+# with a limited warranty  and the software's author,  the holder of the
+# economic rights,  and the successive licensors  have only  limited
+# liability.
+#
+# The fact that you are presently reading this means that you have had
+# knowledge of the CeCILL license and that you accept its terms.
+
+
+# pylint: disable=missing-docstring
+# pylint: disable=invalid-name
+# pylint: disable=protected-access
+
+import unittest
+
+import mock
+
+from gateway_code import status_monitor
+
+
+class TestStatusMonitor(unittest.TestCase):
+
+    def setUp(self):
+        self.g_m = mock.Mock()
+        self.g_m.configure_mock(experiment_is_running=False, exp_id=None,
+                                user=None, phase=None)
+        self.g_m.open_node = mock.Mock(spec=[])  # no serial_redirection
+        self.g_m.nodes_status.return_value = 0
+        self.monitor = status_monitor.StatusMonitor(self.g_m, period=0.01)
+
+    def tearDown(self):
+        self.monitor.stop()
+
+    def test_snapshot(self):
+        snapshot = self.monitor.snapshot()
+        self.assertEqual(0, snapshot['ret'])
+        self.assertIsNotNone(snapshot['updated'])
+        self.assertEqual({'running': False, 'exp_id': None, 'user': None},
+                         snapshot['experiment'])
+        self.assertIsNone(snapshot['phase'])
+        self.assertIsNone(snapshot['serial_redirection'])
+
+        # Nodes status is cached, other fields are live
+        self.g_m.configure_mock(experiment_is_running=True, exp_id=12,
+                                user='harter', phase='control_node_start')
+        snapshot = self.monitor.snapshot()
+        self.assertEqual(1, self.g_m.nodes_status.call_count)
+        self.assertTrue(snapshot['experiment']['running'])
+        self.assertEqual('control_node_start', snapshot['phase'])
+
+    def test_refresh_error(self):
+        self.monitor.refresh()
+
+        # Previous snapshot kept on errors
+        self.g_m.nodes_status.side_effect = EnvironmentError('error')
+        self.assertRaises(EnvironmentError, self.monitor.refresh)
+        self.assertEqual(0, self.monitor.snapshot()['ret'])
+
+    def test_first_check_error(self):
+        self.g_m.nodes_status.side_effect = EnvironmentError('error')
+        snapshot = self.monitor.snapshot()
+        self.assertEqual(status_monitor.STATUS_ERROR, snapshot['ret'])
+        self.assertIsNone(snapshot['updated'])
+
+        # checked again on next request
+        self.g_m.nodes_status.side_effect = None
+        snapshot = self.monitor.snapshot()
+        self.assertEqual(0, snapshot['ret'])
+        self.assertIsNotNone(snapshot['updated'])
+
+    def test_no_manager_lock(self):
+        # refresh must not call the 'rlock' synchronized status
+        self.monitor.refresh()
+        self.assertFalse(self.g_m.status.called)
+        self.assertEqual(1, self.g_m.nodes_status.call_count)
+
+    def test_background_refresh(self):
+        self.monitor.start()
+        # First check done synchronously
+        self.assertEqual(1, self.g_m.nodes_status.call_count)
+        self.assertEqual(0, self.monitor.nodes_ret)
+        self.g_m.nodes_status.return_value = 1
+        # wait for next refreshes
+        for _ in range(100):
+            if self.monitor.snapshot()['ret'] == 1:
+                break
+            self.monitor._stopped.wait(0.01)
+        self.assertEqual(1, self.monitor.snapshot()['ret'])
+        self.monitor.stop()
+        self.assertIsNone(self.monitor._thread)
+
+    def test_started_on_first_snapshot(self):
+        self.assertIsNone(self.monitor._thread)
+        self.monitor.snapshot()
+        self.assertIsNotNone(self.monitor._thread)
+        self.g_m.phase_listeners.append.assert_called_with(
+            self.monitor.phase_changed)
+        # Already started
+        self.monitor.start()
+        self.assertEqual(1, self.g_m.nodes_status.call_count)
+
+        self.monitor.stop()
+        self.g_m.phase_listeners.remove.assert_called_with(
+            self.monitor.phase_changed)
+
+    def test_refresh_on_phase(self):
+        self.monitor.period = 60
+        self.monitor.start()
+        self.g_m.nodes_status.return_value = 1
+        self.monitor.phase_changed(None)
+        for _ in range(100):
+            if self.monitor.snapshot()['ret'] == 1:
+                break
+            self.monitor._stopped.wait(0.01)
+        self.assertEqual(1, self.monitor.snapshot()['ret'])
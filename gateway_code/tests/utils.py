@@ -36,8 +36,9 @@ def read_config_mock(board_type, **kwargs):
     config_dict['board_type'] = board_type
     config_dict.setdefault('hostname', '%s-00' % board_type)
 
-    def read_config(key, default=IOError):
+    def read_config(key, default=IOError, snapshot=None):
         """ read_config_mock """
+        # pylint:disable=unused-argument
         try:
             return config_dict[key]
         except KeyError:
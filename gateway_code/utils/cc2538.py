@@ -24,10 +24,9 @@ import os
 import shlex
 
 import logging
-import tempfile
 
 from gateway_code import common
-from gateway_code.utils.elftarget import get_elf_load_addr
+from .firmware_image import FirmwareImage
 from . import subprocess_timeout
 
 LOGGER = logging.getLogger('gateway_code')
@@ -69,22 +68,14 @@ class CC2538(object):
 
             elf_path = common.abspath(elf_file)
             LOGGER.info('Creating hex path from %s', elf_path)
-            hex_file = tempfile.NamedTemporaryFile(suffix='.hex')
-            hex_path = hex_file.name
-            LOGGER.info('Created hex path %s', hex_path)
-
-            # creating hex file
-            to_hex_command = 'objcopy -I elf32-big -O ihex {elf} {hex}'
-            cmd = to_hex_command.format(elf=elf_path, hex=hex_path)
-            ret_value = self._call_cmd(cmd)
-            LOGGER.info('To hex conversion ret value : %d', ret_value)
-
-            # getting flash addr
-            address = get_elf_load_addr(elf_path)
+            image = FirmwareImage.from_elf(elf_path)
+            hex_file = image.temp_file('ihex')
+            LOGGER.info('Created hex path %s', hex_file.name)
 
             # Flashing
-            flash_cmd = self.FLASH.format(baudrate=self.baud, hex=hex_path,
-                                          addr=address)
+            flash_cmd = self.FLASH.format(baudrate=self.baud,
+                                          hex=hex_file.name,
+                                          addr=image.load_addr)
             cmd = self.CC2538BSL.format(port=self.port, cmd=flash_cmd)
             ret_value += self._call_cmd(cmd)
             LOGGER.info('Flashing ret value : %d', ret_value)
@@ -93,7 +84,7 @@ class CC2538(object):
             hex_file.close()
 
             return ret_value
-        except IOError as err:
+        except (IOError, ValueError) as err:
             LOGGER.error('%s', err)
             return 1
 
@@ -0,0 +1,57 @@
+# -*- coding: utf-8 -*-
+
+# This file is a part of IoT-LAB gateway_code
+# Copyright (C) 2015 INRIA (Contact: admin@iot-lab.info)
+# Contributor(s) : see AUTHORS file
+#
+# This software is governed by the CeCILL license under French law
+# and abiding by the rules of distribution of free software.  You can  use,
+# modify and/ or redistribute the software under the terms of the CeCILL
+# license as circulated by CEA, CNRS and INRIA at the following URL
+# http://www.cecill.info.
+#
+# As a counterpart to the access to the source code and  rights to copy,
+# modify and redistribute granted by the license, users are provided only
+# with a limited warranty  and the software's author,  the holder of the
+# economic rights,  and the successive licensors  have only  limited
+# liability.
+#
+# The fact that you are presently reading this means that you have had
+# knowledge of the CeCILL license and that you accept its terms.
+
+
+""" CLI converting OML measures files to numpy '.npz' files
+
+Usage: oml_convert [--start TIME] [--end TIME] <file.oml> [<output.npz>]
+
+"""
+
+from __future__ import print_function
+
+import os
+import argparse
+from .. import oml_reader
+
+PARSER = argparse.ArgumentParser()
+PARSER.add_argument('oml_file', help="OML measures file")
+PARSER.add_argument('output', nargs='?',
+                    help="Output '.npz' file, default to oml_file.npz")
+PARSER.add_argument('--start', type=float,
+                    help="Only measures from this unix time")
+PARSER.add_argument('--end', type=float,
+                    help="Only measures before this unix time")
+PARSER.add_argument('--block-size', type=int, default=oml_reader.BLOCK_SIZE,
+                    help="Read block size in bytes")
+
+
+def main():
+    """ oml_convert cli main function """
+    opts = PARSER.parse_args()
+    output = opts.output or os.path.splitext(opts.oml_file)[0] + '.npz'
+    try:
+        measures = oml_reader.convert(opts.oml_file, output, opts.start,
+                                      opts.end, opts.block_size)
+    except (IOError, ValueError) as err:
+        PARSER.error(str(err))
+    print('Converted %d measures to %s' % (measures, output))
+    return 0
@@ -0,0 +1,174 @@
+# -*- coding:utf-8 -*-
+
+# This file is a part of IoT-LAB gateway_code
+# Copyright (C) 2015 INRIA (Contact: admin@iot-lab.info)
+# Contributor(s) : see AUTHORS file
+#
+# This software is governed by the CeCILL license under French law
+# and abiding by the rules of distribution of free software.  You can  use,
+# modify and/ or redistribute the software under the terms of the CeCILL
+# license as circulated by CEA, CNRS and INRIA at the following URL
+# http://www.cecill.info.
+#
+# As a counterpart to the access to the source code and  rights to copy,
+# modify and redistribute granted by the license, users are provided only
+# with a limited warranty  and the software's author,  the holder of the
+# economic rights,  and the successive licensors  have only  limited
+# liability.
+#
+# The fact that you are presently reading this means that you have had
+# knowledge of the CeCILL license and that you accept its terms.
+
+
+""" Wait for device files creation/removal using inotify
+
+Watch the directory where a device file (like /dev/iotlab/ttyON_M3) is
+created by udev and wake up as soon as it changes instead of polling.
+Only available on Linux, `DevWatchError` is raised otherwise.
+"""
+
+import os
+import time
+import errno
+import select
+import ctypes
+import ctypes.util
+
+import logging
+LOGGER = logging.getLogger('gateway_code')
+
+# sys/inotify.h
+IN_MODIFY = 0x00000002
+IN_ATTRIB = 0x00000004
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_FROM = 0x00000040
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_DELETE = 0x00000200
+IN_DELETE_SELF = 0x00000400
+IN_MOVE_SELF = 0x00000800
+IN_NONBLOCK = os.O_NONBLOCK
+IN_CLOEXEC = 0o2000000
+
+WATCH_MASK = (IN_ATTRIB | IN_MOVED_FROM | IN_MOVED_TO | IN_CREATE |
+              IN_DELETE | IN_DELETE_SELF | IN_MOVE_SELF)
+# Also files content changes
+FILES_WATCH_MASK = WATCH_MASK | IN_MODIFY | IN_CLOSE_WRITE
+
+# Check again even without events, symlinks targets are not watched
+RECHECK_PERIOD = 0.5
+
+
+class DevWatchError(OSError):
+    """ inotify not available """
+
+
+def _load_libc():
+    """ Return libc if it implements inotify, else None """
+    try:
+        libc = ctypes.CDLL(ctypes.util.find_library('c'), use_errno=True)
+        libc.inotify_init1.argtypes = [ctypes.c_int]
+        libc.inotify_add_watch.argtypes = [ctypes.c_int, ctypes.c_char_p,
+                                           ctypes.c_uint32]
+        return libc
+    except (OSError, AttributeError):
+        return None
+
+
+_LIBC = _load_libc()
+
+
+class DevWatcher(object):
+    """ Watch `path` parent directory for changes
+
+    :param mask: inotify events watched, FILES_WATCH_MASK to also watch
+        files content """
+
+    def __init__(self, path, mask=WATCH_MASK):
+        if _LIBC is None:
+            raise DevWatchError(errno.ENOSYS, 'inotify not available')
+        self.path = path
+        self.mask = mask
+        self.watched = set()
+        self.fd = _LIBC.inotify_init1(IN_NONBLOCK | IN_CLOEXEC)
+        if self.fd < 0:
+            err = ctypes.get_errno()
+            raise DevWatchError(err, os.strerror(err))
+
+    def close(self):
+        """ Close inotify file descriptor """
+        if self.fd >= 0:
+            os.close(self.fd)
+            self.fd = -1
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *_):
+        self.close()
+
+    def _watch_dir(self):
+        """ Watch nearest existing ancestor directory of path
+
+        Directories like /dev/iotlab may be created with the device """
+        directory = os.path.dirname(os.path.abspath(self.path))
+        while not os.path.isdir(directory):
+            directory = os.path.dirname(directory)
+        if directory in self.watched:
+            return
+        wd_ = _LIBC.inotify_add_watch(self.fd, directory.encode(), self.mask)
+        if wd_ < 0:
+            err = ctypes.get_errno()
+            raise DevWatchError(err, os.strerror(err), directory)
+        self.watched.add(directory)
+
+    def _drain(self):
+        """ Read pending events, their content is not needed
+
+        :returns: True if there were events """
+        events = False
+        try:
+            while os.read(self.fd, 4096):
+                events = True
+        except OSError as err:
+            if err.errno != errno.EAGAIN:
+                raise
+        return events
+
+    def changed(self):
+        """ Return True if directory changed since last call, don't wait
+
+        First call only starts watching """
+        if not self.watched:
+            self._watch_dir()
+        events = self._drain()
+        if events:
+            # path directory may have been created
+            self._watch_dir()
+        return events
+
+    def wait(self, present, timeout):
+        """ Wait at max `timeout` for path existence to be `present`
+
+        :returns: True if path is in requested state before timeout """
+        t_end = time.time() + timeout
+        while True:
+            # Watch before checking so no change can be missed
+            self._watch_dir()
+            if os.path.exists(self.path) == present:
+                return True
+            remaining = t_end - time.time()
+            if remaining <= 0:
+                return False
+            ready, _, _ = select.select([self.fd], [], [],
+                                        min(remaining, RECHECK_PERIOD))
+            if ready:
+                self._drain()
+
+
+def wait_path(path, present, timeout):
+    """ Wait at max `timeout` for `path` existence to be `present`
+
+    :raises DevWatchError: if inotify is not available """
+    with DevWatcher(path) as watcher:
+        return watcher.wait(present, timeout)
@@ -26,9 +26,9 @@ import os
 import shlex
 
 import logging
-import tempfile
 
 from gateway_code import common
+from .firmware_image import FirmwareImage
 from . import subprocess_timeout
 
 LOGGER = logging.getLogger('gateway_code')
@@ -63,16 +63,9 @@ class Edbg(object):
             fw_path = common.abspath(fw_file)
             if not binary:
                 LOGGER.info('Creating bin file from %s', fw_path)
-                bin_file = tempfile.NamedTemporaryFile(suffix='.bin')
-                bin_path = bin_file.name
-                LOGGER.info('Created bin file in %s', bin_path)
-
-                # creating hex file
-                to_bin_command = 'objcopy -I elf32-big -O binary {elf} {bin}'
-                cmd = to_bin_command.format(elf=fw_path, bin=bin_path)
-                ret_value = self._call_cmd(cmd)
-                LOGGER.info('To bin conversion ret value : %d', ret_value)
-                fw_path = bin_path
+                bin_file = FirmwareImage.from_elf(fw_path).temp_file()
+                fw_path = bin_file.name
+                LOGGER.info('Created bin file in %s', fw_path)
                 # Ensure offset is 0 with elf firmware
                 offset = 0
 
@@ -87,7 +80,7 @@ class Edbg(object):
                 bin_file.close()
 
             return ret_value
-        except IOError as err:
+        except (IOError, ValueError) as err:
             LOGGER.error('%s', err)
             return 1
 
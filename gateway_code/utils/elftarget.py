@@ -23,40 +23,116 @@
 
 from __future__ import print_function
 
+import os
 import sys
+import struct
 import logging
+from collections import namedtuple
 
 from elftools.elf.constants import SH_FLAGS
 from elftools.elf.elffile import ELFFile
+from elftools.elf.enums import ENUM_E_MACHINE, ENUM_E_TYPE, ENUM_EI_CLASS
 import elftools.common.exceptions
 
 LOGGER = logging.getLogger('gateway_code')
 
 TYPE_EXECUTABLE = 'ET_EXEC'
 
+ELF_MAGIC = b'\x7fELF'
+# e_ident[16], e_type, e_machine
+ELF_HEADER_SIZE = 20
+ELF_DATA_ENDIAN = {1: '<', 2: '>'}  # ELFDATA2LSB, ELFDATA2MSB
+
+ElfInfo = namedtuple('ElfInfo', ['elf_class', 'machine', 'type', 'load_addr',
+                                 'segments'])
+ElfSegment = namedtuple('ElfSegment', ['paddr', 'vaddr', 'offset', 'filesz',
+                                       'memsz'])
+
+# Elf files metadata, by (path, mtime, size)
+ELF_CACHE = {}
+ELF_CACHE_SIZE = 64
+
+
+def elf_info(filepath):
+    """Returns elf file `ElfInfo`, cached while the file is not modified.
+
+    Only the file status is read when already in cache.
+    :raises: ValueError if file is not a valid elf file.
+    """
+    with open(filepath, 'rb') as _file:
+        stat = os.fstat(_file.fileno())
+        key = (os.path.abspath(filepath), stat.st_mtime, stat.st_size)
+        try:
+            return ELF_CACHE[key]
+        except KeyError:
+            pass
+        try:
+            info = _read_elf_info(ELFFile(_file))
+        except elftools.common.exceptions.ELFError:
+            raise ValueError('Not a valid elf file')
+
+    if len(ELF_CACHE) >= ELF_CACHE_SIZE:
+        ELF_CACHE.clear()
+    ELF_CACHE[key] = info
+    return info
+
+
+def _read_elf_info(elffile):
+    """Read `ElfInfo` from opened `elffile`."""
+    segments = tuple(ElfSegment(seg['p_paddr'], seg['p_vaddr'],
+                                seg['p_offset'], seg['p_filesz'],
+                                seg['p_memsz'])
+                     for seg in elffile.iter_segments()
+                     if seg['p_type'] == 'PT_LOAD')
+    return ElfInfo(elffile.header['e_ident']['EI_CLASS'],
+                   elffile.header['e_machine'], elffile.header['e_type'],
+                   elf_load_addr(elffile), segments)
+
 
 def elf_target(filepath):
     """Returns elf (class, machine) tuple.
 
     :raises: ValueError if file is not an executable elf file.
     """
+    info = elf_info(filepath)
+    if info.type != TYPE_EXECUTABLE:
+        raise ValueError('Not an executable elf file: %s' % info.type)
+
+    return info.elf_class, info.machine
+
+
+def _enum_name(enum, value):
+    """ Return `value` name in pyelftools `enum` """
+    for name, enum_value in enum.items():
+        if enum_value == value and not name.startswith('_'):
+            return name
+    return value
+
+
+def elf_header_target(header):
+    """Returns elf (class, machine) tuple from file first bytes.
+
+    Allows checking a firmware before having read it completely.
+    :raises: ValueError if `header` is not an executable elf file header.
+
+    >>> elf_header_target(b'\\x7fELF\\x01\\x01' + 10 * b'\\x00' +
+    ...                   b'\\x02\\x00\\x28\\x00')
+    ('ELFCLASS32', 'EM_ARM')
+    """
+    if len(header) < ELF_HEADER_SIZE or not header.startswith(ELF_MAGIC):
+        raise ValueError('Not a valid elf file')
+    ident = bytearray(header[:16])
     try:
-        with open(filepath, 'rb') as _file:
-            elffile = ELFFile(_file)
-    except elftools.common.exceptions.ELFError:
+        endian = ELF_DATA_ENDIAN[ident[5]]
+    except KeyError:
         raise ValueError('Not a valid elf file')
+    e_type, e_machine = struct.unpack_from(endian + 'HH', header, 16)
 
-    # Type
-    e_type = elffile.header['e_type']
-    # Class
-    e_class = elffile.header['e_ident']['EI_CLASS']
-    # Machine
-    e_machine = elffile.header['e_machine']
-
+    e_type = _enum_name(ENUM_E_TYPE, e_type)
     if e_type != TYPE_EXECUTABLE:
         raise ValueError('Not an executable elf file: %s' % e_type)
-
-    return e_class, e_machine
+    return (_enum_name(ENUM_EI_CLASS, ident[4]),
+            _enum_name(ENUM_E_MACHINE, e_machine))
 
 
 def is_compatible_with_node(firmware_path, node_class):
@@ -75,12 +151,15 @@ def is_compatible_with_node(firmware_path, node_class):
 
 def get_elf_load_addr(firmware_path):
     """ Read the load offset for the given elf """
-    with open(firmware_path, 'rb') as firmware_file:
-        elf_file = ELFFile(firmware_file)
-        for section in elf_file.iter_sections():
-            sh_flags = section['sh_flags']
-            if sh_flags & SH_FLAGS.SHF_EXECINSTR:
-                return section['sh_addr']
+    return elf_info(firmware_path).load_addr
+
+
+def elf_load_addr(elf_file):
+    """ Return first executable section address of opened `elf_file` """
+    for section in elf_file.iter_sections():
+        sh_flags = section['sh_flags']
+        if sh_flags & SH_FLAGS.SHF_EXECINSTR:
+            return section['sh_addr']
     return None
 
 
@@ -0,0 +1,232 @@
+# -*- coding:utf-8 -*-
+
+# This file is a part of IoT-LAB gateway_code
+# Copyright (C) 2015 INRIA (Contact: admin@iot-lab.info)
+# Contributor(s) : see AUTHORS file
+#
+# This software is governed by the CeCILL license under French law
+# and abiding by the rules of distribution of free software.  You can  use,
+# modify and/ or redistribute the software under the terms of the CeCILL
+# license as circulated by CEA, CNRS and INRIA at the following URL
+# http://www.cecill.info.
+#
+# As a counterpart to the access to the source code and  rights to copy,
+# modify and redistribute granted by the license, users are provided only
+# with a limited warranty  and the software's author,  the holder of the
+# economic rights,  and the successive licensors  have only  limited
+# liability.
+#
+# The fact that you are presently reading this means that you have had
+# knowledge of the CeCILL license and that you accept its terms.
+
+
+""" Content addressed firmware cache
+
+Firmwares are stored in a directory under their sha256 hash, the least
+recently used ones are removed when the cache exceeds its maximum size.
+
+The cache directory must be private to the gateway, it is created with
+0700 permissions and the cache is disabled if it is owned by another user.
+Cached files size and mtime are recorded when added or used, files not
+matching their record, like ones found at startup, are hashed again.
+"""
+
+import os
+import re
+import stat
+import shutil
+import hashlib
+import threading
+
+import logging
+
+from gateway_code import config
+
+LOGGER = logging.getLogger('gateway_code')
+
+SHA256_RE = re.compile(r'^[0-9a-f]{64}$')
+CHUNK_SIZE = 64 * 1024
+DIR_MODE = 0o700
+
+
+def file_sha256(path):
+    """ Return `path` content sha256 hex digest
+
+    >>> file_sha256(os.devnull)  # doctest: +ELLIPSIS
+    'e3b0c44298fc1c149afbf4c8996fb924...'
+    """
+    sha = hashlib.sha256()
+    with open(path, 'rb') as _file:
+        for chunk in iter(lambda: _file.read(CHUNK_SIZE), b''):
+            sha.update(chunk)
+    return sha.hexdigest()
+
+
+def copy_sha256(src, dst, check=None):
+    """ Copy file object `src` to `dst` by chunks and return its sha256
+
+    :param check: called with the first chunk before writing anything,
+                  it may raise to reject the content
+    """
+    sha = hashlib.sha256()
+    chunk = src.read(CHUNK_SIZE)
+    if check is not None:
+        check(chunk)
+    while chunk:
+        sha.update(chunk)
+        dst.write(chunk)
+        chunk = src.read(CHUNK_SIZE)
+    dst.flush()
+    return sha.hexdigest()
+
+
+def _size_mtime(file_stat):
+    """ Cached file identification, without reading it """
+    return (file_stat.st_size, file_stat.st_mtime)
+
+
+def is_sha256(value):
+    """ Check `value` is a sha256 hex digest
+
+    >>> is_sha256('e3b0c44298fc1c149afbf4c8996fb92427ae41e4649b934ca495991b7852b855')
+    True
+    >>> is_sha256('../../etc/passwd')
+    False
+    """  # noqa
+    return SHA256_RE.match(value) is not None
+
+
+class FirmwareCache(object):
+    """ Firmware files cache, with least recently used eviction """
+
+    def __init__(self, directory=None, max_size=None):
+        self.directory = directory or config.FIRMWARE_CACHE_DIR
+        self.max_size = max_size or config.FIRMWARE_CACHE_SIZE
+        self._lock = threading.Lock()
+        # {sha256: (size, mtime)} of checked entries
+        self._checked = {}
+
+    def _path(self, sha256):
+        """ Path of firmware `sha256` in cache """
+        return os.path.join(self.directory, sha256)
+
+    def add(self, firmware_path, sha256=None):
+        """ Add a copy of `firmware_path` in the cache
+
+        :param sha256: firmware hash if already known
+        :returns: firmware sha256 """
+        sha256 = sha256 or file_sha256(firmware_path)
+        with self._lock:
+            if not self._makedirs():
+                return sha256
+            cached = self._path(sha256)
+            if self._valid_entry(sha256):
+                self._touch(sha256)
+                return sha256
+
+            tmp_path = cached + '.tmp'
+            try:
+                # no copy when on the same filesystem
+                os.link(firmware_path, tmp_path)
+            except OSError:
+                shutil.copyfile(firmware_path, tmp_path)
+            os.rename(tmp_path, cached)
+            self._touch(sha256)
+            LOGGER.debug('Firmware cache: add %s', sha256)
+            self._evict(keep=cached)
+        return sha256
+
+    def get(self, sha256):
+        """ Return cached firmware `sha256` path or None """
+        if not is_sha256(sha256):
+            return None
+        with self._lock:
+            if not self._private_dir():
+                return None
+            if not self._valid_entry(sha256):
+                return None
+            self._touch(sha256)
+            return self._path(sha256)
+
+    def __contains__(self, sha256):
+        return self.get(sha256) is not None
+
+    def _makedirs(self):
+        """ Create cache directory
+
+        :returns: True if cache directory can be used """
+        try:
+            os.makedirs(self.directory, DIR_MODE)
+        except OSError:
+            pass  # Already exists
+        return self._private_dir()
+
+    def _private_dir(self):
+        """ Check cache directory is a directory only writable by us
+
+        :returns: True if cache directory can be used """
+        try:
+            dir_stat = os.lstat(self.directory)
+        except OSError:
+            return False
+        if (not stat.S_ISDIR(dir_stat.st_mode) or
+                dir_stat.st_uid != os.getuid()):
+            LOGGER.error('Firmware cache: %s not a directory owned by us, '
+                         'cache disabled', self.directory)
+            return False
+        if stat.S_IMODE(dir_stat.st_mode) != DIR_MODE:
+            os.chmod(self.directory, DIR_MODE)
+        return True
+
+    def _valid_entry(self, sha256):
+        """ Check cached firmware `sha256` exists and matches its hash
+
+        Only hashed again if not checked before or if it changed since.
+        Invalid entries are removed """
+        cached = self._path(sha256)
+        try:
+            file_stat = os.stat(cached)
+        except OSError:
+            self._checked.pop(sha256, None)
+            return False
+        if self._checked.get(sha256) == _size_mtime(file_stat):
+            return True
+        if stat.S_ISREG(file_stat.st_mode) and file_sha256(cached) == sha256:
+            self._checked[sha256] = _size_mtime(file_stat)
+            return True
+        LOGGER.error('Firmware cache: %s content does not match, removed',
+                     sha256)
+        self._checked.pop(sha256, None)
+        os.remove(cached)
+        return False
+
+    def _touch(self, sha256):
+        """ Mark checked firmware `sha256` as recently used """
+        cached = self._path(sha256)
+        os.utime(cached, None)
+        self._checked[sha256] = _size_mtime(os.stat(cached))
+
+    def _entries(self):
+        """ Cached firmwares (mtime, size, path) from oldest to newest """
+        entries = []
+        for name in os.listdir(self.directory):
+            if not is_sha256(name):
+                continue
+            path = self._path(name)
+            file_stat = os.stat(path)
+            entries.append((file_stat.st_mtime, file_stat.st_size, path))
+        return sorted(entries)
+
+    def _evict(self, keep=None):
+        """ Remove least recently used firmwares above max_size """
+        entries = self._entries()
+        total = sum(size for _, size, _ in entries)
+        for _, size, path in entries:
+            if total <= self.max_size:
+                break
+            if path == keep:
+                continue
+            LOGGER.debug('Firmware cache: evict %s', os.path.basename(path))
+            os.remove(path)
+            self._checked.pop(os.path.basename(path), None)
+            total -= size
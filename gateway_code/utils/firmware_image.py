@@ -0,0 +1,167 @@
+# -*- coding: utf-8 -*-
+
+# This file is a part of IoT-LAB gateway_code
+# Copyright (C) 2015 INRIA (Contact: admin@iot-lab.info)
+# Contributor(s) : see AUTHORS file
+#
+# This software is governed by the CeCILL license under French law
+# and abiding by the rules of distribution of free software.  You can  use,
+# modify and/ or redistribute the software under the terms of the CeCILL
+# license as circulated by CEA, CNRS and INRIA at the following URL
+# http://www.cecill.info.
+#
+# As a counterpart to the access to the source code and  rights to copy,
+# modify and redistribute granted by the license, users are provided only
+# with a limited warranty  and the software's author,  the holder of the
+# economic rights,  and the successive licensors  have only  limited
+# liability.
+#
+# The fact that you are presently reading this means that you have had
+# knowledge of the CeCILL license and that you accept its terms.
+
+
+""" Firmware image from an elf file, replaces 'objcopy' conversions
+
+The elf file is parsed once: its loadable sections are converted in memory
+to a raw binary or an Intel HEX image, and the firmware load address is
+read in the same pass.
+"""
+
+import struct
+import binascii
+import tempfile
+
+from elftools.elf.constants import SH_FLAGS
+from elftools.elf.elffile import ELFFile
+import elftools.common.exceptions
+
+from gateway_code.utils.elftarget import elf_load_addr
+
+IHEX_RECORD_SIZE = 16
+IHEX_DATA = 0
+IHEX_EOF = 1
+IHEX_EXT_LINEAR_ADDR = 4
+IHEX_START_LINEAR_ADDR = 5
+
+
+def ihex_record(rec_type, address, data=b''):
+    """ Return Intel HEX record line
+
+    >>> ihex_record(IHEX_EOF, 0) == b':00000001FF\\r\\n'
+    True
+    >>> ihex_record(IHEX_DATA, 0x10, b'\\x01\\x02') == b':020010000102EB\\r\\n'
+    True
+    """
+    record = bytearray(struct.pack('>BHB', len(data), address, rec_type))
+    record.extend(data)
+    record.append(-sum(record) & 0xff)
+    return b':' + binascii.hexlify(record).upper() + b'\r\n'
+
+
+def _load_addr(section, load_segments):
+    """ Section physical load address, like objcopy LMA """
+    for seg in load_segments:
+        if (seg['p_offset'] <= section['sh_offset'] <
+                seg['p_offset'] + seg['p_filesz']):
+            return seg['p_paddr'] + section['sh_offset'] - seg['p_offset']
+    return section['sh_addr']
+
+
+class FirmwareImage(object):
+    """ Firmware loadable sections
+
+    :param sections: (address, data) list, address is the physical load
+        address
+    :param load_addr: firmware load address, see `elf_load_addr`
+    :param entry: firmware entry point address
+    """
+
+    def __init__(self, sections, load_addr=None, entry=None):
+        self.sections = sorted((addr, bytes(data)) for addr, data in sections
+                               if data)
+        self.load_addr = load_addr
+        self.entry = entry
+
+    @classmethod
+    def from_elf(cls, firmware_path):
+        """ Read firmware image from elf file
+
+        :raises ValueError: if file is not a valid elf file """
+        try:
+            with open(firmware_path, 'rb') as elf:
+                elf_file = ELFFile(elf)
+                load_segments = [seg for seg in elf_file.iter_segments()
+                                 if seg['p_type'] == 'PT_LOAD']
+                sections = [(_load_addr(sec, load_segments), sec.data())
+                            for sec in elf_file.iter_sections()
+                            if sec['sh_flags'] & SH_FLAGS.SHF_ALLOC and
+                            sec['sh_type'] != 'SHT_NOBITS']
+                load_addr = elf_load_addr(elf_file)
+                entry = elf_file.header['e_entry']
+        except elftools.common.exceptions.ELFError:
+            raise ValueError('Not a valid elf file')
+        return cls(sections, load_addr, entry)
+
+    @property
+    def base_addr(self):
+        """ Lowest section address, binary image start address """
+        return self.sections[0][0] if self.sections else 0
+
+    def binary(self):
+        """ Return raw binary image, gaps between sections filled with 0
+
+        >>> img = FirmwareImage([(0x14, b'cd'), (0x10, b'ab')])
+        >>> img.binary() == b'ab\\x00\\x00cd'
+        True
+        """
+        image = bytearray()
+        for addr, data in self.sections:
+            offset = addr - self.base_addr
+            image.extend(bytearray(max(0, offset - len(image))))
+            image[offset:offset + len(data)] = data
+        return bytes(image)
+
+    def ihex(self):
+        """ Return Intel HEX image
+
+        >>> img = FirmwareImage([(0x1fffe, b'abcd')], entry=0x20000)
+        >>> print(img.ihex().decode().strip())
+        ... # doctest: +NORMALIZE_WHITESPACE
+        :020000040001F9
+        :02FFFE0061623E
+        :020000040002F8
+        :02000000636437
+        :0400000500020000F5
+        :00000001FF
+        """
+        records = []
+        upper = 0
+        for addr, data in self.sections:
+            offset = 0
+            while offset < len(data):
+                cur = addr + offset
+                if cur >> 16 != upper:
+                    upper = cur >> 16
+                    records.append(ihex_record(
+                        IHEX_EXT_LINEAR_ADDR, 0, struct.pack('>H', upper)))
+                # Records do not cross a 64KiB boundary
+                size = min(IHEX_RECORD_SIZE, len(data) - offset,
+                           0x10000 - (cur & 0xffff))
+                records.append(ihex_record(IHEX_DATA, cur & 0xffff,
+                                           data[offset:offset + size]))
+                offset += size
+        if self.entry is not None:
+            records.append(ihex_record(IHEX_START_LINEAR_ADDR, 0,
+                                       struct.pack('>I', self.entry)))
+        records.append(ihex_record(IHEX_EOF, 0))
+        return b''.join(records)
+
+    def temp_file(self, image_format='binary'):
+        """ Return a temporary file with image in 'binary' or 'ihex' format
+
+        For tools only taking a file path, it is removed when closed. """
+        suffix = {'binary': '.bin', 'ihex': '.hex'}[image_format]
+        image_file = tempfile.NamedTemporaryFile(suffix=suffix)
+        image_file.write(getattr(self, image_format)())
+        image_file.flush()
+        return image_file
@@ -0,0 +1,434 @@
+# -*- coding: utf-8 -*-
+
+# This file is a part of IoT-LAB gateway_code
+# Copyright (C) 2015 INRIA (Contact: admin@iot-lab.info)
+# Contributor(s) : see AUTHORS file
+#
+# This software is governed by the CeCILL license under French law
+# and abiding by the rules of distribution of free software.  You can  use,
+# modify and/ or redistribute the software under the terms of the CeCILL
+# license as circulated by CEA, CNRS and INRIA at the following URL
+# http://www.cecill.info.
+#
+# As a counterpart to the access to the source code and  rights to copy,
+# modify and redistribute granted by the license, users are provided only
+# with a limited warranty  and the software's author,  the holder of the
+# economic rights,  and the successive licensors  have only  limited
+# liability.
+#
+# The fact that you are presently reading this means that you have had
+# knowledge of the CeCILL license and that you accept its terms.
+
+
+""" Columnar reader for experiment OML measures files
+
+Measures files, see `config.EXP_FILES`, are written in OML text format:
+a header with one 'schema:' line per measurement point, an empty line, then
+one tab separated line per measure::
+
+    <oml_ts>  <schema id>  <seq>  <fields values...>
+
+The file is memory mapped and read by blocks of lines, each block is
+converted to columns arrays so memory stays bounded for multi-GB files.
+Measures are written in time order, so the start of a time range is found
+by bisecting the file.
+"""
+
+import os
+import sys
+import mmap
+import struct
+import shutil
+import zipfile
+import tempfile
+from array import array
+from collections import OrderedDict, namedtuple
+from itertools import compress
+
+BLOCK_SIZE = 4 * 1024 * 1024
+BISECT_MIN = 64 * 1024
+OML_COLUMNS = ('oml_ts', 'schema', 'seq')
+METADATA_SCHEMA = '_experiment_metadata'
+TIMESTAMP_FIELDS = ('timestamp_s', 'timestamp_us')
+
+
+def _boolean(value):
+    """ OML text booleans are written 'True' or 'False' """
+    return value[:1] in (b'T', b't', b'1')
+
+
+# OML type: (array typecode, converter), None typecode for strings
+TYPES = {
+    'uint32': ('I', int),
+    'int32': ('i', int),
+    'double': ('d', float),
+    'boolean': ('B', _boolean),
+    'bool': ('B', _boolean),
+    'string': (None, None),
+}
+DEFAULT_TYPE = ('d', float)
+
+
+class Schema(namedtuple('Schema', ['id', 'name', 'fields'])):
+    """ OML measurement point schema, `fields` are (name, type) tuples """
+    __slots__ = ()
+
+    @classmethod
+    def from_header(cls, line):
+        """ Parse a 'schema:' header line
+
+        >>> Schema.from_header('schema: 2 app_radio channel:uint32 rssi:int32')
+        Schema(id=2, name='app_radio', fields=(('channel', 'uint32'), \
+('rssi', 'int32')))
+        """
+        values = line.split()
+        fields = tuple(tuple(field.split(':', 1)) for field in values[3:])
+        return cls(int(values[1]), values[2], fields)
+
+    @property
+    def has_timestamp(self):
+        """ Schema has 'timestamp_s' and 'timestamp_us' fields """
+        names = [name for name, _ in self.fields]
+        return all(field in names for field in TIMESTAMP_FIELDS)
+
+    def columns(self, tokens):
+        """ Convert a flat list of lines tokens into columns
+
+        :raises ValueError: on invalid values """
+        step = len(OML_COLUMNS) + len(self.fields)
+        columns = OrderedDict()
+        for index, (name, oml_type) in enumerate(self.fields):
+            values = tokens[len(OML_COLUMNS) + index::step]
+            code, converter = TYPES.get(oml_type, DEFAULT_TYPE)
+            if code is None:
+                columns[name] = [value.decode('utf-8') for value in values]
+            else:
+                columns[name] = array(code, list(map(converter, values)))
+        return columns
+
+
+def times(columns):
+    """ Measures times in seconds from timestamp columns
+
+    >>> times({'timestamp_s': [10, 11], 'timestamp_us': [500000, 0]})
+    [10.5, 11.0]
+    """
+    return [sec + usec / 1e6 for sec, usec in
+            zip(columns['timestamp_s'], columns['timestamp_us'])]
+
+
+def filter_time(columns, start=None, end=None):
+    """ Keep measures with time in [start, end[ """
+    selectors = [(start is None or start <= t) and (end is None or t < end)
+                 for t in times(columns)]
+    if all(selectors):
+        return columns
+    return OrderedDict(
+        (name, _compress(values, selectors))
+        for name, values in columns.items())
+
+
+def _compress(values, selectors):
+    """ Same container type as `values` with selected items """
+    selected = compress(values, selectors)
+    if isinstance(values, array):
+        return array(values.typecode, selected)
+    return list(selected)
+
+
+class OmlFile(object):
+    """ Measures file in OML text format
+
+    >>> with OmlFile(path) as oml:  # doctest: +SKIP
+    ...     for schema, columns in oml.blocks(start=1500000000):
+    ...         process(schema.name, columns['power'])
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.schemas = OrderedDict()
+        self._file = open(path, 'rb')
+        self._map = None
+        self._data_offset = 0
+        self._data_end = 0
+        size = os.fstat(self._file.fileno()).st_size
+        if size:
+            self._map = mmap.mmap(self._file.fileno(), 0,
+                                  access=mmap.ACCESS_READ)
+        self._read_header()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *_):
+        self.close()
+
+    def close(self):
+        """ Release the file and its memory map """
+        if self._map is not None:
+            self._map.close()
+            self._map = None
+        self._file.close()
+
+    @property
+    def data_schemas(self):
+        """ Measurement points schemas, without OML metadata """
+        return [schema for schema in self.schemas.values()
+                if schema.name != METADATA_SCHEMA]
+
+    def _read_header(self):
+        """ Parse schemas and find where data starts
+
+        :raises ValueError: if the header is invalid or incomplete """
+        end = -1 if self._map is None else self._map.find(b'\n\n')
+        if end == -1:
+            raise ValueError('Invalid OML file, no header: %s' % self.path)
+        header = self._map[:end].decode('utf-8')
+        for line in header.splitlines():
+            if line.startswith('schema:'):
+                schema = Schema.from_header(line)
+                self.schemas[schema.id] = schema
+        self._data_offset = end + 2
+        # Ignore the last line if partially written
+        self._data_end = max(self._data_offset, self._map.rfind(b'\n') + 1)
+
+    def blocks(self, start=None, end=None, block_size=BLOCK_SIZE):
+        """ Iterate over measures in [start, end[ by blocks of lines
+
+        :param start, end: time range in seconds, None for no limit
+        :param block_size: read size in bytes, bounds memory usage
+        :returns: iterator of (schema, columns dict)
+        """
+        pos = self._seek(start)
+        while pos < self._data_end:
+            stop = self._block_end(pos, block_size)
+            after_end = False
+            for schema, columns in self._parse(self._map[pos:stop]):
+                if schema.has_timestamp and (start, end) != (None, None):
+                    block_times = times(columns)
+                    after_end = (end is not None and block_times and
+                                 block_times[-1] >= end)
+                    columns = filter_time(columns, start, end)
+                if len(next(iter(columns.values()), ())):
+                    yield schema, columns
+            if after_end:
+                return
+            pos = stop
+
+    def _block_end(self, pos, block_size):
+        """ End of the block starting at `pos`, on a line end """
+        stop = min(pos + block_size, self._data_end)
+        if stop < self._data_end:
+            line_end = self._map.rfind(b'\n', pos, stop)
+            if line_end == -1:  # line longer than block_size
+                line_end = self._map.find(b'\n', stop)
+            stop = line_end + 1
+        return stop
+
+    def _seek(self, start):
+        """ Offset of a line before the first measure at `start` or later
+
+        Bisect until the range is small, filtering does the rest. """
+        low, high = self._data_offset, self._data_end
+        if start is None:
+            return low
+        while high - low > BISECT_MIN:
+            middle = (low + high) // 2
+            line_start = self._map.find(b'\n', middle, high) + 1
+            line_end = self._map.find(b'\n', line_start, high)
+            if line_start == 0 or line_end == -1:
+                high = middle
+                continue
+            line_time = self._line_time(self._map[line_start:line_end])
+            if line_time is None or line_time < start:
+                low = line_start
+            else:
+                high = middle
+        return low
+
+    def _line_time(self, line):
+        """ Time of a data line, None if not available """
+        tokens = line.split(b'\t')
+        try:
+            schema = self.schemas[int(tokens[1])]
+            names = [name for name, _ in schema.fields]
+            values = [tokens[len(OML_COLUMNS) + names.index(field)]
+                      for field in TIMESTAMP_FIELDS]
+            return int(values[0]) + int(values[1]) / 1e6
+        except (ValueError, IndexError, KeyError):
+            return None
+
+    def _parse(self, data):
+        """ Parse lines, in one pass if they all have the same schema """
+        tokens = data.rstrip(b'\n').replace(b'\n', b'\t').split(b'\t')
+        try:
+            schema = self.schemas[int(tokens[1])]
+            step = len(OML_COLUMNS) + len(schema.fields)
+            if (len(tokens) % step or
+                    len(set(tokens[1::step])) != 1):
+                raise ValueError('Mixed schemas or invalid lines')
+            return [(schema, schema.columns(tokens))]
+        except (ValueError, IndexError, KeyError):
+            return self._parse_lines(data)
+
+    def _parse_lines(self, data):
+        """ Parse lines one by one, skip invalid ones """
+        tokens = OrderedDict()
+        for line in data.splitlines():
+            values = line.split(b'\t')
+            try:
+                schema = self.schemas[int(values[1])]
+            except (ValueError, IndexError, KeyError):
+                continue
+            if len(values) == len(OML_COLUMNS) + len(schema.fields):
+                tokens.setdefault(schema.id, []).extend(values)
+
+        ret = []
+        for schema_id, values in tokens.items():
+            schema = self.schemas[schema_id]
+            try:
+                columns = schema.columns(values)
+            except ValueError:
+                columns = schema.columns(self._valid_values(schema, values))
+            ret.append((schema, columns))
+        return ret
+
+    @staticmethod
+    def _valid_values(schema, tokens):
+        """ Lines tokens without the lines with invalid values """
+        step = len(OML_COLUMNS) + len(schema.fields)
+        valid = []
+        for index in range(0, len(tokens), step):
+            line = tokens[index:index + step]
+            try:
+                schema.columns(line)
+            except ValueError:
+                continue
+            valid.extend(line)
+        return valid
+
+
+def load(path, start=None, end=None):
+    """ Load all measures of `path` in [start, end[ in memory
+
+    :returns: dict schema name -> columns dict
+    """
+    measures = OrderedDict()
+    with OmlFile(path) as oml:
+        for schema, columns in oml.blocks(start, end):
+            current = measures.setdefault(schema.name, OrderedDict(
+                (name, values[:0]) for name, values in columns.items()))
+            for name, values in columns.items():
+                current[name] += values
+    return measures
+
+
+class NpzWriter(object):
+    """ Write columns to a numpy '.npz' file, without requiring numpy
+
+    Each column is appended to a temporary '.npy' file, they are stored in
+    the '.npz' zip archive on `close`.  Strings columns are kept in memory,
+    they are only used for events names.
+    """
+    NPY_MAGIC = b'\x93NUMPY\x01\x00'
+    NPY_HEADER_SIZE = 128
+    KINDS = {'I': 'u', 'L': 'u', 'B': 'u', 'i': 'i', 'l': 'i', 'd': 'f',
+             'f': 'f'}
+
+    def __init__(self, path):
+        self.path = path
+        self.rows = OrderedDict()
+        self._tmp_dir = tempfile.mkdtemp(prefix='oml_npz_')
+        self._files = OrderedDict()
+        self._typecodes = {}
+        self._strings = OrderedDict()
+
+    def write(self, columns, prefix=''):
+        """ Append `columns` values, keys are prefixed with `prefix` """
+        for name, values in columns.items():
+            key = prefix + name
+            self.rows[key] = self.rows.get(key, 0) + len(values)
+            if not isinstance(values, array):
+                self._strings.setdefault(key, []).extend(
+                    value.encode('utf-8') for value in values)
+                continue
+            if key not in self._files:
+                npy = open(os.path.join(self._tmp_dir, '%d.npy' %
+                                        len(self._files)), 'wb+')
+                npy.write(b' ' * self.NPY_HEADER_SIZE)
+                self._files[key] = npy
+                self._typecodes[key] = values.typecode
+            values.tofile(self._files[key])
+
+    def close(self):
+        """ Write the '.npz' file and remove temporary files """
+        try:
+            with zipfile.ZipFile(self.path, 'w', zipfile.ZIP_STORED,
+                                 allowZip64=True) as npz:
+                for key, npy in self._files.items():
+                    code = self._typecodes[key]
+                    npy.seek(0)
+                    npy.write(self._npy_header(self._descr(code),
+                                               self.rows[key]))
+                    npy.close()
+                    npz.write(npy.name, key + '.npy')
+                for key, values in self._strings.items():
+                    width = max([len(value) for value in values] + [1])
+                    data = b''.join(value.ljust(width, b'\0')
+                                    for value in values)
+                    npz.writestr(key + '.npy', self._npy_header(
+                        '|S%d' % width, len(values)) + data)
+        finally:
+            for npy in self._files.values():
+                npy.close()
+            shutil.rmtree(self._tmp_dir)
+
+    @classmethod
+    def _descr(cls, typecode):
+        """ numpy dtype description for an array typecode
+
+        >>> NpzWriter._descr('d') in ('<f8', '>f8')
+        True
+        """
+        order = '<' if sys.byteorder == 'little' else '>'
+        size = array(typecode).itemsize
+        return '%s%s%d' % ('|' if size == 1 else order, cls.KINDS[typecode],
+                           size)
+
+    @classmethod
+    def _npy_header(cls, descr, rows):
+        """ '.npy' version 1.0 header padded to NPY_HEADER_SIZE
+
+        >>> len(NpzWriter._npy_header('<u4', 3))
+        128
+        """
+        header = ("{'descr': '%s', 'fortran_order': False, "
+                  "'shape': (%d,), }" % (descr, rows))
+        header_size = cls.NPY_HEADER_SIZE - len(cls.NPY_MAGIC) - 2
+        header = header.ljust(header_size - 1) + '\n'
+        return (cls.NPY_MAGIC + struct.pack('<H', header_size) +
+                header.encode('ascii'))
+
+
+def convert(path, output, start=None, end=None, block_size=BLOCK_SIZE):
+    """ Convert OML file `path` to a numpy '.npz' file
+
+    Arrays are named with the measures fields, prefixed by the schema name
+    and a '.' if there are multiple measurement points in the file.
+
+    :returns: number of measures written
+    """
+    measures = 0
+    with OmlFile(path) as oml:
+        prefixed = len(oml.data_schemas) > 1
+        writer = NpzWriter(output)
+        try:
+            for schema, columns in oml.blocks(start, end, block_size):
+                if schema.name == METADATA_SCHEMA:
+                    continue
+                prefix = schema.name + '.' if prefixed else ''
+                writer.write(columns, prefix)
+                measures += len(next(iter(columns.values()), ()))
+        finally:
+            writer.close()
+    return measures
@@ -24,7 +24,11 @@
 """ OpenOCD commands """
 
 import os
+import time
+import zlib
 import shlex
+import socket
+import tempfile
 import subprocess
 
 import atexit
@@ -33,14 +37,17 @@ import logging
 from collections import namedtuple
 
 from gateway_code import common
+from gateway_code import config
 from . import subprocess_timeout
+from .firmware_cache import file_sha256
+from .firmware_image import FirmwareImage
 
 LOGGER = logging.getLogger('gateway_code')
 
 OpenOCDArgs = namedtuple("OpenOCDArgs", ['path', 'config_file', 'opts'])
 
 
-class OpenOCD(object):
+class OpenOCD(object):  # pylint:disable=too-many-instance-attributes
     """ Debugger class, implemented as a global variable storage """
     DEVNULL = open(os.devnull, 'w')
 
@@ -60,24 +67,57 @@ class OpenOCD(object):
              ' -c "reset run"'
              ' -c "shutdown"')
 
+    # Differential flash, only changed sectors are written
+    FLASH_SECTORS = (' -c "reset halt"'
+                     ' -c "reset init"'
+                     '{writes}'
+                     ' -c "verify_image {0}"'
+                     ' -c "reset run"'
+                     ' -c "shutdown"')
+    WRITE_SECTORS = ' -c "flash write_image erase {0} {1} bin"'
+    ERASED = b'\xff'
+
     FLASH_BIN = (' -c "reset halt"'
                  ' -c "reset init"'
                  ' -c "program {0} verify {1}"'
                  ' -c "reset run"'
                  ' -c "shutdown"')
 
+    VERIFY = (' -c "reset halt"'
+              ' -c "reset init"'
+              ' -c "verify_image {0}"'
+              ' -c "reset run"'
+              ' -c "shutdown"')
+
+    VERIFY_BIN = (' -c "reset halt"'
+                  ' -c "reset init"'
+                  ' -c "verify_image {0} {1} bin"'
+                  ' -c "reset run"'
+                  ' -c "shutdown"')
+
     DEBUG = ' -c "reset halt"'
     TIMEOUT = 100
 
-    def __init__(self, openocd_args,
-                 verb=False, timeout=TIMEOUT):
+    def __init__(self, openocd_args,  # pylint:disable=too-many-arguments
+                 verb=False, timeout=TIMEOUT, server=False, sector_size=None):
         self.openocd_path = openocd_args.path
         self.config = self._config(openocd_args.config_file, openocd_args.opts)
         self.timeout = timeout
+        # Flash erase unit multiple, None disables differential flash
+        self.sector_size = sector_size
 
         self.out = None if verb else self.DEVNULL
 
+        self.server = None
+        if server:
+            self.server = OpenOCDServer(self.openocd_path, self.config,
+                                        self.out, self.timeout)
+
         self._debug = None
+        # (sha256, binary, offset) of the last image flashed
+        self._flashed = None
+        # {sector address: crc32} of the last elf image flashed
+        self._flashed_sectors = None
         atexit.register(self.debug_stop)
 
     @staticmethod
@@ -105,20 +145,144 @@ class OpenOCD(object):
         return self._call_cmd(self.RESET)
 
     def flash(self, fw_file, binary=False, offset=0):
-        """ Flash firmware """
+        """ Flash firmware
+
+        When the same image was the last one flashed, only verify it is
+        still on target and skip erase/write if it is.
+
+        With a `sector_size`, an elf image is compared by sector with the
+        last one flashed and only changed sectors are erased and written.
+        The whole image is verified, on error it is completely flashed. """
         try:
             path = common.abspath(fw_file)
-            if binary:
-                return self._call_cmd(self.FLASH_BIN.format(path, hex(offset)))
-            return self._call_cmd(self.FLASH.format(path))
         except IOError as err:
             LOGGER.error('%s', err)
             return 1
 
+        image = self._image(path, binary, offset)
+        if image is not None and image == self._flashed:
+            if self._verify(path, binary, offset):
+                LOGGER.info('Firmware already flashed, skip flash: %s', path)
+                return 0
+            # Flash content is not the one recorded anymore
+            self._flashed_sectors = None
+
+        self._flashed = None
+        previous, self._flashed_sectors = self._flashed_sectors, None
+        sectors = None if binary else self._image_sectors(path)
+        ret = 1
+        if sectors is not None and previous is not None:
+            ret = self._flash_sectors(path, sectors, previous)
+            if ret != 0:
+                LOGGER.warning('Differential flash failed, flash all image')
+        if ret != 0:
+            ret = self._flash_image(path, binary, offset)
+        if ret == 0:
+            self._flashed = image
+            self._flashed_sectors = self._sectors_crc(sectors)
+        return ret
+
+    def _flash_image(self, path, binary=False, offset=0):
+        """ Erase and write all the firmware image """
+        if binary:
+            return self._call_cmd(self.FLASH_BIN.format(path, hex(offset)))
+        return self._call_cmd(self.FLASH.format(path))
+
+    def _image_sectors(self, path):
+        """ Return {sector address: data} of elf image at `path`
+
+        Data not in the image is left erased. None if differential flash is
+        disabled or image cannot be read. """
+        if self.sector_size is None:
+            return None
+        try:
+            image = FirmwareImage.from_elf(path)
+        except (IOError, ValueError):
+            return None
+
+        size = self.sector_size
+        sectors = {}
+        for addr, data in image.sections:
+            start, end = addr, addr + len(data)
+            while start < end:
+                sector = start - start % size
+                stop = min(end, sector + size)
+                buf = sectors.setdefault(sector, bytearray(self.ERASED * size))
+                buf[start - sector:stop - sector] = \
+                    data[start - addr:stop - addr]
+                start = stop
+        return sectors
+
+    @staticmethod
+    def _sectors_crc(sectors):
+        """ Return {sector address: crc32} of `sectors`
+
+        >>> OpenOCD._sectors_crc({0: bytearray(b'abc')})
+        {0: 891568578}
+        >>> OpenOCD._sectors_crc(None)
+        """
+        if sectors is None:
+            return None
+        return dict((addr, zlib.crc32(bytes(data)) & 0xffffffff)
+                    for addr, data in sectors.items())
+
+    def _flash_sectors(self, path, sectors, previous):
+        """ Erase and write sectors changed from `previous`, verify image
+
+        Consecutive changed sectors are written at once. """
+        current = self._sectors_crc(sectors)
+        changed = [addr for addr in sorted(sectors)
+                   if previous.get(addr) != current[addr]]
+        LOGGER.info('Differential flash: %d/%d sectors changed',
+                    len(changed), len(sectors))
+
+        runs = []
+        for addr in changed:
+            if runs and runs[-1][0] + len(runs[-1][1]) == addr:
+                runs[-1][1].extend(sectors[addr])
+            else:
+                runs.append((addr, bytearray(sectors[addr])))
+
+        run_files = []
+        try:
+            writes = ''
+            for addr, data in runs:
+                run_file = tempfile.NamedTemporaryFile(suffix='.bin')
+                run_files.append(run_file)
+                run_file.write(data)
+                run_file.flush()
+                writes += self.WRITE_SECTORS.format(run_file.name, hex(addr))
+            return self._call_cmd(self.FLASH_SECTORS.format(path,
+                                                            writes=writes))
+        finally:
+            for run_file in run_files:
+                run_file.close()
+
+    @staticmethod
+    def _image(path, binary, offset):
+        """ Return flashed image identifier, None if it cannot be read """
+        try:
+            return (file_sha256(path), binary, offset)
+        except IOError:
+            return None
+
+    def _verify(self, path, binary=False, offset=0):
+        """ Return if firmware `path` is the one currently on target """
+        if binary:
+            cmd = self.VERIFY_BIN.format(path, hex(offset))
+        else:
+            cmd = self.VERIFY.format(path)
+        return self._call_cmd(cmd) == 0
+
     def debug_start(self):
         """ Start a debugger process """
         LOGGER.debug('Debug start')
         self.debug_stop()  # kill previous process
+        if self.server is not None:
+            self.server.stop()  # release the probe
+        # Flash may be modified through the debugger
+        self._flashed = None
+        self._flashed_sectors = None
         self._debug = subprocess.Popen(**self._openocd_args(self.DEBUG))
         LOGGER.debug('Debug started')
         return 0
@@ -145,6 +309,13 @@ class OpenOCD(object):
             LOGGER.error("OpenOCD is in 'debug' mode, stop it to flash/reset")
             return 1
 
+        if self.server is not None:
+            try:
+                return self.server.call(self._server_commands(command_str))
+            except (IOError, OSError) as err:
+                LOGGER.warning('OpenOCD server error: %r, run one shot', err)
+                self.server.stop()
+
         kwargs = self._openocd_args(command_str)
         try:
             return subprocess_timeout.call(timeout=self.timeout, **kwargs)
@@ -152,6 +323,23 @@ class OpenOCD(object):
             LOGGER.error("Openocd '%s' timeout: %s", command_str, exc)
             return 1
 
+    @staticmethod
+    def _server_commands(command_str):
+        """ Commands list from one shot `command_str` for openocd server
+
+        >>> OpenOCD._server_commands(OpenOCD.RESET)
+        ['reset run']
+        >>> OpenOCD._server_commands(OpenOCD.FLASH.format('/tmp/fw.elf'))
+        ... # doctest: +NORMALIZE_WHITESPACE
+        ['reset halt', 'reset init', 'flash write_image erase /tmp/fw.elf',
+         'verify_image /tmp/fw.elf', 'reset run']
+        """
+        args = shlex.split(command_str)
+        commands = [cmd for opt, cmd in zip(args[::2], args[1::2])
+                    if opt == '-c']
+        # server keeps running
+        return [cmd for cmd in commands if cmd != 'shutdown']
+
     def _openocd_args(self, command_str):
         """ Get subprocess arguments for command_str """
         # Generate full command arguments
@@ -168,13 +356,139 @@ class OpenOCD(object):
         * nodeclass.OPENOCD_PATH: openocd command full path (optional)
         * nodeclass.OPENOCD_OPTS iterable telling other config options
           (optional) They will be added after configuration file with '-f'
+        * nodeclass.OPENOCD_SECTOR_SIZE flash erase unit, or a multiple,
+          enables differential flash (optional)
+
+        Server mode is used when enabled in gateway configuration.
         """
         if not hasattr(nodeclass, "OPENOCD_PATH"):
             nodeclass.OPENOCD_PATH = "openocd"
         if not hasattr(nodeclass, "OPENOCD_OPTS"):
             nodeclass.OPENOCD_OPTS = ()
+        kwargs.setdefault('server', server_mode())
+        kwargs.setdefault('sector_size',
+                          getattr(nodeclass, 'OPENOCD_SECTOR_SIZE', None))
 
         return cls(OpenOCDArgs(nodeclass.OPENOCD_PATH,
                                nodeclass.OPENOCD_CFG_FILE,
                                nodeclass.OPENOCD_OPTS),
                    *args, **kwargs)
+
+
+def server_mode():
+    """ Persistent openocd server mode is enabled in gateway config
+
+    As the server keeps the probe open, other openocd instances, like the
+    command line flash tools, cannot use it while the gateway server runs.
+    """
+    try:
+        return common.booleanize(config.read_config('openocd_server', 'no'))
+    except ValueError:
+        return False
+
+
+class OpenOCDServer(object):
+    """ Long running openocd process, commands are sent on its TCL RPC port
+
+    It removes the process start and probe initialization from each command.
+    """
+    SERVER = ('{openocd_path} --debug=0'
+              ' {config}'
+              ' -c "bindto 127.0.0.1"'
+              ' -c "gdb_port disabled"'
+              ' -c "telnet_port disabled"'
+              ' -c "tcl_port {port}"'
+              ' -c "init"'
+              ' -c "targets"')
+    TERMINATOR = b'\x1a'
+    START_TIMEOUT = 10.0
+
+    def __init__(self, openocd_path, config_opts, out=None,
+                 timeout=OpenOCD.TIMEOUT):
+        self.openocd_path = openocd_path
+        self.config = config_opts
+        self.out = out
+        self.timeout = timeout
+        self.port = None
+
+        self.process = None
+        self._sock = None
+        atexit.register(self.stop)
+
+    def call(self, commands):
+        """ Run `commands` on openocd server, stop on first error
+
+        :returns: 0 on success
+        :raises IOError: on communication error """
+        self.start()
+        for command in commands:
+            ret = self._rpc('catch {%s}' % command)
+            if ret.strip() != '0':
+                LOGGER.error("OpenOCD server command failed: '%s'", command)
+                return 1
+        return 0
+
+    def start(self):
+        """ Start openocd server if not already running
+
+        :raises IOError: if server cannot be started """
+        if self.process is not None and self.process.poll() is None:
+            return
+        self.stop()
+
+        self.port = self._free_port()
+        cmd = self.SERVER.format(openocd_path=self.openocd_path,
+                                 config=self.config, port=self.port)
+        LOGGER.debug('OpenOCD server start on port %d', self.port)
+        self.process = subprocess_timeout.Popen(
+            shlex.split(cmd), stdout=self.out, stderr=self.out)
+
+        t_end = time.time() + self.START_TIMEOUT
+        while self._sock is None:
+            try:
+                self._sock = socket.create_connection(('127.0.0.1', self.port),
+                                                      timeout=self.timeout)
+            except (IOError, OSError):
+                if self.process.poll() is not None or time.time() > t_end:
+                    self.stop()
+                    raise IOError('OpenOCD server start failed')
+                time.sleep(0.1)
+
+    def stop(self):
+        """ Stop openocd server """
+        if self._sock is not None:
+            self._sock.close()
+            self._sock = None
+        if self.process is None:
+            return 0
+        LOGGER.debug('OpenOCD server stop')
+        try:
+            self.process.terminate()
+            self.process.wait(timeout=5)
+        except subprocess_timeout.TimeoutExpired:
+            self.process.kill()
+        except OSError:
+            pass  # already terminated
+        self.process = None
+        return 0
+
+    def _rpc(self, command):
+        """ Send `command` to TCL RPC server and return its answer """
+        self._sock.sendall(command.encode() + self.TERMINATOR)
+        answer = b''
+        while not answer.endswith(self.TERMINATOR):
+            data = self._sock.recv(4096)
+            if not data:
+                raise IOError('OpenOCD server connection closed')
+            answer += data
+        return answer[:-len(self.TERMINATOR)].decode()
+
+    @staticmethod
+    def _free_port():
+        """ Return an available local TCP port """
+        sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        try:
+            sock.bind(('127.0.0.1', 0))
+            return sock.getsockname()[1]
+        finally:
+            sock.close()
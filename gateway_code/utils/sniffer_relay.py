@@ -0,0 +1,501 @@
+# -*- coding: utf-8 -*-
+
+# This file is a part of IoT-LAB gateway_code
+# Copyright (C) 2015 INRIA (Contact: admin@iot-lab.info)
+# Contributor(s) : see AUTHORS file
+#
+# This software is governed by the CeCILL license under French law
+# and abiding by the rules of distribution of free software.  You can  use,
+# modify and/ or redistribute the software under the terms of the CeCILL
+# license as circulated by CEA, CNRS and INRIA at the following URL
+# http://www.cecill.info.
+#
+# As a counterpart to the access to the source code and  rights to copy,
+# modify and redistribute granted by the license, users are provided only
+# with a limited warranty  and the software's author,  the holder of the
+# economic rights,  and the successive licensors  have only  limited
+# liability.
+#
+# The fact that you are presently reading this means that you have had
+# knowledge of the CeCILL license and that you accept its terms.
+
+
+""" Sniffer relay: share the control node sniffer stream between clients
+
+`control node serial program` sends sniffed packets as ZEP frames to only
+one TCP client. The relay is this client: it splits the stream in frames,
+sends them to all the clients connected to its own port, writes them in
+pcapng files and counts packets and CRC errors per channel.
+
+Frames in CRC mode end with the frame check sequence. In LQI mode, the
+control node replaces it with LQI and RSSI values: they are removed in
+pcapng files, written on an interface without FCS.
+
+Frames are `memoryview` slices of the received data, only an incomplete
+frame is copied. Each client has a bounded queue of frames, frames for a
+slow client are dropped without impacting the others.
+"""
+
+import os
+import time
+import errno
+import select
+import socket
+import struct
+import logging
+import threading
+from collections import deque, namedtuple
+
+from gateway_code import config
+
+LOGGER = logging.getLogger('gateway_code')
+
+SNIFFER_PORT = 30000
+UPSTREAM_PORT = 30001
+CHUNK_SIZE = 4096
+CLIENT_QUEUE_SIZE = 1024
+PCAP_MAX_SIZE = 64 * 1024 * 1024
+PCAP_MAX_FILES = 8
+RECONNECT_DELAY = 1.0
+SELECT_TIMEOUT = 0.2
+
+# ZEP v2 data header, see 'measures_handler.c'
+ZEP_PREAMBLE = b'EX'
+ZEP_HEADER = struct.Struct('!2sBBBHBBIII10xB')
+ZEP_CRC_MODE = 1
+ZepHeader = namedtuple('ZepHeader', [
+    'preamble', 'version', 'type', 'channel', 'device_id', 'mode', 'lqi',
+    'ntp_s', 'ntp_frac', 'seqno', 'length'])
+
+# NTP epoch is 1900
+JAN_1970 = 2208988800
+
+LINKTYPE_IEEE802_15_4_WITHFCS = 195
+LINKTYPE_IEEE802_15_4_NOFCS = 230
+# PcapngWriter interfaces ids
+PCAP_LINKTYPES = (LINKTYPE_IEEE802_15_4_WITHFCS, LINKTYPE_IEEE802_15_4_NOFCS)
+PCAP_FCS, PCAP_NOFCS = range(2)
+
+
+def split_frames(buf, size=None):
+    """ Split ZEP frames in `buf` first `size` bytes
+
+    Bytes before a frame preamble are skipped.
+
+    :returns: (frames, index, skipped) `frames` are `memoryview` slices,
+        `index` is the start of the incomplete data.
+
+    >>> buf = bytearray(ZEP_HEADER.size + 2)
+    >>> buf[0:2] = ZEP_PREAMBLE
+    >>> buf[ZEP_HEADER.size - 1] = 2
+    >>> data = bytearray(b'?') + buf + buf[:10]
+    >>> frames, index, skipped = split_frames(data)
+    >>> [len(frame) for frame in frames], index, skipped
+    ([34], 35, 1)
+    """
+    size = len(buf) if size is None else size
+    view = memoryview(buf)
+    frames = []
+    index = 0
+    skipped = 0
+    while index < size:
+        start = buf.find(ZEP_PREAMBLE, index, size)
+        if start < 0:
+            # last byte may be the start of a preamble
+            start = max(index, size - 1)
+        skipped += start - index
+        index = start
+        if size - index < ZEP_HEADER.size:
+            break
+        end = index + ZEP_HEADER.size + buf[index + ZEP_HEADER.size - 1]
+        if end > size:
+            break
+        frames.append(view[index:end])
+        index = end
+    return frames, index, skipped
+
+
+def zep_header(frame):
+    """ Decode `frame` ZEP header """
+    return ZepHeader._make(ZEP_HEADER.unpack_from(frame))
+
+
+def zep_timestamp(header):
+    """ Frame timestamp in microseconds since 1970 """
+    return ((header.ntp_s - JAN_1970) * 1000000 +
+            ((header.ntp_frac * 1000000) >> 32))
+
+
+def _crc_table():
+    """ CRC-16 ITU-T reflected (0x8408) lookup table """
+    table = []
+    for byte in range(256):
+        crc = byte
+        for _ in range(8):
+            crc = (crc >> 1) ^ 0x8408 if crc & 1 else crc >> 1
+        table.append(crc)
+    return table
+
+
+CRC_TABLE = _crc_table()
+
+
+def fcs(data):
+    """ IEEE 802.15.4 frame check sequence
+
+    >>> hex(fcs(b'123456789'))
+    '0x2189'
+    """
+    crc = 0
+    for byte in bytearray(data):
+        crc = (crc >> 8) ^ CRC_TABLE[(crc ^ byte) & 0xff]
+    return crc
+
+
+def fcs_valid(payload):
+    """ Check `payload` last two bytes frame check sequence """
+    if len(payload) < 2:
+        return False
+    received, = struct.unpack_from('<H', payload, len(payload) - 2)
+    return fcs(payload[:-2]) == received
+
+
+class PcapngWriter(object):
+    """ Write packets in pcapng files rotated when reaching `max_size`
+
+    Files are 'path', then 'path' with '.1', '.2', ... before the extension.
+    A file is only created when writing its first packet. After `max_files`
+    files, packets are dropped.
+
+    Each file has one interface for each of `linktypes`, packets are
+    written on the interface index given to `write`.
+    """
+    SHB = struct.Struct('<IIIHHqI')
+    IDB = struct.Struct('<IIHHII')
+    EPB = struct.Struct('<IIIIIII')
+    SNAPLEN = 0xffff
+
+    def __init__(self, path, max_size=PCAP_MAX_SIZE,
+                 max_files=PCAP_MAX_FILES, linktypes=PCAP_LINKTYPES):
+        self.path = path
+        self.max_size = max_size
+        self.max_files = max_files
+        self.linktypes = linktypes
+        self.paths = []
+        self.dropped = 0
+        self._file = None
+        self._size = 0
+
+    def _next_path(self):
+        """ Path of the next file """
+        if not self.paths:
+            return self.path
+        root, ext = os.path.splitext(self.path)
+        return '{0}.{1}{2}'.format(root, len(self.paths), ext)
+
+    def _open(self):
+        """ Open a new file and write section and interface headers """
+        self.close()
+        path = self._next_path()
+        self._file = open(config.create_user_file(path), 'wb')
+        self.paths.append(path)
+        self._file.write(self.SHB.pack(0x0A0D0D0A, self.SHB.size, 0x1A2B3C4D,
+                                       1, 0, -1, self.SHB.size))
+        for linktype in self.linktypes:
+            self._file.write(self.IDB.pack(1, self.IDB.size, linktype, 0,
+                                           self.SNAPLEN, self.IDB.size))
+        self._size = self.SHB.size + self.IDB.size * len(self.linktypes)
+
+    def write(self, timestamp_us, packet, interface=0):
+        """ Write `packet` received at `timestamp_us` on `interface` """
+        padding = -len(packet) % 4
+        length = self.EPB.size + len(packet) + padding + 4
+        if self._file is None or self._size + length > self.max_size:
+            if len(self.paths) >= self.max_files:
+                self._drop()
+                return
+            self._open()
+        self._file.write(self.EPB.pack(
+            6, length, interface, timestamp_us >> 32,
+            timestamp_us & 0xffffffff, len(packet), len(packet)))
+        self._file.write(packet)
+        self._file.write(struct.pack('<{0}xI'.format(padding), length))
+        self._size += length
+
+    def _drop(self):
+        """ Drop packet, files count limit reached """
+        if not self.dropped:
+            LOGGER.warning('Sniffer capture limit reached: %d files, '
+                           'packets not saved anymore', self.max_files)
+            self.close()
+        self.dropped += 1
+
+    def flush(self):
+        """ Flush current file """
+        if self._file is not None:
+            self._file.flush()
+
+    def close(self):
+        """ Close current file """
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+
+class _Client(object):  # pylint:disable=too-few-public-methods
+    """ Relay client frames queue """
+    def __init__(self, address):
+        self.address = address
+        self.pending = deque()
+        self.offset = 0
+        self.dropped = 0
+
+
+class SnifferRelay(object):  # pylint:disable=too-many-instance-attributes
+    """ Relay control node sniffer frames to several clients
+
+    Runs in a thread, started and stopped like `ExternalProcess` helpers.
+
+    :param port: clients TCP port
+    :param upstream_port: `control node serial program` sniffer port
+    :param pcap: pcapng files path, no capture if None
+
+    With `port` 0, it is updated with the selected port on start.
+    """
+    NAME = 'sniffer_relay'
+
+    def __init__(self, port=SNIFFER_PORT, upstream_port=UPSTREAM_PORT,
+                 pcap=None, pcap_max_size=PCAP_MAX_SIZE, host=''):
+        self.port = port
+        self.upstream_port = upstream_port
+        self.host = host
+        self.pcap = pcap
+        self.pcap_max_size = pcap_max_size
+        self.writer = None
+        self.counters = {}
+        self.dropped = 0
+        self.skipped = 0
+        self.high_water = 0
+
+        self._lock = threading.Lock()
+        self._thread = None
+        self._run = False
+        self._server = None
+        self._upstream = None
+        self._leftover = b''
+        self._connect_time = 0
+        self._clients = {}
+
+    def start(self):
+        """ Listen for clients and start relay thread """
+        if self._thread is not None:
+            return 0
+        try:
+            self._server = self._listen()
+        except socket.error as err:
+            LOGGER.error('%s: listen on port %d failed: %s',
+                         self.NAME, self.port, err)
+            return 1
+        self.port = self._server.getsockname()[1]
+        LOGGER.debug('%s start', self.NAME)
+        self.counters = {}
+        self.dropped = 0
+        self.skipped = 0
+        self.high_water = 0
+        if self.pcap is not None:
+            self.writer = PcapngWriter(self.pcap, self.pcap_max_size)
+        self._run = True
+        self._thread = threading.Thread(target=self._target)
+        self._thread.daemon = True
+        self._thread.start()
+        return 0
+
+    def stop(self):
+        """ Stop relay thread and close clients connections and files """
+        if self._thread is None:
+            return 0
+        self._run = False
+        self._thread.join()
+        self._thread = None
+
+        for sock in list(self._clients):
+            self._close_client(sock)
+        self._close_upstream()
+        self._server.close()
+        self._server = None
+        if self.writer is not None:
+            self.writer.close()
+        LOGGER.debug('%s stopped: %r', self.NAME, self.stats())
+        return 0
+
+    def stats(self):
+        """ Relay counters
+
+        'channels' has 'packets' and 'crc_errors' counters per channel.
+        'dropped' are frames not sent to a slow client, 'queue_high_water'
+        the maximum number of frames waiting for a client. 'pcap_dropped'
+        are frames not saved after reaching the capture files limit. """
+        with self._lock:
+            channels = dict((channel, dict(counters))
+                            for channel, counters in self.counters.items())
+            pcap_dropped = self.writer.dropped if self.writer else 0
+        return {'channels': channels, 'clients': len(self._clients),
+                'dropped': self.dropped, 'skipped': self.skipped,
+                'pcap_dropped': pcap_dropped,
+                'queue_high_water': self.high_water,
+                'queue_size': CLIENT_QUEUE_SIZE}
+
+    def _listen(self):
+        """ Clients server socket """
+        server = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        server.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        try:
+            server.bind((self.host, self.port))
+            server.listen(5)
+        except socket.error:
+            server.close()
+            raise
+        server.setblocking(False)
+        return server
+
+    def _target(self):
+        """ Relay loop """
+        while self._run:
+            if self._upstream is None and time.time() >= self._connect_time:
+                self._connect()
+
+            readers = [self._server] + list(self._clients)
+            if self._upstream is not None:
+                readers.append(self._upstream)
+            writers = [sock for sock, client in self._clients.items()
+                       if client.pending]
+            readable, writable, _ = select.select(readers, writers, [],
+                                                  SELECT_TIMEOUT)
+            for sock in readable:
+                if sock is self._server:
+                    self._accept()
+                elif sock is self._upstream:
+                    self._read_upstream()
+                else:
+                    self._read_client(sock)
+            for sock in writable:
+                if sock in self._clients:
+                    self._send(sock)
+
+    def _connect(self):
+        """ Connect to `control node serial program` sniffer server """
+        try:
+            self._upstream = socket.create_connection(
+                ('127.0.0.1', self.upstream_port), RECONNECT_DELAY)
+        except socket.error as err:
+            LOGGER.debug('%s: connection failed: %s', self.NAME, err)
+            self._connect_time = time.time() + RECONNECT_DELAY
+        else:
+            LOGGER.debug('%s: connected to port %d', self.NAME,
+                         self.upstream_port)
+
+    def _close_upstream(self):
+        """ Close upstream connection, reconnect later """
+        if self._upstream is not None:
+            self._upstream.close()
+            self._upstream = None
+        self._leftover = b''
+        self._connect_time = time.time() + RECONNECT_DELAY
+
+    def _read_upstream(self):
+        """ Read frames from upstream and relay them """
+        # New buffer as frames are slices of it
+        buf = bytearray(CHUNK_SIZE)
+        view = memoryview(buf)
+        left = len(self._leftover)
+        view[:left] = self._leftover
+        try:
+            nbytes = self._upstream.recv_into(view[left:])
+        except socket.error as err:
+            LOGGER.warning('%s: upstream error: %s', self.NAME, err)
+            nbytes = 0
+        if not nbytes:
+            self._close_upstream()
+            return
+
+        size = left + nbytes
+        frames, index, skipped = split_frames(buf, size)
+        self._leftover = view[index:size].tobytes()
+        self.skipped += skipped
+        self._relay(frames)
+
+    def _relay(self, frames):
+        """ Count, save and queue `frames` for clients """
+        with self._lock:
+            for frame in frames:
+                header = zep_header(frame)
+                payload = frame[ZEP_HEADER.size:]
+                counters = self.counters.setdefault(
+                    header.channel, {'packets': 0, 'crc_errors': 0})
+                counters['packets'] += 1
+                if header.mode == ZEP_CRC_MODE and not fcs_valid(payload):
+                    counters['crc_errors'] += 1
+                if self.writer is not None:
+                    self._write_pcap(header, payload)
+
+        if self.writer is not None:
+            self.writer.flush()
+
+        for client in self._clients.values():
+            available = CLIENT_QUEUE_SIZE - len(client.pending)
+            client.pending.extend(frames[:available])
+            self.high_water = max(self.high_water, len(client.pending))
+            dropped = max(0, len(frames) - available)
+            client.dropped += dropped
+            self.dropped += dropped
+
+    def _write_pcap(self, header, payload):
+        """ Write frame payload, without LQI mode trailing values """
+        if header.mode == ZEP_CRC_MODE:
+            self.writer.write(zep_timestamp(header), payload, PCAP_FCS)
+        else:
+            self.writer.write(zep_timestamp(header), payload[:-2],
+                              PCAP_NOFCS)
+
+    def _accept(self):
+        """ Accept a new client """
+        try:
+            sock, address = self._server.accept()
+        except socket.error:
+            return
+        sock.setblocking(False)
+        self._clients[sock] = _Client(address)
+        LOGGER.debug('%s: client %r connected', self.NAME, address)
+
+    def _close_client(self, sock):
+        """ Close client connection """
+        client = self._clients.pop(sock)
+        sock.close()
+        LOGGER.debug('%s: client %r disconnected, %d frames dropped',
+                     self.NAME, client.address, client.dropped)
+
+    def _read_client(self, sock):
+        """ Clients do not send data, detect disconnection """
+        try:
+            data = sock.recv(CHUNK_SIZE)
+        except socket.error:
+            data = b''
+        if not data:
+            self._close_client(sock)
+
+    def _send(self, sock):
+        """ Send pending frames to client """
+        client = self._clients[sock]
+        while client.pending:
+            frame = client.pending[0]
+            try:
+                sent = sock.send(frame[client.offset:])
+            except socket.error as err:
+                if err.errno not in (errno.EAGAIN, errno.EWOULDBLOCK):
+                    self._close_client(sock)
+                return
+            client.offset += sent
+            if client.offset < len(frame):
+                return
+            client.pending.popleft()
+            client.offset = 0
@@ -61,8 +61,9 @@ class TestsCC2538Methods(unittest.TestCase):
 
         call_mock.return_value = 42
         ret = self.cc2538.flash(NodeFirefly.FW_AUTOTEST)
-        # call is called twice and the ret codes are summed up
-        self.assertEqual(84, ret)
+        # only the flash command is run, conversion is done in-process
+        self.assertEqual(42, ret)
+        self.assertEqual(2, call_mock.call_count)
 
     def test_reset(self, call_mock):
         """ Test reset"""
@@ -0,0 +1,58 @@
+# -*- coding: utf-8 -*-
+
+# This file is a part of IoT-LAB gateway_code
+# Copyright (C) 2015 INRIA (Contact: admin@iot-lab.info)
+# Contributor(s) : see AUTHORS file
+#
+# This software is governed by the CeCILL license under French law
+# and abiding by the rules of distribution of free software.  You can  use,
+# modify and/ or redistribute the software under the terms of the CeCILL
+# license as circulated by CEA, CNRS and INRIA at the following URL
+# http://www.cecill.info.
+#
+# As a counterpart to the access to the source code and  rights to copy,
+# modify and redistribute granted by the license, users are provided only
+# with a limited warranty  and the software's author,  the holder of the
+# economic rights,  and the successive licensors  have only  limited
+# liability.
+#
+# The fact that you are presently reading this means that you have had
+# knowledge of the CeCILL license and that you accept its terms.
+
+
+""" test cli oml_convert module """
+
+import unittest
+
+import mock
+
+from ..cli import oml_convert
+
+
+class TestOmlConvertMain(unittest.TestCase):
+    """ Main function tests """
+
+    @mock.patch('gateway_code.utils.oml_reader.convert')
+    def test_main_function(self, convert):
+        """ Test cli.oml_convert main function """
+        convert.return_value = 10
+
+        args = ['oml_convert', '--start', '1500000000', 'm3-1.oml']
+        with mock.patch('sys.argv', args):
+            self.assertEqual(0, oml_convert.main())
+        convert.assert_called_with('m3-1.oml', 'm3-1.npz', 1500000000.0,
+                                   None, oml_convert.oml_reader.BLOCK_SIZE)
+
+        args = ['oml_convert', 'm3-1.oml', 'out.npz', '--end', '10']
+        with mock.patch('sys.argv', args):
+            self.assertEqual(0, oml_convert.main())
+        convert.assert_called_with('m3-1.oml', 'out.npz', None, 10.0,
+                                   oml_convert.oml_reader.BLOCK_SIZE)
+
+    @mock.patch('gateway_code.utils.oml_reader.convert')
+    def test_main_error(self, convert):
+        """ Test cli.oml_convert main function with invalid file """
+        convert.side_effect = ValueError('Invalid OML file')
+        with mock.patch('sys.argv', ['oml_convert', 'm3-1.oml']):
+            with mock.patch('sys.stderr'):
+                self.assertRaises(SystemExit, oml_convert.main)
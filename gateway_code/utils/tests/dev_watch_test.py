@@ -0,0 +1,107 @@
+# -*- coding:utf-8 -*-
+
+# This file is a part of IoT-LAB gateway_code
+# Copyright (C) 2015 INRIA (Contact: admin@iot-lab.info)
+# Contributor(s) : see AUTHORS file
+#
+# This software is governed by the CeCILL license under French law
+# and abiding by the rules of distribution of free software.  You can  use,
+# modify and/ or redistribute the software under the terms of the CeCILL
+# license as circulated by CEA, CNRS and INRIA at the following URL
+# http://www.cecill.info.
+#
+# As a counterpart to the access to the source code and  rights to copy,
+# modify and redistribute granted by the license, users are provided only
+# with a limited warranty  and the software's author,  the holder of the
+# economic rights,  and the successive licensors  have only  limited
+# liability.
+#
+# The fact that you are presently reading this means that you have had
+# knowledge of the CeCILL license and that you accept its terms.
+
+
+# pylint: disable=missing-docstring
+# pylint: disable=invalid-name
+# pylint: disable=protected-access
+
+import os
+import time
+import shutil
+import tempfile
+import threading
+import unittest
+
+import mock
+
+from gateway_code import common
+from gateway_code.utils import dev_watch
+
+
+def _delayed(delay, func, *args):
+    timer = threading.Timer(delay, func, args)
+    timer.start()
+    return timer
+
+
+class TestDevWatch(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.path = os.path.join(self.tmp_dir, 'iotlab', 'ttyON_M3')
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir)
+
+    def _create(self):
+        os.makedirs(os.path.dirname(self.path))
+        open(self.path, 'w').close()
+
+    @mock.patch('gateway_code.utils.dev_watch.RECHECK_PERIOD', 10)
+    def test_wait_creation(self):
+        """ Wake up on creation, even in a not yet existing directory """
+        timer = _delayed(0.2, self._create)
+        t_start = time.time()
+        self.assertTrue(dev_watch.wait_path(self.path, True, 5))
+        self.assertLess(time.time() - t_start, 2)
+        timer.join()
+
+    @mock.patch('gateway_code.utils.dev_watch.RECHECK_PERIOD', 10)
+    def test_wait_removal(self):
+        self._create()
+        timer = _delayed(0.2, os.remove, self.path)
+        t_start = time.time()
+        self.assertTrue(dev_watch.wait_path(self.path, False, 5))
+        self.assertLess(time.time() - t_start, 2)
+        timer.join()
+
+    def test_timeout(self):
+        self.assertFalse(dev_watch.wait_path(self.path, True, 0))
+        self.assertTrue(dev_watch.wait_path(self.path, False, 0))
+
+        t_start = time.time()
+        self.assertFalse(dev_watch.wait_path(self.path, True, 0.3))
+        self.assertGreaterEqual(time.time() - t_start, 0.3)
+
+    def test_changed(self):
+        """ Files content changes, directory created after watch start """
+        with dev_watch.DevWatcher(self.path,
+                                  dev_watch.FILES_WATCH_MASK) as watcher:
+            self.assertFalse(watcher.changed())
+            self.assertFalse(watcher.changed())
+            self._create()
+            self.assertTrue(watcher.changed())
+            self.assertFalse(watcher.changed())
+            with open(self.path, 'w') as dev:
+                dev.write('content')
+            self.assertTrue(watcher.changed())
+            self.assertFalse(watcher.changed())
+
+    @mock.patch('gateway_code.utils.dev_watch._LIBC', None)
+    def test_unavailable(self):
+        self.assertRaises(dev_watch.DevWatchError,
+                          dev_watch.wait_path, self.path, True, 0)
+
+        # common falls back to polling
+        timer = _delayed(0.2, self._create)
+        self.assertEqual(0, common.wait_tty(self.path, mock.Mock(), 5))
+        timer.join()
@@ -51,8 +51,9 @@ class TestsMethods(unittest.TestCase):
 
         call_mock.return_value = 42
         ret = self.edbg.flash(NodeSamr21.FW_AUTOTEST)
-        # call is called twice and the ret codes are summed up
-        self.assertEqual(84, ret)
+        # only the flash command is run, conversion is done in-process
+        self.assertEqual(42, ret)
+        self.assertEqual(2, call_mock.call_count)
 
     def test_invalid_firmware_path(self):
         ret = self.edbg.flash('/invalid/path')
@@ -22,7 +22,9 @@
 """Test utils.elftarget."""
 
 import os
+import shutil
 import logging
+import tempfile
 import unittest
 import runpy
 
@@ -67,6 +69,87 @@ class TestElfTarget(unittest.TestCase):
             elftarget.elf_target(firmware('wsn430_print_uids.hex'))
         assert 'Not a valid elf file' in str(exc_info.value)
 
+    def test_elf_header_target(self):  # pylint: disable=no-self-use
+        """Test elf target from file first bytes."""
+        def _header(name):
+            with open(firmware(name), 'rb') as _file:
+                return _file.read(64)
+
+        target = elftarget.elf_header_target(_header('m3_idle.elf'))
+        assert target == ('ELFCLASS32', 'EM_ARM')
+        target = elftarget.elf_header_target(_header('leonardo_idle.elf'))
+        assert target == ('ELFCLASS32', 'EM_AVR')
+
+        with pytest.raises(ValueError) as exc_info:
+            elftarget.elf_header_target(_header('idle.c.o'))
+        assert 'Not an executable elf file: ET_REL' in str(exc_info.value)
+        with pytest.raises(ValueError) as exc_info:
+            elftarget.elf_header_target(_header('wsn430_print_uids.hex'))
+        assert 'Not a valid elf file' in str(exc_info.value)
+        with pytest.raises(ValueError) as exc_info:
+            elftarget.elf_header_target(_header('m3_idle.elf')[:10])
+        assert 'Not a valid elf file' in str(exc_info.value)
+
+
+class TestElfInfo(unittest.TestCase):
+    """Test elftarget.elf_info cache."""
+
+    def setUp(self):
+        elftarget.ELF_CACHE.clear()
+        self.tmp_dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        elftarget.ELF_CACHE.clear()
+        shutil.rmtree(self.tmp_dir)
+
+    def test_elf_info(self):
+        """Test elf metadata."""
+        info = elftarget.elf_info(firmware('m3_idle.elf'))
+        self.assertEqual(('ELFCLASS32', 'EM_ARM', 'ET_EXEC'), info[:3])
+        self.assertEqual(elftarget.get_elf_load_addr(firmware('m3_idle.elf')),
+                         info.load_addr)
+        self.assertTrue(info.segments)
+        self.assertTrue(all(seg.filesz <= seg.memsz for seg in info.segments))
+
+        info = elftarget.elf_info(firmware('idle.c.o'))
+        self.assertEqual('ET_REL', info.type)
+        self.assertEqual((), info.segments)
+
+    def test_elf_info_cache(self):
+        """Test elf files are only parsed when modified."""
+        path = os.path.join(self.tmp_dir, 'firmware.elf')
+        shutil.copy(firmware('m3_idle.elf'), path)
+
+        with mock.patch('gateway_code.utils.elftarget.ELFFile',
+                        wraps=elftarget.ELFFile) as elf_file:
+            info = elftarget.elf_info(path)
+            self.assertEqual(('ELFCLASS32', 'EM_ARM'),
+                             elftarget.elf_target(path))
+            self.assertIs(info, elftarget.elf_info(path))
+            self.assertEqual(1, elf_file.call_count)
+
+            # Modified file
+            shutil.copy(firmware('leonardo_idle.elf'), path)
+            os.utime(path, (0, 0))
+            self.assertEqual(('ELFCLASS32', 'EM_AVR'),
+                             elftarget.elf_target(path))
+            self.assertEqual(2, elf_file.call_count)
+
+            # Invalid files are not cached
+            for _ in range(2):
+                self.assertRaises(ValueError, elftarget.elf_info,
+                                  firmware('wsn430_print_uids.hex'))
+            self.assertEqual(4, elf_file.call_count)
+        self.assertRaises(IOError, elftarget.elf_info,
+                          os.path.join(self.tmp_dir, 'no_file.elf'))
+
+    def test_elf_info_cache_size(self):
+        """Test cache is bounded."""
+        with mock.patch('gateway_code.utils.elftarget.ELF_CACHE_SIZE', 1):
+            elftarget.elf_info(firmware('m3_idle.elf'))
+            elftarget.elf_info(firmware('leonardo_idle.elf'))
+        self.assertEqual(1, len(elftarget.ELF_CACHE))
+
 
 class TestElfTargetIsCompatibleWithNode(unittest.TestCase):
     """Test elftarget.is_compatible_with_node."""
@@ -124,7 +207,9 @@ def test_elf_without_load_addr(iter_sections):
     # pylint:disable=unused-argument
     """Test load addr of a firmware without section returns None."""
     # no load addr in elf (because iter_sections function yields nothing)
+    elftarget.ELF_CACHE.clear()
     assert elftarget.get_elf_load_addr(firmware('m3_idle.elf')) is None
+    elftarget.ELF_CACHE.clear()
 
 
 def test_elf_with_load_addr():
@@ -0,0 +1,59 @@
+# -*- coding:utf-8 -*-
+# This file is a part of IoT-LAB gateway_code
+# Copyright (C) 2015 INRIA (Contact: admin@iot-lab.info)
+# Contributor(s) : see AUTHORS file
+#
+# This software is governed by the CeCILL license under French law
+# and abiding by the rules of distribution of free software.  You can  use,
+# modify and/ or redistribute the software under the terms of the CeCILL
+# license as circulated by CEA, CNRS and INRIA at the following URL
+# http://www.cecill.info.
+#
+# As a counterpart to the access to the source code and  rights to copy,
+# modify and redistribute granted by the license, users are provided only
+# with a limited warranty  and the software's author,  the holder of the
+# economic rights,  and the successive licensors  have only  limited
+# liability.
+#
+# The fact that you are presently reading this means that you have had
+# knowledge of the CeCILL license and that you accept its terms.
+
+"""Fake openocd server answering on its TCL RPC port.
+
+Commands containing 'fail' return an error, all commands are logged in the
+file given as '--log' argument.
+"""
+import sys
+import socket
+
+TERMINATOR = b'\x1a'
+
+
+def main(args):  # pragma: no cover
+    """Serve TCL RPC commands on 'tcl_port' until connection is closed."""
+    port = int([arg for arg in args if arg.startswith('tcl_port')][0]
+               .split()[1])
+    log = args[args.index('--log') + 1]
+
+    server = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    server.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    server.bind(('127.0.0.1', port))
+    server.listen(1)
+    conn, _ = server.accept()
+
+    data = b''
+    while True:
+        recv = conn.recv(4096)
+        if not recv:
+            break
+        data += recv
+        while TERMINATOR in data:
+            command, data = data.split(TERMINATOR, 1)
+            with open(log, 'ab') as log_file:
+                log_file.write(command + b'\n')
+            ret = b'1' if b'fail' in command else b'0'
+            conn.sendall(ret + TERMINATOR)
+
+
+if __name__ == '__main__':  # pragma: no cover
+    main(sys.argv[1:])
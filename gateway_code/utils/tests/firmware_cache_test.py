@@ -0,0 +1,169 @@
+# -*- coding:utf-8 -*-
+
+# This file is a part of IoT-LAB gateway_code
+# Copyright (C) 2015 INRIA (Contact: admin@iot-lab.info)
+# Contributor(s) : see AUTHORS file
+#
+# This software is governed by the CeCILL license under French law
+# and abiding by the rules of distribution of free software.  You can  use,
+# modify and/ or redistribute the software under the terms of the CeCILL
+# license as circulated by CEA, CNRS and INRIA at the following URL
+# http://www.cecill.info.
+#
+# As a counterpart to the access to the source code and  rights to copy,
+# modify and redistribute granted by the license, users are provided only
+# with a limited warranty  and the software's author,  the holder of the
+# economic rights,  and the successive licensors  have only  limited
+# liability.
+#
+# The fact that you are presently reading this means that you have had
+# knowledge of the CeCILL license and that you accept its terms.
+
+
+# pylint: disable=missing-docstring
+# pylint: disable=invalid-name
+# pylint: disable=protected-access
+
+import os
+import io
+import stat
+import shutil
+import tempfile
+import unittest
+
+import mock
+
+from gateway_code.utils import firmware_cache
+
+
+class TestFirmwareCache(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.cache = firmware_cache.FirmwareCache(
+            os.path.join(self.tmp_dir, 'cache'), max_size=20)
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir)
+
+    def _firmware(self, name, content):
+        path = os.path.join(self.tmp_dir, name)
+        with open(path, 'wb') as _file:
+            _file.write(content)
+        return path
+
+    def test_add_get(self):
+        path = self._firmware('fw.elf', b'0123456789')
+        sha256 = self.cache.add(path)
+        self.assertEqual(firmware_cache.file_sha256(path), sha256)
+        self.assertIn(sha256, self.cache)
+
+        cached = self.cache.get(sha256)
+        with open(cached, 'rb') as _file:
+            self.assertEqual(b'0123456789', _file.read())
+
+        # original can be removed
+        os.remove(path)
+        self.assertEqual(cached, self.cache.get(sha256))
+
+        # Adding again does nothing
+        path = self._firmware('fw_2.elf', b'0123456789')
+        self.assertEqual(sha256, self.cache.add(path, sha256))
+
+    def test_copy_sha256(self):
+        content = b'0123456789' * firmware_cache.CHUNK_SIZE
+        dst = io.BytesIO()
+        sha256 = firmware_cache.copy_sha256(io.BytesIO(content), dst)
+        self.assertEqual(content, dst.getvalue())
+        self.assertEqual(self.cache.add(self._firmware('fw', content)),
+                         sha256)
+
+        # Rejected on first chunk, nothing written
+        def _reject(chunk):
+            self.assertEqual(firmware_cache.CHUNK_SIZE, len(chunk))
+            raise ValueError('invalid')
+
+        dst = io.BytesIO()
+        self.assertRaises(ValueError, firmware_cache.copy_sha256,
+                          io.BytesIO(content), dst, _reject)
+        self.assertEqual(b'', dst.getvalue())
+
+    def test_get_invalid(self):
+        self.assertIsNone(self.cache.get('0' * 64))
+        self.assertIsNone(self.cache.get('../../etc/passwd'))
+        self.assertNotIn('0' * 64, self.cache)
+
+    def test_lru_eviction(self):
+        sha_1 = self.cache.add(self._firmware('1', b'1' * 8))
+        sha_2 = self.cache.add(self._firmware('2', b'2' * 8))
+        # mark first as recently used
+        os.utime(self.cache.get(sha_2), (0, 0))
+        self.cache.get(sha_1)
+
+        sha_3 = self.cache.add(self._firmware('3', b'3' * 8))
+        self.assertIn(sha_1, self.cache)
+        self.assertNotIn(sha_2, self.cache)
+        self.assertIn(sha_3, self.cache)
+
+        # Bigger than cache is kept until next add
+        sha_4 = self.cache.add(self._firmware('4', b'4' * 32))
+        self.assertIn(sha_4, self.cache)
+        self.assertNotIn(sha_1, self.cache)
+        self.assertNotIn(sha_3, self.cache)
+
+    def test_private_directory(self):
+        sha256 = self.cache.add(self._firmware('fw.elf', b'0123456789'))
+        self.assertEqual(0o700,
+                         stat.S_IMODE(os.stat(self.cache.directory).st_mode))
+
+        # permissions restored
+        os.chmod(self.cache.directory, 0o777)
+        self.assertIn(sha256, self.cache)
+        self.assertEqual(0o700,
+                         stat.S_IMODE(os.stat(self.cache.directory).st_mode))
+
+    @mock.patch('gateway_code.utils.firmware_cache.LOGGER', mock.Mock())
+    def test_directory_not_owned(self):
+        sha256 = self.cache.add(self._firmware('fw.elf', b'0123456789'))
+        with mock.patch('os.getuid', return_value=os.getuid() + 1):
+            # cache disabled
+            self.assertNotIn(sha256, self.cache)
+            sha_2 = self.cache.add(self._firmware('fw_2.elf', b'2' * 8))
+        self.assertNotIn(sha_2, self.cache)
+
+        # not a directory
+        cache = firmware_cache.FirmwareCache(self._firmware('file', b''))
+        self.assertEqual(sha_2, cache.add(self._firmware('3', b'2' * 8)))
+        self.assertNotIn(sha_2, cache)
+
+    @mock.patch('gateway_code.utils.firmware_cache.LOGGER', mock.Mock())
+    def test_tampered_entry(self):
+        sha256 = self.cache.add(self._firmware('fw.elf', b'0123456789'))
+        with open(self.cache.get(sha256), 'wb') as _file:
+            _file.write(b'evil')
+        self.assertIsNone(self.cache.get(sha256))
+        self.assertFalse(os.path.exists(self.cache._path(sha256)))
+
+        # planted file replaced on add
+        with open(self.cache._path(sha256), 'wb') as _file:
+            _file.write(b'evil')
+        path = self._firmware('fw_2.elf', b'0123456789')
+        self.assertEqual(sha256, self.cache.add(path, sha256))
+        with open(self.cache.get(sha256), 'rb') as _file:
+            self.assertEqual(b'0123456789', _file.read())
+
+    def test_checked_entries_not_hashed(self):
+        sha256 = self.cache.add(self._firmware('fw.elf', b'0123456789'))
+        with mock.patch('gateway_code.utils.firmware_cache.file_sha256') \
+                as file_sha256:
+            self.assertIsNotNone(self.cache.get(sha256))
+            self.assertIsNotNone(self.cache.get(sha256))
+            self.assertFalse(file_sha256.called)
+
+        # Entries found at startup are hashed once
+        cache = firmware_cache.FirmwareCache(self.cache.directory)
+        with mock.patch('gateway_code.utils.firmware_cache.file_sha256',
+                        return_value=sha256) as file_sha256:
+            self.assertIsNotNone(cache.get(sha256))
+            self.assertIsNotNone(cache.get(sha256))
+            self.assertEqual(1, file_sha256.call_count)
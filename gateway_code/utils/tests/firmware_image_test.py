@@ -0,0 +1,93 @@
+# -*- coding: utf-8 -*-
+
+# This file is a part of IoT-LAB gateway_code
+# Copyright (C) 2015 INRIA (Contact: admin@iot-lab.info)
+# Contributor(s) : see AUTHORS file
+#
+# This software is governed by the CeCILL license under French law
+# and abiding by the rules of distribution of free software.  You can  use,
+# modify and/ or redistribute the software under the terms of the CeCILL
+# license as circulated by CEA, CNRS and INRIA at the following URL
+# http://www.cecill.info.
+#
+# As a counterpart to the access to the source code and  rights to copy,
+# modify and redistribute granted by the license, users are provided only
+# with a limited warranty  and the software's author,  the holder of the
+# economic rights,  and the successive licensors  have only  limited
+# liability.
+#
+# The fact that you are presently reading this means that you have had
+# knowledge of the CeCILL license and that you accept its terms.
+
+
+# pylint: disable=missing-docstring
+
+import binascii
+import unittest
+
+from gateway_code.config import static_path
+from .. import firmware_image
+from ..elftarget import get_elf_load_addr
+
+
+def _ihex_memory(ihex):
+    """ Return {address: byte} of Intel HEX data records """
+    memory = {}
+    upper = 0
+    for line in ihex.decode().split():
+        record = bytearray(binascii.unhexlify(line[1:]))
+        assert sum(record) & 0xff == 0
+        size, address, rec_type = (record[0], record[1] << 8 | record[2],
+                                   record[3])
+        if rec_type == firmware_image.IHEX_EXT_LINEAR_ADDR:
+            upper = record[4] << 8 | record[5]
+        elif rec_type == firmware_image.IHEX_DATA:
+            for i in range(size):
+                memory[(upper << 16) + address + i] = record[4 + i]
+    return memory
+
+
+class TestFirmwareImage(unittest.TestCase):
+
+    def test_from_elf(self):
+        elf = static_path('firefly_idle.elf')
+        image = firmware_image.FirmwareImage.from_elf(elf)
+        self.assertEqual(get_elf_load_addr(elf), image.load_addr)
+        self.assertEqual(0x00202000, image.base_addr)
+
+        # '.text' to '.flashcca' at the end of flash, ELF headers excluded
+        binary = bytearray(image.binary())
+        self.assertEqual(0x27ffd4 + 0x2c - 0x202000, len(binary))
+
+        memory = _ihex_memory(image.ihex())
+        self.assertEqual(sum(len(data) for _, data in image.sections),
+                         len(memory))
+        for address, value in memory.items():
+            self.assertEqual(binary[address - image.base_addr], value)
+
+    def test_data_load_address(self):
+        """ '.data' is stored after '.text', at its load address """
+        image = firmware_image.FirmwareImage.from_elf(
+            static_path('samr21_idle.elf'))
+        self.assertEqual(0, image.base_addr)
+        self.assertEqual(0x2050 + 140, len(image.binary()))
+
+    def test_temp_file(self):
+        image = firmware_image.FirmwareImage([(0x10, b'abcd')], entry=0x10)
+        with image.temp_file() as bin_file:
+            self.assertTrue(bin_file.name.endswith('.bin'))
+            with open(bin_file.name, 'rb') as image_file:
+                self.assertEqual(b'abcd', image_file.read())
+        with image.temp_file('ihex') as hex_file:
+            self.assertTrue(hex_file.name.endswith('.hex'))
+            with open(hex_file.name, 'rb') as image_file:
+                self.assertEqual(image.ihex(), image_file.read())
+
+    def test_empty(self):
+        image = firmware_image.FirmwareImage([(0x10, b'')])
+        self.assertEqual(b'', image.binary())
+        self.assertEqual(b':00000001FF\r\n', image.ihex())
+
+    def test_invalid_elf(self):
+        self.assertRaises(ValueError,
+                          firmware_image.FirmwareImage.from_elf, __file__)
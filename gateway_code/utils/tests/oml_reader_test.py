@@ -0,0 +1,241 @@
+# -*- coding: utf-8 -*-
+
+# This file is a part of IoT-LAB gateway_code
+# Copyright (C) 2015 INRIA (Contact: admin@iot-lab.info)
+# Contributor(s) : see AUTHORS file
+#
+# This software is governed by the CeCILL license under French law
+# and abiding by the rules of distribution of free software.  You can  use,
+# modify and/ or redistribute the software under the terms of the CeCILL
+# license as circulated by CEA, CNRS and INRIA at the following URL
+# http://www.cecill.info.
+#
+# As a counterpart to the access to the source code and  rights to copy,
+# modify and redistribute granted by the license, users are provided only
+# with a limited warranty  and the software's author,  the holder of the
+# economic rights,  and the successive licensors  have only  limited
+# liability.
+#
+# The fact that you are presently reading this means that you have had
+# knowledge of the CeCILL license and that you accept its terms.
+
+
+""" test oml_reader module """
+
+# pylint: disable=protected-access
+
+import ast
+import os
+import shutil
+import struct
+import zipfile
+import tempfile
+import unittest
+from array import array
+
+import mock
+
+from .. import oml_reader
+
+HEADER = '''protocol: 5
+domain: 1
+start-time: 1500000000
+sender-id: m3-1
+app-name: control_node_measures
+schema: 0 _experiment_metadata subject:string key:string value:string
+schema: 1 control_node_measures_consumption timestamp_s:uint32 \
+timestamp_us:uint32 power:double voltage:double current:double
+schema: 2 control_node_measures_event timestamp_s:uint32 \
+timestamp_us:uint32 value:uint32 name:string
+content: text
+
+'''
+METADATA = '0.001\t0\t1\t.\tcollector\tfile:consumption/m3-1.oml\n'
+
+
+def consumption_lines(count, start=1500000000, period=0.25):
+    """ Consumption measures lines, timestamps every `period` """
+    lines = []
+    for num in range(count):
+        timestamp = start + num * period
+        lines.append('%f\t1\t%d\t%d\t%d\t%f\t3.3\t0.1\n' % (
+            timestamp - start, num + 1, int(timestamp),
+            round((timestamp % 1) * 1e6), float(num)))
+    return lines
+
+
+def read_npy(data):
+    """ Return descr, shape and data from a '.npy' version 1.0 content """
+    assert data[:8] == b'\x93NUMPY\x01\x00'
+    size, = struct.unpack('<H', data[8:10])
+    header = ast.literal_eval(data[10:10 + size].decode('ascii'))
+    return header['descr'], header['shape'], data[10 + size:]
+
+
+class TestOmlFile(unittest.TestCase):
+    """ OmlFile reader, load and convert tests """
+
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.path = os.path.join(self.tmp_dir, 'm3-1.oml')
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir)
+
+    def _write(self, lines, header=HEADER):
+        with open(self.path, 'w') as oml:
+            oml.write(header)
+            oml.write(''.join(lines))
+
+    def _read(self, **kwargs):
+        with oml_reader.OmlFile(self.path) as oml:
+            return [(schema.name, columns)
+                    for schema, columns in oml.blocks(**kwargs)]
+
+    def test_schemas(self):
+        """ Schemas parsed from header """
+        self._write([])
+        with oml_reader.OmlFile(self.path) as oml:
+            self.assertEqual([0, 1, 2], list(oml.schemas.keys()))
+            schema = oml.schemas[1]
+            self.assertEqual('control_node_measures_consumption',
+                             schema.name)
+            self.assertEqual(('power', 'double'), schema.fields[2])
+            self.assertTrue(schema.has_timestamp)
+            self.assertFalse(oml.schemas[0].has_timestamp)
+            self.assertEqual([oml.schemas[1], oml.schemas[2]],
+                             oml.data_schemas)
+            self.assertEqual([], list(oml.blocks()))
+
+    def test_blocks(self):
+        """ Read by blocks with bounded size """
+        self._write(consumption_lines(100))
+        blocks = self._read(block_size=500)
+        self.assertTrue(len(blocks) > 5)
+
+        power = array('d')
+        for name, columns in blocks:
+            self.assertEqual('control_node_measures_consumption', name)
+            self.assertEqual(['timestamp_s', 'timestamp_us', 'power',
+                              'voltage', 'current'], list(columns.keys()))
+            self.assertEqual('I', columns['timestamp_s'].typecode)
+            power += columns['power']
+        self.assertEqual([float(num) for num in range(100)], power.tolist())
+
+        # One block
+        blocks = self._read()
+        self.assertEqual(1, len(blocks))
+        self.assertEqual([1500000024] * 4,
+                         blocks[0][1]['timestamp_s'][96:].tolist())
+        self.assertEqual([0, 250000, 500000, 750000],
+                         blocks[0][1]['timestamp_us'][96:].tolist())
+
+    def test_mixed_and_invalid_lines(self):
+        """ Metadata, events, invalid lines and partial last line """
+        lines = [METADATA]
+        lines += consumption_lines(3)
+        lines.append('1.0\t2\t1\t1500000001\t0\t1\tstart experiment\n')
+        lines.append('invalid line\n')
+        lines.append('1.0\t1\t4\t1500000001\t0\tnot_a_number\t3.3\t0.1\n')
+        lines.append('1.0\t3\t1\t1500000001\t0\t0\n')
+        lines.append('1.0\t1\t5\t1500000001\t250000\t4.0\t3.3\t0.1\n')
+        lines.append('1.0\t1\t6\t1500000001\t500000\t5.0')
+        self._write(lines)
+
+        blocks = dict(self._read())
+        self.assertEqual(['_experiment_metadata',
+                          'control_node_measures_consumption',
+                          'control_node_measures_event'],
+                         sorted(blocks.keys()))
+        self.assertEqual(['collector'],
+                         blocks['_experiment_metadata']['key'])
+        self.assertEqual(
+            [0.0, 1.0, 2.0, 4.0],
+            blocks['control_node_measures_consumption']['power'].tolist())
+        self.assertEqual(['start experiment'],
+                         blocks['control_node_measures_event']['name'])
+
+    @mock.patch('gateway_code.utils.oml_reader.BISECT_MIN', 100)
+    def test_time_range(self):
+        """ Read measures between start and end timestamps """
+        self._write([METADATA] + consumption_lines(1000))
+
+        def _read_range(start, end):
+            power = array('d')
+            for _, columns in self._read(start=start, end=end,
+                                         block_size=2000):
+                power += columns.get('power', array('d'))
+            return power.tolist()
+
+        self.assertEqual([400.0, 401.0, 402.0, 403.0],
+                         _read_range(1500000100, 1500000101))
+        self.assertEqual([998.0, 999.0], _read_range(1500000249.5, None))
+        self.assertEqual([0.0, 1.0], _read_range(None, 1500000000.5))
+        self.assertEqual([], _read_range(1500001000, None))
+        self.assertEqual(1000, len(_read_range(None, None)))
+
+        # Start found by bisection, reading stops after end
+        with oml_reader.OmlFile(self.path) as oml:
+            self.assertTrue(oml._seek(1500000200) > 700 * 40)
+            with mock.patch.object(oml, '_parse',
+                                   side_effect=oml._parse) as parse:
+                list(oml.blocks(1500000100, 1500000101, block_size=2000))
+                self.assertTrue(parse.call_count <= 3)
+
+    def test_invalid_file(self):
+        """ Files without valid header are rejected """
+        self._write([], header='')
+        self.assertRaises(ValueError, oml_reader.OmlFile, self.path)
+        self._write(['protocol: 5\n', 'content: text\n'], header='')
+        self.assertRaises(ValueError, oml_reader.OmlFile, self.path)
+
+    def test_load(self):
+        """ Load measures columns in memory """
+        self._write([METADATA] + consumption_lines(10))
+        measures = oml_reader.load(self.path, start=1500000001)
+        consumption = measures['control_node_measures_consumption']
+        self.assertEqual(list(range(4, 10)), consumption['power'].tolist())
+
+    def test_convert(self):
+        """ Convert to npz arrays per schema field """
+        lines = [METADATA] + consumption_lines(10)
+        lines.append('1.0\t2\t1\t1500000001\t0\t1\tstart\n')
+        lines.append('1.0\t2\t2\t1500000002\t0\t0\tstop\n')
+        self._write(lines)
+        output = os.path.join(self.tmp_dir, 'm3-1.npz')
+
+        ret = oml_reader.convert(self.path, output, block_size=200)
+        self.assertEqual(12, ret)
+
+        npz = zipfile.ZipFile(output)
+        prefix = 'control_node_measures_consumption.'
+        self.assertIn(prefix + 'power.npy', npz.namelist())
+        self.assertNotIn('_experiment_metadata.key.npy', npz.namelist())
+
+        descr, shape, data = read_npy(npz.read(prefix + 'power.npy'))
+        self.assertEqual((10,), shape)
+        self.assertEqual(list(range(10)), array('d', data).tolist())
+        self.assertEqual('f8', descr[1:])
+
+        descr, shape, data = read_npy(npz.read(prefix + 'timestamp_s.npy'))
+        self.assertEqual('u4', descr[1:])
+        self.assertEqual(1500000002, array('I', data)[-1])
+
+        descr, shape, data = read_npy(
+            npz.read('control_node_measures_event.name.npy'))
+        self.assertEqual(('|S5', (2,)), (descr, shape))
+        self.assertEqual(b'startstop\x00', data)
+        npz.close()
+
+    def test_convert_one_schema(self):
+        """ Arrays not prefixed with only one measurement point """
+        header = '\n'.join(HEADER.splitlines()[:7] + ['content: text', '',
+                                                      ''])
+        self._write(consumption_lines(2), header=header)
+        output = os.path.join(self.tmp_dir, 'm3-1.npz')
+
+        self.assertEqual(2, oml_reader.convert(self.path, output))
+        npz = zipfile.ZipFile(output)
+        self.assertEqual(['timestamp_s.npy', 'timestamp_us.npy', 'power.npy',
+                          'voltage.npy', 'current.npy'], npz.namelist())
+        npz.close()
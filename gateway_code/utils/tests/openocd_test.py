@@ -27,11 +27,16 @@
 # serial mock note correctly detected
 # pylint: disable=maybe-no-member
 
+import os
+import sys
 import time
+import shutil
+import tempfile
 import unittest
 import mock
 
 from gateway_code.open_nodes.node_m3 import NodeM3  # config file
+from gateway_code.tests import utils
 from gateway_code.utils.openocd import OpenOCDArgs
 from .. import openocd
 
@@ -52,6 +57,114 @@ class TestsMethods(unittest.TestCase):
         ret = self.ocd.flash(NodeM3.FW_IDLE)
         self.assertEqual(42, ret)
 
+    def test_flash_same_firmware(self, call_mock):
+        """ Flashing the last flashed firmware only verifies it """
+        call_mock.return_value = 0
+        self.assertEqual(0, self.ocd.flash(NodeM3.FW_IDLE))
+        self.assertIn('write_image', ' '.join(call_mock.call_args[1]['args']))
+
+        # Already flashed and verify OK
+        self.assertEqual(0, self.ocd.flash(NodeM3.FW_IDLE))
+        command = ' '.join(call_mock.call_args[1]['args'])
+        self.assertIn('verify_image', command)
+        self.assertNotIn('write_image', command)
+
+        # Verify fails, flash again
+        call_mock.side_effect = [1, 0]
+        self.assertEqual(0, self.ocd.flash(NodeM3.FW_IDLE))
+        self.assertIn('write_image', ' '.join(call_mock.call_args[1]['args']))
+        call_mock.side_effect = None
+
+        # Other firmware is flashed
+        call_mock.reset_mock()
+        self.assertEqual(0, self.ocd.flash(NodeM3.FW_AUTOTEST))
+        self.assertEqual(1, call_mock.call_count)
+        self.assertIn('write_image', ' '.join(call_mock.call_args[1]['args']))
+
+        # Failed flash is not remembered
+        call_mock.return_value = 1
+        self.assertEqual(1, self.ocd.flash(NodeM3.FW_IDLE))
+        call_mock.return_value = 0
+        call_mock.reset_mock()
+        self.assertEqual(0, self.ocd.flash(NodeM3.FW_IDLE))
+        self.assertEqual(1, call_mock.call_count)
+
+    @mock.patch('subprocess.Popen')
+    def test_flash_after_debug(self, _, call_mock):
+        """ Debugger may have changed firmware, flash it again """
+        call_mock.return_value = 0
+        self.ocd.flash(NodeM3.FW_IDLE)
+        self.ocd.debug_start()
+        self.ocd.debug_stop()
+
+        call_mock.reset_mock()
+        self.assertEqual(0, self.ocd.flash(NodeM3.FW_IDLE))
+        self.assertEqual(1, call_mock.call_count)
+        self.assertIn('write_image', ' '.join(call_mock.call_args[1]['args']))
+
+    def _firmware_copy(self, patches=()):
+        """ Copy of FW_IDLE with (file offset, byte) changes """
+        tmp_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, tmp_dir)
+        path = os.path.join(tmp_dir, 'firmware_%d.elf' % len(patches))
+        shutil.copy(NodeM3.FW_IDLE, path)
+        with open(path, 'r+b') as firmware:
+            for offset, value in patches:
+                firmware.seek(offset)
+                firmware.write(value)
+        return path
+
+    def test_flash_sectors(self, call_mock):
+        """ Only changed sectors are erased and written """
+        call_mock.return_value = 0
+        self.assertEqual(0, self.ocd.flash(NodeM3.FW_IDLE))
+        self.assertEqual(5, len(self.ocd._flashed_sectors))
+
+        # '.text' at file offset 0x10000, third sector changed
+        firmware = self._firmware_copy([(0x11004, b'\x42')])
+        call_mock.reset_mock()
+        self.assertEqual(0, self.ocd.flash(firmware))
+        self.assertEqual(1, call_mock.call_count)
+        command = ' '.join(call_mock.call_args[1]['args'])
+        self.assertEqual(1, command.count('write_image erase'))
+        self.assertIn('0x8001000 bin', command)
+        self.assertIn('verify_image %s' % firmware, command)
+
+        # Only '.comment' changed, nothing written
+        firmware = self._firmware_copy([(0x11004, b'\x42'),
+                                        (0xa9546, b'X')])
+        call_mock.reset_mock()
+        self.assertEqual(0, self.ocd.flash(firmware))
+        command = ' '.join(call_mock.call_args[1]['args'])
+        self.assertNotIn('write_image', command)
+        self.assertIn('verify_image %s' % firmware, command)
+
+        # Verify error, whole image flashed
+        call_mock.reset_mock()
+        call_mock.side_effect = [1, 0]
+        self.assertEqual(0, self.ocd.flash(NodeM3.FW_IDLE))
+        self.assertEqual(2, call_mock.call_count)
+        command = ' '.join(call_mock.call_args[1]['args'])
+        self.assertIn('write_image erase %s' % NodeM3.FW_IDLE, command)
+
+    def test_flash_sectors_disabled(self, call_mock):
+        call_mock.return_value = 0
+        ocd = openocd.OpenOCD.from_node(NodeM3, sector_size=None)
+        self.assertEqual(0, ocd.flash(NodeM3.FW_IDLE))
+        self.assertIsNone(ocd._flashed_sectors)
+        self.assertEqual(0, ocd.flash(NodeM3.FW_AUTOTEST))
+        command = ' '.join(call_mock.call_args[1]['args'])
+        self.assertIn('write_image erase %s' % NodeM3.FW_AUTOTEST, command)
+
+    def test_image_sectors(self, _):
+        sectors = self.ocd._image_sectors(NodeM3.FW_IDLE)
+        self.assertEqual([0x08000000 + i * 2048 for i in range(5)],
+                         sorted(sectors))
+        # '.relocate' after '.text' then erased
+        self.assertEqual(2048, len(sectors[0x08002000]))
+        self.assertEqual(b'\xff' * 8, bytes(sectors[0x08002000][-8:]))
+        self.assertIsNone(self.ocd._image_sectors(__file__))
+
     @mock.patch('gateway_code.common.abspath')
     def test_flash_binary(self, abspath_mock, call_mock):
         """ Test flash a binary firmware"""
@@ -148,6 +261,73 @@ class TestsCall(unittest.TestCase):
         self.assertEqual(ret, 0)
 
 
+class TestsServer(unittest.TestCase):
+    """ Tests openocd server mode with a fake openocd TCL server """
+    FAKE_SERVER = os.path.join(os.path.dirname(__file__),
+                               'fake_openocd_server.py')
+
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.log = os.path.join(self.tmp_dir, 'commands.log')
+        self.ocd = openocd.OpenOCD.from_node(NodeM3, server=True)
+        self.ocd.server.openocd_path = '%s %s --log %s' % (
+            sys.executable, self.FAKE_SERVER, self.log)
+
+    def tearDown(self):
+        self.ocd.server.stop()
+        shutil.rmtree(self.tmp_dir)
+
+    def _commands(self):
+        with open(self.log) as log:
+            return log.read().splitlines()
+
+    @mock.patch('gateway_code.utils.subprocess_timeout.call')
+    def test_server_commands(self, call_mock):
+        self.assertEqual(0, self.ocd.reset())
+        process = self.ocd.server.process
+        self.assertEqual(0, self.ocd.flash(NodeM3.FW_IDLE))
+
+        # same server for all commands, no one shot call
+        self.assertIs(process, self.ocd.server.process)
+        self.assertFalse(call_mock.called)
+        commands = self._commands()
+        self.assertEqual('catch {reset run}', commands[0])
+        self.assertIn('catch {flash write_image erase %s}' % NodeM3.FW_IDLE,
+                      commands)
+        self.assertNotIn('catch {shutdown}', commands)
+
+        # Error in command
+        self.assertEqual(1, self.ocd._call_cmd(' -c "fail" -c "reset run"'))
+        self.assertEqual('catch {fail}', self._commands()[-1])
+
+    @mock.patch('gateway_code.utils.subprocess_timeout.call')
+    def test_server_fallback(self, call_mock):
+        """ Server cannot be started, run one shot command """
+        call_mock.return_value = 0
+        self.ocd.server.openocd_path = 'false'
+        self.assertEqual(0, self.ocd.reset())
+        self.assertTrue(call_mock.called)
+        self.assertIsNone(self.ocd.server.process)
+
+    @mock.patch('subprocess.Popen')
+    def test_server_debug(self, _):
+        """ Debug stops server to release the probe """
+        self.assertEqual(0, self.ocd.reset())
+        self.assertIsNotNone(self.ocd.server.process)
+        self.ocd.debug_start()
+        self.assertIsNone(self.ocd.server.process)
+        self.ocd.debug_stop()
+
+    @mock.patch(utils.READ_CONFIG)
+    def test_server_mode_config(self, read_config):
+        read_config.return_value = 'yes'
+        self.assertIsNotNone(openocd.OpenOCD.from_node(NodeM3).server)
+        read_config.return_value = 'no'
+        self.assertIsNone(openocd.OpenOCD.from_node(NodeM3).server)
+        read_config.return_value = 'invalid'
+        self.assertIsNone(openocd.OpenOCD.from_node(NodeM3).server)
+
+
 class TestsFlashInvalidPaths(unittest.TestCase):
     def test_invalid_config_file_path(self):
         self.assertRaises(IOError, openocd.OpenOCD,
@@ -0,0 +1,294 @@
+# -*- coding: utf-8 -*-
+
+# This file is a part of IoT-LAB gateway_code
+# Copyright (C) 2015 INRIA (Contact: admin@iot-lab.info)
+# Contributor(s) : see AUTHORS file
+#
+# This software is governed by the CeCILL license under French law
+# and abiding by the rules of distribution of free software.  You can  use,
+# modify and/ or redistribute the software under the terms of the CeCILL
+# license as circulated by CEA, CNRS and INRIA at the following URL
+# http://www.cecill.info.
+#
+# As a counterpart to the access to the source code and  rights to copy,
+# modify and redistribute granted by the license, users are provided only
+# with a limited warranty  and the software's author,  the holder of the
+# economic rights,  and the successive licensors  have only  limited
+# liability.
+#
+# The fact that you are presently reading this means that you have had
+# knowledge of the CeCILL license and that you accept its terms.
+
+
+""" test sniffer_relay module """
+
+# pylint: disable=protected-access
+
+import os
+import time
+import shutil
+import socket
+import struct
+import tempfile
+import unittest
+
+import mock
+
+from .. import sniffer_relay
+
+NTP_S = 1500000000 + sniffer_relay.JAN_1970
+
+
+def zep_frame(channel, payload, crc_mode=True, seqno=1):
+    """ ZEP frame with `payload` followed by its FCS """
+    fcs = sniffer_relay.fcs(payload)
+    payload = payload + struct.pack('<H', fcs)
+    header = sniffer_relay.ZEP_HEADER.pack(
+        b'EX', 2, 1, channel, 0x1234, int(crc_mode), 0xff,
+        NTP_S, 1 << 31, seqno, len(payload))
+    return header + payload
+
+
+def pcapng_blocks(path):
+    """ Return pcapng file blocks types and bodies """
+    with open(path, 'rb') as pcap:
+        data = pcap.read()
+    blocks = []
+    index = 0
+    while index < len(data):
+        block_type, length = struct.unpack_from('<II', data, index)
+        blocks.append((block_type, data[index + 8:index + length - 4]))
+        index += length
+    return blocks
+
+
+def wait_for(condition, timeout=5.0):
+    """ Wait until `condition()` is True """
+    t_end = time.time() + timeout
+    while not condition() and time.time() < t_end:
+        time.sleep(0.01)
+    return condition()
+
+
+class TestZepFrames(unittest.TestCase):
+    """ Frames decoding tests """
+
+    def test_split_frames(self):
+        """ Test splitting frames with incomplete and garbage data """
+        frame_1 = zep_frame(11, b'\x41\x88\x01')
+        frame_2 = zep_frame(26, b'')
+        data = bytearray(frame_1 + b'\x00' + frame_2 + frame_1[:20])
+
+        frames, index, skipped = sniffer_relay.split_frames(data)
+        self.assertEqual([frame_1, frame_2], [f.tobytes() for f in frames])
+        self.assertEqual(len(data) - 20, index)
+        self.assertEqual(1, skipped)
+
+        # Incomplete header
+        frames, index, skipped = sniffer_relay.split_frames(data, 10)
+        self.assertEqual([], frames)
+        self.assertEqual((0, 0), (index, skipped))
+
+        # No preamble, keep the last byte
+        frames, index, skipped = sniffer_relay.split_frames(bytearray(b'aaE'))
+        self.assertEqual([], frames)
+        self.assertEqual((2, 2), (index, skipped))
+
+    def test_zep_header(self):
+        """ Test decoding frame header """
+        frame = memoryview(zep_frame(15, b'\x41\x88'))
+        header = sniffer_relay.zep_header(frame)
+        self.assertEqual(15, header.channel)
+        self.assertEqual(4, header.length)
+        self.assertEqual(1500000000500000, sniffer_relay.zep_timestamp(header))
+
+    def test_fcs_valid(self):
+        """ Test checking frame check sequence """
+        payload = zep_frame(11, b'\x41\x88\x01')[32:]
+        self.assertTrue(sniffer_relay.fcs_valid(payload))
+        self.assertFalse(sniffer_relay.fcs_valid(b'\x00' + payload[1:]))
+        self.assertFalse(sniffer_relay.fcs_valid(b'\x00'))
+
+
+class TestPcapngWriter(unittest.TestCase):
+    """ PcapngWriter tests """
+
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.path = os.path.join(self.tmp_dir, 'm3-1.pcapng')
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir)
+
+    def test_write(self):
+        """ Test writing packets """
+        writer = sniffer_relay.PcapngWriter(self.path)
+        writer.close()
+        self.assertFalse(os.path.exists(self.path))
+
+        writer.write(0x100000002, memoryview(b'\x41\x88\x01'))
+        writer.write(3, b'\x41\x88\x01\x02')
+        writer.write(4, b'\x41\x88', sniffer_relay.PCAP_NOFCS)
+        writer.close()
+
+        blocks = pcapng_blocks(self.path)
+        self.assertEqual([0x0A0D0D0A, 1, 1, 6, 6, 6], [b[0] for b in blocks])
+        # One interface with FCS, one without
+        self.assertEqual(195, struct.unpack_from('<H', blocks[1][1])[0])
+        self.assertEqual(230, struct.unpack_from('<H', blocks[2][1])[0])
+        self.assertEqual((0, 1, 2, 3, 3),
+                         struct.unpack_from('<IIIII', blocks[3][1]))
+        self.assertEqual(b'\x41\x88\x01\x00', blocks[3][1][20:])
+        self.assertEqual(b'\x41\x88\x01\x02', blocks[4][1][20:])
+        self.assertEqual((1, 0, 4, 2, 2),
+                         struct.unpack_from('<IIIII', blocks[5][1]))
+
+    def test_rotate(self):
+        """ Test rotating files when reaching max size """
+        # Headers and two packets of 4 bytes
+        writer = sniffer_relay.PcapngWriter(self.path, 68 + 2 * 36)
+        for timestamp in range(5):
+            writer.write(timestamp, b'\x41\x88\x01\x02')
+        writer.close()
+
+        paths = [self.path, os.path.join(self.tmp_dir, 'm3-1.1.pcapng'),
+                 os.path.join(self.tmp_dir, 'm3-1.2.pcapng')]
+        self.assertEqual(paths, writer.paths)
+        self.assertEqual([5, 5, 4], [len(pcapng_blocks(path))
+                                     for path in paths])
+
+    @mock.patch('gateway_code.utils.sniffer_relay.LOGGER')
+    def test_max_files(self, logger):
+        """ Test packets dropped after max files """
+        writer = sniffer_relay.PcapngWriter(self.path, 68 + 2 * 36, 2)
+        for timestamp in range(6):
+            writer.write(timestamp, b'\x41\x88\x01\x02')
+        writer.close()
+
+        self.assertEqual(2, len(writer.paths))
+        self.assertEqual(2, writer.dropped)
+        self.assertEqual(1, logger.warning.call_count)
+        self.assertEqual([5, 5], [len(pcapng_blocks(path))
+                                  for path in writer.paths])
+
+
+class TestSnifferRelay(unittest.TestCase):
+    """ SnifferRelay tests """
+
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.pcap = os.path.join(self.tmp_dir, 'm3-1.pcapng')
+        self.upstream = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        self.upstream.bind(('127.0.0.1', 0))
+        self.upstream.listen(1)
+        self.upstream.settimeout(5.0)
+        self.relay = sniffer_relay.SnifferRelay(
+            0, self.upstream.getsockname()[1], self.pcap, host='127.0.0.1')
+        self.clients = []
+
+    def tearDown(self):
+        self.relay.stop()
+        for client in self.clients:
+            client.close()
+        self.upstream.close()
+        shutil.rmtree(self.tmp_dir)
+
+    def _client(self):
+        """ Connect a new client """
+        client = socket.create_connection(('127.0.0.1', self.relay.port), 5)
+        self.clients.append(client)
+        return client
+
+    @staticmethod
+    def _recv(client, size):
+        """ Receive `size` bytes """
+        data = b''
+        while len(data) < size:
+            chunk = client.recv(size - len(data))
+            if not chunk:
+                break
+            data += chunk
+        return data
+
+    def test_relay(self):
+        """ Test relaying frames to several clients """
+        self.assertEqual(0, self.relay.start())
+        self.assertEqual(0, self.relay.start())
+        upstream, _ = self.upstream.accept()
+        clients = [self._client(), self._client()]
+        self.assertTrue(wait_for(lambda: self.relay.stats()['clients'] == 2))
+
+        frames = [zep_frame(11, b'\x41\x88\x01', seqno=1),
+                  zep_frame(11, b'\x41\x88\x02', seqno=2),
+                  zep_frame(26, b'\x41\x88\x03', seqno=3),
+                  zep_frame(26, b'\x41\x88\x04', False, seqno=4)]
+        # Invalid crc
+        frames[1] = frames[1][:-1] + b'\x00'
+        data = b'\x00'.join(frames)
+        # Frame split between two reads
+        upstream.sendall(data[:40])
+        time.sleep(0.1)
+        upstream.sendall(data[40:])
+
+        expected = b''.join(frames)
+        for client in clients:
+            self.assertEqual(expected, self._recv(client, len(expected)))
+
+        # Client disconnection
+        clients[0].close()
+        self.assertTrue(wait_for(lambda: self.relay.stats()['clients'] == 1))
+
+        upstream.close()
+        self.assertEqual(0, self.relay.stop())
+        self.assertEqual(0, self.relay.stop())
+        stats = self.relay.stats()
+        self.assertEqual({11: {'packets': 2, 'crc_errors': 1},
+                          26: {'packets': 2, 'crc_errors': 0}},
+                         stats['channels'])
+        self.assertEqual((0, 0, 3, 0),
+                         (stats['clients'], stats['dropped'],
+                          stats['skipped'], stats['pcap_dropped']))
+        self.assertTrue(1 <= stats['queue_high_water'] <= 4)
+        packets = pcapng_blocks(self.pcap)[3:]
+        self.assertEqual(4, len(packets))
+        # LQI mode frame, without LQI values, on the no FCS interface
+        self.assertEqual((1, 3), struct.unpack_from('<I8xI', packets[3][1]))
+        self.assertEqual(b'\x41\x88\x04\x00', packets[3][1][20:])
+
+    @mock.patch('gateway_code.utils.sniffer_relay.RECONNECT_DELAY', 0.01)
+    def test_reconnect(self):
+        """ Test reconnecting to upstream """
+        self.assertEqual(0, self.relay.start())
+        client = self._client()
+        upstream, _ = self.upstream.accept()
+        # Incomplete frame is dropped on disconnection
+        upstream.sendall(zep_frame(11, b'\x41\x88\x01')[:20])
+        upstream.close()
+
+        upstream, _ = self.upstream.accept()
+        frame = zep_frame(12, b'\x41\x88\x01')
+        upstream.sendall(frame)
+        self.assertEqual(frame, self._recv(client, len(frame)))
+        upstream.close()
+
+    @mock.patch('gateway_code.utils.sniffer_relay.CLIENT_QUEUE_SIZE', 2)
+    def test_slow_client(self):
+        """ Test frames are dropped for a slow client """
+        relay = sniffer_relay.SnifferRelay()
+        client = sniffer_relay._Client(('127.0.0.1', 1234))
+        relay._clients[mock.Mock()] = client
+
+        frame = bytearray(zep_frame(11, b'\x41\x88\x01'))
+        frames, _, _ = sniffer_relay.split_frames(frame * 3)
+        relay._relay(frames)
+        self.assertEqual(2, len(client.pending))
+        self.assertEqual(1, client.dropped)
+        self.assertEqual(1, relay.stats()['dropped'])
+        self.assertEqual(2, relay.stats()['queue_high_water'])
+
+    def test_listen_error(self):
+        """ Test start when port is already used """
+        relay = sniffer_relay.SnifferRelay(self.upstream.getsockname()[1],
+                                           host='127.0.0.1')
+        self.assertEqual(1, relay.start())
+        self.assertEqual(0, relay.stop())